@@ -4,6 +4,9 @@ from __future__ import division, absolute_import
 from .version import __version__
 from .workflow import Workflow
 from .task import Task
+from .history import NoHistory, StateHistory, RingHistory, FullHistory
+from .ids import UuidAllocator, SequentialAllocator
+from .archive import WorkflowArchive
 from .exceptions import WorkflowException
 
 import inspect
@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+from __future__ import division, absolute_import
+from builtins import object
+# Copyright (C) 2007 Samuel Abels
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA
+# 02110-1301  USA
+from collections import namedtuple
+
+#: A finished task on the path that an archived workflow took.
+ArchivedTask = namedtuple('ArchivedTask',
+                          ['task_spec_name', 'state', 'last_state_change'])
+
+
+class WorkflowArchive(object):
+
+    """
+    The summary of a completed workflow, as returned by
+    :meth:`SpiffWorkflow.Workflow.archive`. It holds the path that the
+    workflow took, and the final workflow data, but none of the tasks.
+
+    An archive can not be modified.
+    """
+    __slots__ = ('_spec_name', '_success', '_path', '_data')
+
+    def __init__(self, spec_name, success, path, data):
+        """
+        Constructor.
+
+        :type  spec_name: str
+        :param spec_name: The name of the workflow spec.
+        :type  success: bool
+        :param success: Whether the workflow succeeded.
+        :type  path: list(ArchivedTask)
+        :param path: The finished tasks, in the order of a tree walk.
+        :type  data: dict
+        :param data: The final data of the workflow.
+        """
+        self._spec_name = spec_name
+        self._success = success
+        self._path = tuple(ArchivedTask(*task) for task in path)
+        self._data = dict(data)
+
+    @property
+    def spec_name(self):
+        return self._spec_name
+
+    @property
+    def success(self):
+        return self._success
+
+    @property
+    def path(self):
+        return self._path
+
+    @property
+    def data(self):
+        return dict(self._data)
+
+    def get_data(self, name, default=None):
+        """
+        Returns the value of the data field with the given name, or the given
+        default value if the data field does not exist.
+
+        :type  name: str
+        :param name: A data field name.
+        :type  default: obj
+        :param default: Return this value if the data field does not exist.
+        :rtype:  obj
+        :returns: The value of the data field.
+        """
+        return self._data.get(name, default)
+
+    def __getstate__(self):
+        return (self._spec_name, self._success, self._path, self._data)
+
+    def __setstate__(self, state):
+        self._spec_name, self._success, self._path, self._data = state
+
+    def serialize(self, serializer, **kwargs):
+        """
+        Serializes the archive using the provided serializer.
+
+        :type  serializer: :class:`SpiffWorkflow.serializer.base.Serializer`
+        :param serializer: The serializer to use.
+        :type  kwargs: dict
+        :param kwargs: Passed to the serializer.
+        :rtype:  object
+        :returns: The serialized archive.
+        """
+        return serializer.serialize_workflow_archive(self, **kwargs)
+
+    @classmethod
+    def deserialize(cls, serializer, s_state, **kwargs):
+        """
+        Deserializes an archive using the provided serializer.
+
+        :type  serializer: :class:`SpiffWorkflow.serializer.base.Serializer`
+        :param serializer: The serializer to use.
+        :type  s_state: object
+        :param s_state: The serialized archive.
+        :type  kwargs: dict
+        :param kwargs: Passed to the serializer.
+        :rtype:  WorkflowArchive
+        :returns: The archive.
+        """
+        return serializer.deserialize_workflow_archive(s_state, **kwargs)
@@ -42,7 +42,7 @@ class BpmnScriptEngine(object):
         if isinstance(expression, Operator):
             return expression._matches(task)
         else:
-            return self._eval(task, expression, **task.data)
+            return self._eval(task, expression, **task._peek_data())
 
     def execute(self, task, script, **kwargs):
         """
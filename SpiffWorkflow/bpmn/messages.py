@@ -0,0 +1,190 @@
+# -*- coding: utf-8 -*-
+from __future__ import division, absolute_import
+from builtins import object
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA
+# 02110-1301  USA
+from threading import Lock
+
+
+class MessageRouter(object):
+
+    """
+    Delivers messages to many workflow instances, such that only the
+    instances with a matching WAITING catch event are touched. These are
+    intermediate and boundary events with a MessageEventDefinition, and
+    custom specs that accept any message.
+
+    Each catcher is indexed by the name of its message and by a correlation
+    key. The key is taken from a data field of the waiting task; if the task
+    does not have it, e.g. because the workflow was restored by the
+    CompactWorkflowSerializer, the key that was given when registering the
+    instance is used instead. A catcher without a key accepts the message
+    whatever the key it was sent with.
+    """
+
+    def __init__(self, correlation_field=None):
+        """
+        Constructor.
+
+        :type  correlation_field: str
+        :param correlation_field: The name of the task data field that holds
+                                  the correlation key of a catcher.
+        """
+        self.correlation_field = correlation_field
+        self._lock = Lock()
+        # The instances by (message, correlation key), where a message of
+        # None stands for any message, and the reverse.
+        self._subscribers = {}
+        self._subscriptions = {}
+        self._correlations = {}
+        self._workflows = {}
+
+    def __len__(self):
+        return len(self._subscriptions)
+
+    def _get_correlation(self, task, default):
+        if self.correlation_field is None:
+            return default
+        correlation = task._peek_data().get(self.correlation_field)
+        if correlation is None:
+            return default
+        return correlation
+
+    def register(self, key, workflow, correlation=None):
+        """
+        Indexes the WAITING message catchers of the given workflow,
+        replacing whatever was indexed for the instance before. Read only
+        workflows may be registered; messages for them are delivered to the
+        workflow returned by the load function passed to :meth:`deliver`.
+
+        :type  key: str
+        :param key: The key of the workflow instance.
+        :type  workflow: SpiffWorkflow.bpmn.workflow.BpmnWorkflow
+        :param workflow: The workflow.
+        :type  correlation: object
+        :param correlation: The correlation key of catchers whose task data
+                            does not provide one.
+        :rtype:  int
+        :returns: The number of (message, correlation key) subscriptions.
+        """
+        return self._register(key, workflow, correlation,
+                              not workflow.read_only)
+
+    def _register(self, key, workflow, correlation, keep):
+        subscriptions = set()
+        for message, tasks in workflow._message_subscribers.items():
+            for task in tasks:
+                subscriptions.add(
+                    (message, self._get_correlation(task, correlation)))
+        with self._lock:
+            self._unregister(key)
+            if not subscriptions:
+                return 0
+            self._subscriptions[key] = subscriptions
+            for subscription in subscriptions:
+                self._subscribers.setdefault(subscription, set()).add(key)
+            if correlation is not None:
+                self._correlations[key] = correlation
+            if keep:
+                self._workflows[key] = workflow
+        return len(subscriptions)
+
+    def unregister(self, key):
+        """
+        Forgets the given instance.
+
+        :type  key: str
+        :param key: The key of the workflow instance.
+        """
+        with self._lock:
+            self._unregister(key)
+
+    def _unregister(self, key):
+        for subscription in self._subscriptions.pop(key, ()):
+            subscribers = self._subscribers[subscription]
+            subscribers.discard(key)
+            if not subscribers:
+                del self._subscribers[subscription]
+        self._correlations.pop(key, None)
+        self._workflows.pop(key, None)
+
+    def get_subscribers(self, message, correlation=None):
+        """
+        Returns the instances that accept the given message.
+
+        :type  message: str
+        :param message: The name of the message.
+        :type  correlation: object
+        :param correlation: The correlation key of the message, if any.
+        :rtype:  list(str)
+        :returns: The keys of the instances, sorted.
+        """
+        subscriptions = set([(message, None), (None, None)])
+        if correlation is not None:
+            subscriptions.add((message, correlation))
+            subscriptions.add((None, correlation))
+        keys = set()
+        with self._lock:
+            for subscription in subscriptions:
+                keys.update(self._subscribers.get(subscription, ()))
+        return sorted(keys)
+
+    def deliver(self, message, correlation=None, load=None):
+        """
+        Passes the given message to
+        :meth:`SpiffWorkflow.bpmn.workflow.BpmnWorkflow.accept_message` of
+        each instance that accepts it, such that only the catchers whose
+        correlation key matches receive it, and registers the instances
+        again.
+        The caller should then save the returned workflows.
+
+        :type  message: str
+        :param message: The name of the message.
+        :type  correlation: object
+        :param correlation: The correlation key of the message, if any.
+        :type  load: callable
+        :param load: Returns the writable BpmnWorkflow of the given key, or
+                     None if the instance no longer exists. By default, the
+                     registered workflows are used. The router does not
+                     keep the loaded workflows.
+        :rtype:  list((str, BpmnWorkflow))
+        :returns: The keys and workflows of the instances.
+        """
+        keys = self.get_subscribers(message, correlation)
+        if load is None:
+            for key in keys:
+                if key not in self._workflows:
+                    raise ValueError('instance %s was registered read only,'
+                                     ' and needs a load function' % key)
+
+        delivered = []
+        for key in keys:
+            # A workflow that the caller registered is replaced by the one
+            # that was loaded, if any.
+            keep = key in self._workflows
+            if load is not None:
+                workflow = load(key)
+            else:
+                workflow = self._workflows[key]
+            if workflow is None:
+                self.unregister(key)
+                continue
+            default = self._correlations.get(key)
+            workflow.accept_message(
+                message, correlation,
+                lambda task: self._get_correlation(task, default))
+            self._register(key, workflow, default, keep)
+            delivered.append((key, workflow))
+        return delivered
@@ -201,7 +201,8 @@ class _BpmnProcessSpecState(object):
             return
         task._set_state(Task.COMPLETED)
 
-        task.children = []
+        for child in task.children[:]:
+            task._remove_child(child)
         for task_spec in target_children_specs:
             task._add_child(task_spec)
 
@@ -220,16 +221,16 @@ class _BpmnProcessSpecState(object):
 
         # Create the children (these are the tasks that follow the subworkflow,
         # on completion:
-        my_task.children = []
+        for child in my_task.children[:]:
+            my_task._remove_child(child)
         my_task._sync_children(my_task.task_spec.outputs, Task.FUTURE)
         for t in my_task.children:
             t.task_spec._predict(t)
 
         # Integrate the tree of the subworkflow into the tree of this workflow.
-        for child in subworkflow.task_tree.children:
-            if child.task_spec in target_children_specs:
-                my_task.children.insert(0, child)
-                child.parent = my_task
+        my_task._graft(subworkflow,
+                       [child for child in subworkflow.task_tree.children
+                        if child.task_spec in target_children_specs])
 
         my_task._set_internal_data(subworkflow=subworkflow)
 
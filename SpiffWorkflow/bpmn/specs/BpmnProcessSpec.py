@@ -29,6 +29,10 @@ LOG = logging.getLogger(__name__)
 
 class _EndJoin(UnstructuredJoin):
 
+    def _get_wakeup_keys(self, my_task):
+        # The EndJoin waits for everyone!
+        return None
+
     def _check_threshold_unstructured(self, my_task, force=False):
         # Look at the tree to find all ready and waiting tasks (excluding
         # ourself). The EndJoin waits for everyone!
@@ -60,7 +64,7 @@ class _EndJoin(UnstructuredJoin):
 
     def _on_complete_hook(self, my_task):
         super(_EndJoin, self)._on_complete_hook(my_task)
-        my_task.workflow.data.update(my_task.data)
+        my_task.workflow.data.update(my_task._peek_data())
 
 
 class BpmnProcessSpec(WorkflowSpec):
@@ -83,6 +87,85 @@ class BpmnProcessSpec(WorkflowSpec):
         end.follow(self.end)
         self.svg = svg
         self.description = description
+        self._spec_bits = None
+        self._paths_to = {}
+        self._engine_specs = {}
+
+    def __setstate__(self, state):
+        # Pickles of older versions lack the caches.
+        self._spec_bits = None
+        self._paths_to = {}
+        self._engine_specs = {}
+        self.__dict__.update(state)
+
+    def _get_spec_bit(self, task_spec):
+        """
+        Returns the bit that represents the given task spec in the bitsets
+        returned by _get_paths_to(), or 0 if the task spec is not part of
+        this process.
+        """
+        if self._spec_bits is None:
+            self._spec_bits = dict(
+                (spec, 1 << n)
+                for n, spec in enumerate(self.task_specs.values()))
+        return self._spec_bits.get(task_spec, 0)
+
+    def _get_paths_to(self, task_spec):
+        """
+        Returns a dictionary that maps each input of the given task spec to
+        a bitset of the task specs from which that input can be reached
+        without passing the given task spec. The result is computed once
+        and then cached, so the process must be complete when this is
+        first called.
+
+        A task spec A therefore has a path to the given task spec that does
+        not use the sequence flows from a set of inputs S, if the bit of A
+        is set in the bitset of any input that is not in S.
+
+        :type  task_spec: TaskSpec
+        :param task_spec: The task spec in question.
+        :rtype:  dict(TaskSpec, int)
+        :returns: The bitsets, by input.
+        """
+        paths = self._paths_to.get(task_spec)
+        if paths is not None:
+            return paths
+        paths = {}
+        for input_spec in task_spec.inputs:
+            if input_spec == task_spec:
+                continue
+            reached = set([input_spec])
+            stack = [input_spec]
+            while stack:
+                for predecessor in stack.pop().inputs:
+                    if predecessor == task_spec or predecessor in reached:
+                        continue
+                    reached.add(predecessor)
+                    stack.append(predecessor)
+            bits = 0
+            for spec in reached:
+                bits |= self._get_spec_bit(spec)
+            paths[input_spec] = bits
+        self._paths_to[task_spec] = paths
+        return paths
+
+    def _is_engine_spec(self, task_spec):
+        """
+        Returns True if the engine completes the tasks of the given task
+        spec by itself (see BpmnWorkflow.do_engine_steps()), False if they
+        wait for a user. The answer is cached per task spec.
+
+        :type  task_spec: TaskSpec
+        :param task_spec: The task spec in question.
+        :rtype:  bool
+        :returns: Whether the task spec is an engine task spec.
+        """
+        is_engine = self._engine_specs.get(task_spec)
+        if is_engine is None:
+            is_engine = (not hasattr(task_spec, 'is_engine_task') or
+                         task_spec.is_engine_task())
+            self._engine_specs[task_spec] = is_engine
+        return is_engine
 
     def get_all_lanes(self):
         """
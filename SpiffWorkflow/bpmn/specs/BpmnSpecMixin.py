@@ -144,6 +144,18 @@ class BpmnSpecMixin(TaskSpec):
         """
         return False
 
+    def _get_subscribed_messages(self, my_task):
+        """
+        Returns the messages that the given WAITING task may accept, so that
+        BpmnWorkflow.accept_message() only offers those to it. None stands
+        for any message, which is what a subclass that overrides
+        accept_message() gets by default.
+        """
+        if (getattr(self.accept_message, '__func__', None) is
+                BpmnSpecMixin.__dict__['accept_message']):
+            return []
+        return None
+
     # Hooks for Custom BPMN tasks ##########
 
     def entering_waiting_state(self, my_task):
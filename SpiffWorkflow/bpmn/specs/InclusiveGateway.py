@@ -16,8 +16,6 @@ from __future__ import division
 # License along with this library; if not, write to the Free Software
 # Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA
 # 02110-1301  USA
-from collections import deque
-
 import logging
 from ...task import Task
 from .UnstructuredJoin import UnstructuredJoin
@@ -65,11 +63,31 @@ class InclusiveGateway(UnstructuredJoin):
     specified, the Inclusive Gateway throws an exception.
     """
 
+    def _get_wakeup_keys(self, my_task):
+        # Any task that may still reach us can change the outcome.
+        return None
+
     def _check_threshold_unstructured(self, my_task, force=False):
+        inputs_with_tokens, waiting_tasks = self._get_inputs_with_tokens(
+            my_task)
 
-        # Look at the tree to find all ready and waiting tasks (excluding ones
-        # that are our completed inputs).
-        tasks = []
+        # We have to wait for every task that has a path to one of our
+        # inputs without a token, but none to an input with a token. Which
+        # specs those are is looked up in the reachability bitsets of the
+        # process.
+        paths = self._wf_spec._get_paths_to(self)
+        reaches_with_tokens = 0
+        reaches_without_tokens = 0
+        for input_spec, bits in paths.items():
+            if input_spec in inputs_with_tokens:
+                reaches_with_tokens |= bits
+            else:
+                reaches_without_tokens |= bits
+        waited_for = reaches_without_tokens & ~reaches_with_tokens
+
+        # Look at the ready and waiting tasks (excluding the instances of
+        # this gateway). The workflow keeps them indexed by state.
+        waiting_tasks = []
         for task in my_task.workflow.get_tasks(Task.READY | Task.WAITING):
             if task.thread_id != my_task.thread_id:
                 continue
@@ -77,42 +95,7 @@ class InclusiveGateway(UnstructuredJoin):
                 continue
             if task.task_spec == my_task.task_spec:
                 continue
-            tasks.append(task)
-
-        inputs_with_tokens, waiting_tasks = self._get_inputs_with_tokens(
-            my_task)
-        inputs_without_tokens = [
-            i for i in self.inputs if i not in inputs_with_tokens]
-
-        waiting_tasks = []
-        for task in tasks:
-            if (self._has_directed_path_to(
-                    task, self,
-                    without_using_sequence_flow_from=inputs_with_tokens) and
-                not self._has_directed_path_to(
-                    task, self,
-                    without_using_sequence_flow_from=inputs_without_tokens)):
+            if self._wf_spec._get_spec_bit(task.task_spec) & waited_for:
                 waiting_tasks.append(task)
 
         return force or len(waiting_tasks) == 0, waiting_tasks
-
-    def _has_directed_path_to(self, task, task_spec,
-                              without_using_sequence_flow_from=None):
-        q = deque()
-        done = set()
-
-        without_using_sequence_flow_from = set(
-            without_using_sequence_flow_from or [])
-
-        q.append(task.task_spec)
-        while q:
-            n = q.popleft()
-            if n == task_spec:
-                return True
-            for child in n.outputs:
-                if child not in done and not (
-                        n in without_using_sequence_flow_from and
-                        child == task_spec):
-                    done.add(child)
-                    q.append(child)
-        return False
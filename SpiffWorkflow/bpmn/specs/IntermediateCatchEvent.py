@@ -51,9 +51,18 @@ class IntermediateCatchEvent(Simple, BpmnSpecMixin):
                 if not my_task.workflow._is_busy_with_restore():
                     self.entering_waiting_state(my_task)
 
+    def _get_wakeup_keys(self, my_task):
+        return self.event_definition._get_wakeup_keys(my_task)
+
     def _on_ready_hook(self, my_task):
         self._predict(my_task)
 
+    def _get_subscribed_messages(self, my_task):
+        if (getattr(self.accept_message, '__func__', None) is not
+                IntermediateCatchEvent.__dict__['accept_message']):
+            return None
+        return self.event_definition._get_subscribed_messages(my_task)
+
     def accept_message(self, my_task, message):
         if (my_task.state == Task.WAITING and
                 self.event_definition._accept_message(my_task, message)):
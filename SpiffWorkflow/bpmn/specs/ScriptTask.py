@@ -17,6 +17,9 @@ from __future__ import division
 # Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA
 # 02110-1301  USA
 import logging
+from builtins import object
+from copy import deepcopy
+from functools import partial
 
 from .BpmnSpecMixin import BpmnSpecMixin
 from ...task import Task
@@ -26,10 +29,50 @@ from ...exceptions import WorkflowTaskExecException
 LOG = logging.getLogger(__name__)
 
 
+class _DetachedTask(object):
+
+    """
+    Stands in for the task of a parallel safe script, such that the script
+    may read and set data fields on another thread or process.
+    """
+
+    def __init__(self, data):
+        self.data = data
+
+    def _peek_data(self):
+        return self.data
+
+    def get_data(self, name, default=None):
+        return self.data.get(name, default)
+
+    def set_data(self, **kwargs):
+        self.data.update(kwargs)
+
+
+def _execute_detached(script_engine, script, data):
+    # Returns the data fields that the script set or changed, and the names
+    # of those it deleted.
+    original = deepcopy(data)
+    task = _DetachedTask(data)
+    script_engine.execute(task, script, **data)
+    changed = dict((name, value) for name, value in task.data.items()
+                   if name not in original or original[name] != value)
+    deleted = [name for name in original if name not in task.data]
+    return changed, deleted
+
+
 class ScriptTask(Simple, BpmnSpecMixin):
 
     """
     Task Spec for a bpmn:scriptTask node.
+
+    Script tasks are not parallel safe by default. If they are made so,
+    the script runs against a stand-in for the task that only provides
+    the data fields, copied when the task became READY, and the
+    get_data() and set_data() methods. When the task completes, the data
+    fields that the script set, changed or deleted are updated on the
+    task; other fields keep what was written to the task meanwhile. For a
+    process pool, the script engine and the data must be picklable.
     """
 
     def __init__(self, wf_spec, name, script, **kwargs):
@@ -46,7 +89,7 @@ class ScriptTask(Simple, BpmnSpecMixin):
             return
         assert not task.workflow.read_only
         try:
-            task.workflow.script_engine.execute(task, self.script, **task.data)
+            self._run_work(task)
         except Exception:
             LOG.error('Error executing ScriptTask; task=%r',
                       task, exc_info=True)
@@ -57,3 +100,21 @@ class ScriptTask(Simple, BpmnSpecMixin):
             raise WorkflowTaskExecException(
                 task, 'Error during script execution')
         super(ScriptTask, self)._on_complete_hook(task)
+
+    def _get_work(self, task):
+        script_engine = task.workflow.script_engine
+        if not self.parallel_safe:
+            # The work runs on the engine thread, against the task itself.
+            return partial(script_engine.execute, task, self.script,
+                           **task.data)
+        return partial(_execute_detached, script_engine, self.script,
+                       deepcopy(task._peek_data()))
+
+    def _set_work_result(self, task, result):
+        # A script that ran against the task itself returns nothing.
+        if result is None:
+            return
+        changed, deleted = result
+        task.set_data(**changed)
+        for name in deleted:
+            task.data.pop(name, None)
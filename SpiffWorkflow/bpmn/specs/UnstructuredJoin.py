@@ -33,19 +33,24 @@ class UnstructuredJoin(Join, BpmnSpecMixin):
     def _check_threshold_unstructured(self, my_task, force=False):
         raise NotImplementedError("Please implement this in the subclass")
 
+    def _get_unfinished_instances(self, my_task):
+        # The workflow keeps the unfinished tasks of each spec and thread
+        # indexed, so only the instances that may hold a token are looked
+        # at, no matter how long the workflow has been running.
+        tasks = my_task.workflow._get_tasks_from_spec(
+            self, my_task.thread_id, Task.NOT_FINISHED_MASK)
+        return [task for task in tasks if task.workflow == my_task.workflow]
+
+    def _get_inspected_specs(self):
+        # Only unfinished instances are ever looked at, but the split is
+        # looked up among the ancestors.
+        if not self.split_task:
+            return []
+        return [self._wf_spec.get_task_spec_from_name(self.split_task)]
+
     def _get_inputs_with_tokens(self, my_task):
-        # Look at the tree to find all places where this task is used.
-        tasks = []
-        for task in my_task.workflow.task_tree:
-            if task.thread_id != my_task.thread_id:
-                continue
-            if task.workflow != my_task.workflow:
-                continue
-            if task.task_spec != self:
-                continue
-            if task._is_finished():
-                continue
-            tasks.append(task)
+        # Look up all unfinished places where this task is used.
+        tasks = self._get_unfinished_instances(my_task)
 
         # Look up which tasks have parent's completed.
         waiting_tasks = []
@@ -79,34 +84,30 @@ class UnstructuredJoin(Join, BpmnSpecMixin):
         #
         # We are looking for all task instances that must be joined.
         # We limit our search by starting at the split point.
+        split_task = None
         if self.split_task:
             split_task = my_task.workflow.get_task_spec_from_name(
                 self.split_task)
             split_task = my_task._find_ancestor(split_task)
-        else:
-            split_task = my_task.workflow.task_tree
 
         # Identify all corresponding task instances within the thread.
         # Also remember which of those instances was most recently changed,
         # because we are making this one the instance that will
         # continue the thread of control. In other words, we will continue
         # to build the task tree underneath the most recently changed task.
+        # Completed tasks are ignored (this is for loop handling), and so
+        # are tasks from other threads and subprocesses.
         last_changed = None
         thread_tasks = []
-        for task in split_task._find_any(self):
-            # Ignore tasks from other threads.
-            if task.thread_id != my_task.thread_id:
-                continue
-            # Ignore tasks from other subprocesses:
-            if task.workflow != my_task.workflow:
+        for task in self._get_unfinished_instances(my_task):
+            # Ignore tasks outside of the split.
+            if split_task is not None and task is not split_task and \
+                    not task._is_descendant_of(split_task):
                 continue
 
             # Ignore my outgoing branches.
             if task._is_descendant_of(my_task):
                 continue
-            # Ignore completed tasks (this is for loop handling)
-            if task._is_finished():
-                continue
 
             # For an inclusive join, this can happen - it's a future join
             if not task.parent._is_finished():
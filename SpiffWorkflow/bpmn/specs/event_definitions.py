@@ -18,7 +18,8 @@ from builtins import object
 # Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA
 # 02110-1301  USA
 
-import datetime
+import calendar
+import time
 
 
 class CatchingEventDefinition(object):
@@ -34,6 +35,19 @@ class CatchingEventDefinition(object):
         """
         return my_task._get_internal_data('event_fired', False)
 
+    def _get_wakeup_keys(self, my_task):
+        """
+        Returns what a task that waits for this event waits on. See
+        :meth:`SpiffWorkflow.specs.TaskSpec._get_wakeup_keys`.
+        """
+        return None
+
+    def _get_subscribed_messages(self, my_task):
+        """
+        Returns the messages that a task that waits for this event accepts.
+        """
+        return []
+
     def _accept_message(self, my_task, message):
         return False
 
@@ -69,6 +83,13 @@ class MessageEventDefinition(CatchingEventDefinition, ThrowingEventDefinition):
         """
         return my_task._get_internal_data('event_fired', False)
 
+    def _get_wakeup_keys(self, my_task):
+        # Messages are delivered through BpmnWorkflow.accept_message().
+        return []
+
+    def _get_subscribed_messages(self, my_task):
+        return [self.message]
+
     def _accept_message(self, my_task, message):
         if message != self.message:
             return False
@@ -98,14 +119,39 @@ class TimerEventDefinition(CatchingEventDefinition):
     def has_fired(self, my_task):
         """
         The Timer is considered to have fired if the evaluated dateTime
-        expression is before datetime.datetime.now()
+        expression is before datetime.datetime.now(), or if it was fired by
+        BpmnWorkflow.refresh_expired_timers().
+        """
+        if CatchingEventDefinition.has_fired(self, my_task):
+            return True
+        deadline = self._get_deadline(my_task)
+        if deadline is None:
+            return False
+        return time.time() > deadline
+
+    def _get_deadline(self, my_task):
+        """
+        Returns the expiry time of the timer of the given task, as a POSIX
+        timestamp like time.time(), or None if the dateTime expression
+        evaluates to None. The expression is evaluated until it yields a
+        time, which is then kept in the internal data of the task.
         """
+        deadline = my_task._get_internal_data('timer_deadline')
+        if deadline is not None:
+            return float(deadline)
         dt = my_task.workflow.script_engine.evaluate(my_task, self.dateTime)
         if dt is None:
-            return False
+            return None
         if dt.tzinfo:
-            tz = dt.tzinfo
-            now = tz.fromutc(datetime.datetime.utcnow().replace(tzinfo=tz))
+            deadline = calendar.timegm(dt.utctimetuple())
         else:
-            now = datetime.datetime.now()
-        return now > dt
+            deadline = time.mktime(dt.timetuple())
+        deadline += dt.microsecond / 1000000.0
+        my_task._set_internal_data(timer_deadline=deadline)
+        return deadline
+
+    def _get_wakeup_keys(self, my_task):
+        # The deadline does not change once it is known; expired timers are
+        # found by BpmnWorkflow.refresh_expired_timers() and
+        # refresh_waiting_tasks().
+        return []
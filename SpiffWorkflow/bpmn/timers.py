@@ -0,0 +1,273 @@
+# -*- coding: utf-8 -*-
+from __future__ import division, absolute_import
+from builtins import object
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA
+# 02110-1301  USA
+import heapq
+import re
+import sqlite3
+import time
+from threading import Lock
+
+
+class TimerStore(object):
+
+    """
+    Persists the next timer deadline of each workflow instance that is
+    registered with a :class:`TimerService`, so that the service can be
+    restarted without loading the instances.
+
+    This base class keeps the deadlines in memory only.
+    """
+
+    def __init__(self):
+        """
+        Constructor.
+        """
+        self._deadlines = {}
+
+    def load(self):
+        """
+        Returns all stored deadlines.
+
+        :rtype:  list((str, float))
+        :returns: (instance key, deadline) pairs.
+        """
+        return list(self._deadlines.items())
+
+    def save(self, key, deadline):
+        """
+        Stores the deadline of the given instance, replacing any previous
+        one.
+
+        :type  key: str
+        :param key: The key of the workflow instance.
+        :type  deadline: float
+        :param deadline: A POSIX timestamp like time.time().
+        """
+        self._deadlines[key] = deadline
+
+    def delete(self, key):
+        """
+        Removes the deadline of the given instance, if any.
+
+        :type  key: str
+        :param key: The key of the workflow instance.
+        """
+        self._deadlines.pop(key, None)
+
+
+class SqliteTimerStore(TimerStore):
+
+    """
+    Keeps the deadlines in a table of an SQLite database. This mainly serves
+    as an example for stores that use the database of the application.
+    """
+
+    def __init__(self, filename=':memory:', table='spiff_timers'):
+        """
+        Constructor.
+
+        :type  filename: str
+        :param filename: The database file.
+        :type  table: str
+        :param table: The name of the table, which is created if needed.
+                      Must be a plain SQL identifier.
+        """
+        if not re.match(r'^[A-Za-z_][A-Za-z0-9_]*$', table):
+            raise ValueError('invalid table name: %r' % table)
+        self.table = table
+        self._db = sqlite3.connect(filename, check_same_thread=False)
+        with self._db:
+            self._db.execute('CREATE TABLE IF NOT EXISTS %s ('
+                             'instance TEXT PRIMARY KEY, '
+                             'deadline REAL NOT NULL)' % table)
+
+    def load(self):
+        cursor = self._db.execute('SELECT instance, deadline FROM %s'
+                                  % self.table)
+        return cursor.fetchall()
+
+    def save(self, key, deadline):
+        with self._db:
+            self._db.execute('INSERT OR REPLACE INTO %s (instance, deadline) '
+                             'VALUES (?, ?)' % self.table, (key, deadline))
+
+    def delete(self, key):
+        with self._db:
+            self._db.execute('DELETE FROM %s WHERE instance = ?'
+                             % self.table, (key,))
+
+    def close(self):
+        """
+        Closes the database connection.
+        """
+        self._db.close()
+
+
+class TimerService(object):
+
+    """
+    Tracks the timer events of many suspended workflow instances in one
+    priority queue, so that only the instances whose timers expired need
+    to be loaded. An instance is identified by a key that the application
+    chooses, and that its load function understands.
+
+    A workflow is registered whenever it was saved; the service remembers
+    the earliest deadline of its timer events (see
+    :meth:`SpiffWorkflow.bpmn.workflow.BpmnWorkflow.next_timer_deadline`).
+    :meth:`wake` then loads the due instances and refreshes their timers.
+    """
+
+    def __init__(self, store=None):
+        """
+        Constructor. The deadlines in the store are loaded right away.
+
+        :type  store: TimerStore
+        :param store: Persists the deadlines. Defaults to an in-memory store.
+        """
+        self.store = store if store is not None else TimerStore()
+        self._lock = Lock()
+        self._deadlines = dict(self.store.load())
+        self._queue = [(deadline, key)
+                       for key, deadline in self._deadlines.items()]
+        heapq.heapify(self._queue)
+
+    def __len__(self):
+        return len(self._deadlines)
+
+    def register(self, key, workflow):
+        """
+        Records the next timer deadline of the given workflow, replacing any
+        previous one. A workflow without waiting timer events is dropped.
+
+        :type  key: str
+        :param key: The key of the workflow instance.
+        :type  workflow: SpiffWorkflow.bpmn.workflow.BpmnWorkflow
+        :param workflow: The workflow.
+        :rtype:  float
+        :returns: The deadline, or None.
+        """
+        deadline = workflow.next_timer_deadline()
+        self.set_deadline(key, deadline)
+        return deadline
+
+    def set_deadline(self, key, deadline):
+        """
+        Like :meth:`register`, for applications that already know the
+        deadline.
+
+        :type  key: str
+        :param key: The key of the workflow instance.
+        :type  deadline: float
+        :param deadline: A POSIX timestamp, or None to unregister.
+        """
+        with self._lock:
+            if deadline is None:
+                if self._deadlines.pop(key, None) is not None:
+                    self.store.delete(key)
+                return
+            if self._deadlines.get(key) == deadline:
+                return
+            self._deadlines[key] = deadline
+            self.store.save(key, deadline)
+            heapq.heappush(self._queue, (deadline, key))
+            if len(self._queue) > 2 * len(self._deadlines) + 64:
+                self._queue = [(d, k) for d, k in self._queue
+                               if self._deadlines.get(k) == d]
+                heapq.heapify(self._queue)
+
+    def unregister(self, key):
+        """
+        Forgets the given instance, e.g. because it was deleted.
+
+        :type  key: str
+        :param key: The key of the workflow instance.
+        """
+        self.set_deadline(key, None)
+
+    def get_deadline(self, key):
+        """
+        Returns the deadline recorded for the given instance.
+
+        :type  key: str
+        :param key: The key of the workflow instance.
+        :rtype:  float
+        :returns: The deadline, or None.
+        """
+        return self._deadlines.get(key)
+
+    def next_deadline(self):
+        """
+        Returns the earliest deadline of all instances.
+
+        :rtype:  float
+        :returns: A POSIX timestamp, or None if no instance is registered.
+        """
+        with self._lock:
+            while self._queue:
+                deadline, key = self._queue[0]
+                if self._deadlines.get(key) == deadline:
+                    return deadline
+                heapq.heappop(self._queue)
+        return None
+
+    def get_due(self, now=None):
+        """
+        Returns the instances whose deadline has passed, earliest first.
+        They remain registered.
+
+        :type  now: float
+        :param now: The current time; defaults to time.time().
+        :rtype:  list(str)
+        :returns: The keys of the due instances.
+        """
+        if now is None:
+            now = time.time()
+        with self._lock:
+            due = []
+            while self._queue and self._queue[0][0] < now:
+                deadline, key = heapq.heappop(self._queue)
+                if self._deadlines.get(key) == deadline:
+                    due.append((deadline, key))
+            for entry in due:
+                heapq.heappush(self._queue, entry)
+        return [key for deadline, key in due]
+
+    def wake(self, load, now=None):
+        """
+        Loads each due instance using the given function, fires its timers
+        that expired by the given time, and registers its next deadline.
+        The caller should then do the engine steps of the returned workflows
+        and save them.
+
+        :type  load: callable
+        :param load: Returns the BpmnWorkflow of the given key, or None if
+                     the instance no longer exists.
+        :type  now: float
+        :param now: The current time; defaults to time.time().
+        :rtype:  list((str, BpmnWorkflow))
+        :returns: The keys and workflows of the woken instances.
+        """
+        woken = []
+        for key in self.get_due(now):
+            workflow = load(key)
+            if workflow is None:
+                self.unregister(key)
+                continue
+            workflow.refresh_expired_timers(now)
+            self.register(key, workflow)
+            woken.append((key, workflow))
+        return woken
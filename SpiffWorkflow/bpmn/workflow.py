@@ -17,9 +17,14 @@ from __future__ import division
 # Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA
 # 02110-1301  USA
 
+import heapq
+import time
+
 from ..task import Task
 from ..workflow import Workflow
 from .BpmnScriptEngine import BpmnScriptEngine
+from .specs.BpmnProcessSpec import BpmnProcessSpec
+from .specs.event_definitions import TimerEventDefinition
 
 
 class BpmnWorkflow(Workflow):
@@ -42,22 +47,45 @@ class BpmnWorkflow(Workflow):
         state. This is used in conjunction with the CompactWorkflowSerializer
         to provide read only access to a previously saved workflow.
         """
+        self._engine_tasks = set()
+        self._reset_timers()
+        self._reset_messages()
         super(BpmnWorkflow, self).__init__(workflow_spec, **kwargs)
         self.name = name or workflow_spec.name
         self.script_engine = script_engine or BpmnScriptEngine()
         self._busy_with_restore = False
         self.read_only = read_only
 
-    def accept_message(self, message):
+    def accept_message(self, message, correlation=None,
+                       get_correlation=None):
         """
         Indicate to the workflow that a message has been received. The message
         will be processed by any waiting Intermediate or Boundary Message
         Events, that are waiting for the message.
+
+        :type  message: str
+        :param message: The name of the message.
+        :type  correlation: object
+        :param correlation: The correlation key of the message, if any.
+        :type  get_correlation: callable
+        :param get_correlation: If given, returns the correlation key of a
+                                waiting task, or None if the task accepts
+                                the message whatever its key. Only the
+                                tasks whose key is None or the given
+                                correlation are then offered the message.
         """
         assert not self.read_only
-        self.refresh_waiting_tasks()
-        self.do_engine_steps()
-        for my_task in Task.Iterator(self.task_tree, Task.WAITING):
+        # Bring the workflow up to date first, which only involves expired
+        # timers and READY engine tasks.
+        self.refresh_expired_timers()
+        if self._engine_tasks:
+            self.do_engine_steps()
+        subscribers = self._message_subscribers.get(message, set()).union(
+            self._message_subscribers.get(None, ()))
+        if get_correlation is not None:
+            subscribers = [task for task in subscribers
+                           if get_correlation(task) in (None, correlation)]
+        for my_task in sorted(subscribers, key=lambda task: task._left):
             my_task.task_spec.accept_message(my_task, message)
 
     def do_engine_steps(self):
@@ -68,15 +96,17 @@ class BpmnWorkflow(Workflow):
         left.
         """
         assert not self.read_only
-        engine_steps = list(
-            [t for t in self.get_tasks(Task.READY)
-             if self._is_engine_task(t.task_spec)])
-        while engine_steps:
+        self._compact_if_needed()
+        # The READY engine tasks are tracked as their state changes. Each
+        # round completes those that are READY at its start, in tree order.
+        while self._engine_tasks:
+            if self._new_work:
+                self._dispatch_work()
+            engine_steps = sorted(self._engine_tasks,
+                                  key=lambda task: task._left)
             for task in engine_steps:
-                task.complete()
-            engine_steps = list(
-                [t for t in self.get_tasks(Task.READY)
-                 if self._is_engine_task(t.task_spec)])
+                if task._state == Task.READY:
+                    task.complete()
 
     def refresh_waiting_tasks(self):
         """
@@ -87,6 +117,105 @@ class BpmnWorkflow(Workflow):
         for my_task in self.get_tasks(Task.WAITING):
             my_task.task_spec._update(my_task)
 
+    def next_timer_deadline(self):
+        """
+        Returns the time at which the next timer event expires, such that
+        the caller may sleep until then and call refresh_expired_timers().
+        Timer events that expire while the workflow is busy are included.
+
+        :rtype:  float
+        :returns: A POSIX timestamp like time.time(), or None if no timer
+                  event is waiting.
+        """
+        self._schedule_timers()
+        while self._timers:
+            deadline, count, task = self._timers[0]
+            if self._timer_entries.get(task) == count:
+                return deadline
+            heapq.heappop(self._timers)
+        return None
+
+    def refresh_expired_timers(self, now=None):
+        """
+        Fires the WAITING timer events whose time has passed. Unlike
+        refresh_waiting_tasks(), this leaves all other tasks alone, and the
+        dateTime expression of a timer is evaluated only once.
+
+        :type  now: float
+        :param now: The current time as a POSIX timestamp; defaults to
+                    time.time().
+        """
+        assert not self.read_only
+        self._schedule_timers()
+        if now is None:
+            now = time.time()
+        while self._timers and self._timers[0][0] < now:
+            deadline, count, task = heapq.heappop(self._timers)
+            if self._timer_entries.get(task) != count:
+                continue
+            del self._timer_entries[task]
+            task.task_spec.event_definition._fire(task)
+            task.task_spec._update(task)
+            if task._state == Task.WAITING:
+                self._unscheduled_timers.add(task)
+
+    def _reset_timers(self):
+        # A heap of (deadline, count, task) entries, the count of the current
+        # entry of each timer, and the timers that have no entry yet.
+        self._timers = []
+        self._timer_count = 0
+        self._timer_entries = {}
+        self._unscheduled_timers = set()
+
+    def _schedule_timers(self):
+        """
+        Evaluates the deadlines of the timers that started waiting since the
+        last call, and adds them to the heap.
+        """
+        unscheduled = sorted(self._unscheduled_timers,
+                             key=lambda task: task._left)
+        self._unscheduled_timers = set()
+        for task in unscheduled:
+            definition = task.task_spec.event_definition
+            deadline = definition._get_deadline(task)
+            if deadline is None:
+                # Only refresh_waiting_tasks() retries these.
+                continue
+            self._timer_count += 1
+            self._timer_entries[task] = self._timer_count
+            heapq.heappush(self._timers, (deadline, self._timer_count, task))
+        if len(self._timers) > 2 * len(self._timer_entries) + 64:
+            self._timers = [entry for entry in self._timers
+                            if self._timer_entries.get(entry[2]) == entry[1]]
+            heapq.heapify(self._timers)
+
+    def _reset_messages(self):
+        # The WAITING tasks by the message they accept, where None stands for
+        # any message, and the messages of each task.
+        self._message_subscribers = {}
+        self._subscribed_messages = {}
+
+    def _subscribe(self, task):
+        get_messages = getattr(task.task_spec, '_get_subscribed_messages',
+                               None)
+        if get_messages is None:
+            return
+        messages = get_messages(task)
+        if messages is None:
+            messages = [None]
+        if not messages:
+            return
+        self._subscribed_messages[task] = messages
+        for message in messages:
+            self._message_subscribers.setdefault(message, set()).add(task)
+
+    def _unsubscribe(self, task):
+        for message in self._subscribed_messages.pop(task, ()):
+            subscribers = self._message_subscribers[message]
+            subscribers.discard(task)
+            if not subscribers:
+                del self._message_subscribers[message]
+
     def get_ready_user_tasks(self):
         """
         Returns a list of User Tasks that are READY for user action
@@ -106,9 +235,52 @@ class BpmnWorkflow(Workflow):
         return self.outer_workflow._is_busy_with_restore()
 
     def _is_engine_task(self, task_spec):
+        wf_spec = task_spec._wf_spec
+        if isinstance(wf_spec, BpmnProcessSpec):
+            return wf_spec._is_engine_spec(task_spec)
         return (not hasattr(task_spec, 'is_engine_task') or
                 task_spec.is_engine_task())
 
+    def _task_ready_notify(self, task):
+        super(BpmnWorkflow, self)._task_ready_notify(task)
+        if self._is_engine_task(task.task_spec):
+            self._engine_tasks.add(task)
+
+    def _task_waiting_notify(self, task):
+        super(BpmnWorkflow, self)._task_waiting_notify(task)
+        definition = getattr(task.task_spec, 'event_definition', None)
+        if isinstance(definition, TimerEventDefinition):
+            self._unscheduled_timers.add(task)
+        self._subscribe(task)
+
+    def _task_state_changed_notify(self, task, old_state):
+        if old_state == Task.READY:
+            self._engine_tasks.discard(task)
+        elif old_state == Task.WAITING:
+            self._unscheduled_timers.discard(task)
+            self._timer_entries.pop(task, None)
+            self._unsubscribe(task)
+        super(BpmnWorkflow, self)._task_state_changed_notify(task, old_state)
+
+    def _unindex_task(self, task):
+        self._engine_tasks.discard(task)
+        self._unscheduled_timers.discard(task)
+        self._timer_entries.pop(task, None)
+        self._unsubscribe(task)
+        super(BpmnWorkflow, self)._unindex_task(task)
+
+    def _reindex_tasks(self):
+        self._engine_tasks = set()
+        self._reset_timers()
+        self._reset_messages()
+        super(BpmnWorkflow, self)._reindex_tasks()
+
+    def _release(self):
+        super(BpmnWorkflow, self)._release()
+        self._engine_tasks = set()
+        self._reset_timers()
+        self._reset_messages()
+
     def _task_completed_notify(self, task):
         assert (not self.read_only) or self._is_busy_with_restore()
         super(BpmnWorkflow, self)._task_completed_notify(task)
@@ -0,0 +1,228 @@
+# -*- coding: utf-8 -*-
+from __future__ import division, absolute_import
+from builtins import object
+# Copyright (C) 2007 Samuel Abels
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA
+# 02110-1301  USA
+from array import array
+from collections import deque
+
+
+class History(object):
+
+    """
+    Decides how much of its history every task of a workflow keeps: the
+    states that it went through, and a textual log of the transitions.
+
+    The history is stored in the task itself. As long as a task did not
+    change its state, nothing is stored, and its history consists of the
+    current state only.
+
+    This base class keeps no history at all.
+    """
+    name = 'none'
+
+    def _record(self, task, old_state, new_state):
+        """
+        Called by the task when it moved from one state to another.
+
+        :type  task: Task
+        :param task: The task that changed state.
+        :type  old_state: integer
+        :param old_state: The previous state.
+        :type  new_state: integer
+        :param new_state: The new state.
+        """
+        pass
+
+    def get_states(self, task):
+        """
+        Returns the recorded states of the given task, oldest first.
+
+        :type  task: Task
+        :param task: The task.
+        :rtype:  list(integer)
+        :returns: The states.
+        """
+        return []
+
+    def set_states(self, task, states):
+        """
+        Replaces the recorded states of the given task, e.g. when it is
+        restored by a serializer. States that the policy does not keep
+        are dropped.
+
+        :type  task: Task
+        :param task: The task.
+        :type  states: list(integer)
+        :param states: The states, oldest first.
+        """
+        pass
+
+    def get_log(self, task):
+        """
+        Returns the recorded log messages of the given task, oldest first.
+
+        :type  task: Task
+        :param task: The task.
+        :rtype:  list(str)
+        :returns: The log messages.
+        """
+        return []
+
+    def set_log(self, task, log):
+        """
+        Replaces the recorded log messages of the given task. Messages
+        that the policy does not keep are dropped.
+
+        :type  task: Task
+        :param task: The task.
+        :type  log: list(str)
+        :param log: The log messages, oldest first.
+        """
+        pass
+
+    def _format(self, task, old_state, new_state):
+        return "Moving '%s' from %s to %s" % (task.get_name(),
+                                              task.state_names[old_state],
+                                              task.state_names[new_state])
+
+
+class NoHistory(History):
+
+    """
+    Keeps no history.
+    """
+    pass
+
+
+class StateHistory(History):
+
+    """
+    Keeps every state that a task went through in a compact array, but no
+    log messages.
+    """
+    name = 'states'
+
+    def _record(self, task, old_state, new_state):
+        if task._state_history is None:
+            task._state_history = array('B', [old_state])
+        task._state_history.append(new_state)
+
+    def get_states(self, task):
+        if task._state_history is None:
+            return [task._state]
+        return list(task._state_history)
+
+    def set_states(self, task, states):
+        task._state_history = array('B', states)
+
+
+class RingHistory(History):
+
+    """
+    Keeps only the most recent states and log messages of every task.
+    """
+    name = 'ring'
+
+    def __init__(self, size=10):
+        """
+        Constructor.
+
+        :type  size: integer
+        :param size: The number of states and messages that are kept.
+        """
+        assert size > 0
+        self.size = size
+
+    def _record(self, task, old_state, new_state):
+        if task._state_history is None:
+            task._state_history = deque([old_state], self.size)
+        task._state_history.append(new_state)
+        if task._log is None:
+            task._log = deque((), self.size)
+        task._log.append(self._format(task, old_state, new_state))
+
+    def get_states(self, task):
+        if task._state_history is None:
+            return [task._state]
+        return list(task._state_history)
+
+    def set_states(self, task, states):
+        task._state_history = deque(states, self.size)
+
+    def get_log(self, task):
+        return list(task._log or ())
+
+    def set_log(self, task, log):
+        task._log = deque(log, self.size)
+
+
+class FullHistory(History):
+
+    """
+    Keeps every state that a task went through, and, unless Python runs
+    with optimizations enabled, a log message for every transition.
+    This is the default.
+    """
+    name = 'full'
+
+    def _record(self, task, old_state, new_state):
+        if task._state_history is None:
+            task._state_history = [old_state]
+        task._state_history.append(new_state)
+        if __debug__:
+            self.get_log(task).append(
+                self._format(task, old_state, new_state))
+
+    def get_states(self, task):
+        if task._state_history is None:
+            task._state_history = [task._state]
+        return task._state_history
+
+    def set_states(self, task, states):
+        task._state_history = list(states)
+
+    def get_log(self, task):
+        if task._log is None:
+            task._log = []
+        return task._log
+
+    def set_log(self, task, log):
+        task._log = list(log)
+
+
+_policies = dict((cls.name, cls) for cls in (NoHistory, StateHistory,
+                                             RingHistory, FullHistory))
+
+
+def get_history(name, size=None):
+    """
+    Returns a new history policy, e.g. for restoring the policy of a
+    serialized workflow.
+
+    :type  name: str
+    :param name: The name of the policy: 'none', 'states', 'ring' or
+                 'full'.
+    :type  size: integer
+    :param size: The size of a ring buffer, if the policy uses one.
+    :rtype:  History
+    :returns: The policy.
+    """
+    cls = _policies[name]
+    if size is None:
+        return cls()
+    return cls(size)
@@ -0,0 +1,209 @@
+# -*- coding: utf-8 -*-
+from __future__ import division, absolute_import
+from builtins import str, object
+# Copyright (C) 2007 Samuel Abels
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA
+# 02110-1301  USA
+from threading import Lock
+from uuid import UUID, uuid4
+
+
+class IdAllocator(object):
+
+    """
+    Issues the ids of the tasks of a workflow. A subworkflow uses the
+    allocator of its parent, so ids are unique within the whole tree.
+
+    This base class defines the interface only.
+    """
+    name = None
+
+    def new_id(self):
+        """
+        Returns a new, unique task id.
+
+        :rtype:  object
+        :returns: The id.
+        """
+        raise NotImplementedError
+
+    def encode(self, id):
+        """
+        Returns the given id as a string, e.g. for text based serializers.
+
+        :type  id: object
+        :param id: A task id.
+        :rtype:  str
+        :returns: The encoded id.
+        """
+        return str(id)
+
+    def decode(self, value):
+        """
+        The reverse of :meth:`encode`. Ids that were serialized as they are
+        may also be passed, and are returned unchanged.
+
+        :type  value: object
+        :param value: An encoded id.
+        :rtype:  object
+        :returns: The id.
+        """
+        raise NotImplementedError
+
+    def get_state(self):
+        """
+        Returns what a serializer has to store to restore the allocator.
+
+        :rtype:  object
+        :returns: None, or a list of strings and integers.
+        """
+        return None
+
+    def set_state(self, state):
+        """
+        Restores the state returned by :meth:`get_state`.
+
+        :type  state: object
+        :param state: The state.
+        """
+        pass
+
+
+class UuidAllocator(IdAllocator):
+
+    """
+    Issues random UUIDs, which are unique across workflows. This is the
+    default.
+    """
+    name = 'uuid'
+
+    def new_id(self):
+        return uuid4()
+
+    def decode(self, value):
+        if value is None or isinstance(value, UUID):
+            return value
+        return UUID(value)
+
+
+class SequentialAllocator(IdAllocator):
+
+    """
+    Issues consecutive integers, which are cheaper to create, store and
+    compare than UUIDs, but unique within one workflow only. If an instance
+    name is given, the ids are (instance, counter) tuples instead.
+    """
+    name = 'sequential'
+
+    def __init__(self, instance=None, last_id=0):
+        """
+        Constructor.
+
+        :type  instance: str
+        :param instance: The name of the workflow instance, if any.
+        :type  last_id: integer
+        :param last_id: The last counter value that was issued.
+        """
+        self.instance = instance
+        self.last_id = last_id
+
+    def new_id(self):
+        self.last_id += 1
+        if self.instance is None:
+            return self.last_id
+        return (self.instance, self.last_id)
+
+    def encode(self, id):
+        if self.instance is None:
+            return str(id)
+        return '%s:%d' % id
+
+    def decode(self, value):
+        if value is None:
+            return None
+        if self.instance is None:
+            return int(value)
+        if isinstance(value, (list, tuple)):
+            instance, counter = value
+        else:
+            instance, counter = value.rsplit(':', 1)
+        return (str(instance), int(counter))
+
+    def get_state(self):
+        return [self.instance, self.last_id]
+
+    def set_state(self, state):
+        self.instance, self.last_id = state
+
+
+class ThreadIdPool(object):
+
+    """
+    Issues the thread ids of the tasks of a workflow, as used by
+    ThreadSplit, Join and friends. Like the id allocator, the pool is
+    shared with subworkflows. Issuing ids is thread safe, and, because
+    every workflow has a pool of its own, reproducible.
+    """
+
+    def __init__(self, last_id=0):
+        """
+        Constructor.
+
+        :type  last_id: integer
+        :param last_id: The last thread id that was issued.
+        """
+        self.last_id = last_id
+        self._lock = Lock()
+
+    def new_id(self):
+        """
+        Returns a new thread id.
+
+        :rtype:  integer
+        :returns: The thread id.
+        """
+        with self._lock:
+            self.last_id += 1
+            return self.last_id
+
+    def __getstate__(self):
+        return self.last_id
+
+    def __setstate__(self, last_id):
+        self.last_id = last_id
+        self._lock = Lock()
+
+
+_allocators = dict((cls.name, cls) for cls in (UuidAllocator,
+                                               SequentialAllocator))
+
+
+def get_id_allocator(name, state=None):
+    """
+    Returns a new id allocator, e.g. for restoring the allocator of a
+    serialized workflow.
+
+    :type  name: str
+    :param name: The name of the allocator: 'uuid' or 'sequential'.
+    :type  state: object
+    :param state: The state as returned by :meth:`IdAllocator.get_state`.
+    :rtype:  IdAllocator
+    :returns: The allocator.
+    """
+    allocator = _allocators[name]()
+    if state is not None:
+        allocator.set_state(state)
+    return allocator
@@ -171,7 +171,7 @@ def valueof(scope, op, default=None):
     if op is None:
         return default
     elif isinstance(op, Attrib):
-        if op.name not in scope.data:
+        if op.name not in scope._peek_data():
             LOG.debug("Attrib('%s') not present in task '%s' data" %
                       (op.name, scope.get_name()))
         return scope.get_data(op.name, default)
@@ -179,12 +179,12 @@ def valueof(scope, op, default=None):
         if not op.path:
             return default
         parts = op.path.split('/')
-        data = scope.data
+        data = scope._peek_data()
         for part in parts:
             if part not in data:
                 LOG.debug("PathAttrib('%s') not present in task '%s' "
                           "data" % (op.path, scope.get_name()),
-                          extra=dict(data=scope.data))
+                          extra=dict(data=data))
                 return default
             data = data[part]  # move down the path
         return data
@@ -0,0 +1,174 @@
+# -*- coding: utf-8 -*-
+from __future__ import division, absolute_import
+from builtins import object
+# Copyright (C) 2007 Samuel Abels
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA
+# 02110-1301  USA
+import heapq
+from .task import Task
+
+
+class _Entry(object):
+
+    """
+    An entry in the ready queue. Entries are ordered by the current left
+    label of their task, i.e. in the order of a tree walk. Relabeling the
+    tree never changes the relative order of two tasks, so the queue stays
+    valid when labels change. Deferred entries come after all others.
+    """
+    __slots__ = ('task', 'deferred')
+
+    def __init__(self, task, deferred=False):
+        self.task = task
+        self.deferred = deferred
+
+    def __lt__(self, other):
+        if self.deferred != other.deferred:
+            return other.deferred
+        return self.task._left < other.task._left
+
+
+class Scheduler(object):
+
+    """
+    Keeps track of the tasks of a workflow that may be worked on: a queue
+    of the READY tasks, ordered like a walk over the task tree, and the set
+    of WAITING tasks.
+
+    The WAITING tasks are also registered under whatever they wait on, as
+    declared by :meth:`SpiffWorkflow.specs.TaskSpec._get_wakeup_keys`, so
+    that a completed task only wakes up the tasks that wait for it.
+
+    The workflow reports every task that is added, removed, or that
+    changes state, so the scheduler never needs to search the tree.
+    """
+
+    def __init__(self):
+        """
+        Constructor.
+        """
+        self.ready = []
+        self.waiting = set()
+        self._entries = {}
+        # Waiting tasks by wakeup key, and those that wake up on every
+        # completion.
+        self._waiters = {}
+        self._always_waiting = set()
+        self._wakeup_keys = {}
+
+    def _add(self, task):
+        """
+        Called when the given task was added to the workflow.
+        """
+        if task._state == Task.READY:
+            entry = _Entry(task)
+            self._entries[task] = entry
+            heapq.heappush(self.ready, entry)
+        elif task._state == Task.WAITING:
+            self.waiting.add(task)
+            keys = task.task_spec._get_wakeup_keys(task)
+            if keys is None:
+                self._always_waiting.add(task)
+                return
+            keys = self._wakeup_keys[task] = tuple(keys)
+            for key in keys:
+                self._waiters.setdefault(key, set()).add(task)
+
+    def _remove(self, task):
+        """
+        Called when the given task was removed from the workflow, or left
+        the READY or WAITING state.
+        """
+        # Entries in the queue are discarded when they are popped.
+        self._entries.pop(task, None)
+        self.waiting.discard(task)
+        self._always_waiting.discard(task)
+        for key in self._wakeup_keys.pop(task, ()):
+            waiters = self._waiters[key]
+            waiters.discard(task)
+            if not waiters:
+                del self._waiters[key]
+        if len(self.ready) > 2 * len(self._entries) + 64:
+            self._compact()
+
+    def _state_changed(self, task, old_state):
+        """
+        Called when the state of the given task has changed.
+        """
+        if old_state == Task.READY or old_state == Task.WAITING:
+            self._remove(task)
+        self._add(task)
+
+    def _defer(self, task):
+        """
+        Moves the given READY task behind all tasks that were not deferred,
+        e.g. while its work runs on an executor.
+        """
+        if task not in self._entries:
+            return
+        entry = _Entry(task, True)
+        self._entries[task] = entry
+        heapq.heappush(self.ready, entry)
+
+    def _compact(self):
+        self.ready = [entry for entry in self.ready
+                      if self._entries.get(entry.task) is entry]
+        heapq.heapify(self.ready)
+
+    def iter_ready(self):
+        """
+        Yields the READY tasks in the order of a walk over the task tree,
+        deferred tasks last. Tasks that the caller does not complete remain
+        in the queue.
+
+        :rtype:  generator(Task)
+        :returns: The ready tasks.
+        """
+        skipped = []
+        try:
+            while self.ready:
+                entry = heapq.heappop(self.ready)
+                if self._entries.get(entry.task) is not entry:
+                    continue
+                skipped.append(entry)
+                yield entry.task
+        finally:
+            for entry in skipped:
+                if self._entries.get(entry.task) is entry:
+                    heapq.heappush(self.ready, entry)
+
+    def get_waiting(self):
+        """
+        Returns the WAITING tasks in the order of a walk over the task tree.
+
+        :rtype:  list(Task)
+        :returns: The waiting tasks.
+        """
+        return sorted(self.waiting, key=lambda task: task._left)
+
+    def get_waiting_for(self, task):
+        """
+        Returns the WAITING tasks that must be re-evaluated because the
+        given task completed, in the order of a walk over the task tree.
+
+        :type  task: Task
+        :param task: The task that completed.
+        :rtype:  list(Task)
+        :returns: The waiting tasks.
+        """
+        waiting = self._always_waiting.union(
+            self._waiters.get(task.task_spec, ()))
+        return sorted(waiting, key=lambda task: task._left)
@@ -34,3 +34,11 @@ class Serializer(object):
     def deserialize_workflow(self, s_state, **kwargs):
         raise NotImplementedError(
             "You must implement the deserialize_workflow method.")
+
+    def serialize_workflow_archive(self, archive, **kwargs):
+        raise NotImplementedError(
+            "You must implement the serialize_workflow_archive method.")
+
+    def deserialize_workflow_archive(self, s_state, **kwargs):
+        raise NotImplementedError(
+            "You must implement the deserialize_workflow_archive method.")
@@ -18,8 +18,11 @@ from builtins import str
 import pickle
 from base64 import b64encode, b64decode
 from .. import Workflow
+from ..archive import WorkflowArchive
 from ..util.impl import get_class
-from ..task import Task
+from ..task import Task, CompactedTask
+from ..history import get_history
+from ..ids import get_id_allocator, ThreadIdPool
 from ..operators import (Attrib, PathAttrib, Equal, NotEqual,
                          Operator, GreaterThan, LessThan, Match)
 from ..specs import (Cancel, AcquireMutex, CancelTask, Celery, Choose,
@@ -127,7 +130,8 @@ class DictionarySerializer(Serializer):
                        description=spec.description,
                        manual=spec.manual,
                        internal=spec.internal,
-                       lookahead=spec.lookahead)
+                       lookahead=spec.lookahead,
+                       parallel_safe=spec.parallel_safe)
         module_name = spec.__class__.__module__
         s_state['class'] = module_name + '.' + spec.__class__.__name__
         s_state['inputs'] = [t.name for t in spec.inputs]
@@ -149,6 +153,7 @@ class DictionarySerializer(Serializer):
         spec.manual = s_state.get('manual', False)
         spec.internal = s_state.get('internal', False)
         spec.lookahead = s_state.get('lookahead', 2)
+        spec.parallel_safe = s_state.get('parallel_safe', False)
         spec.data = self.deserialize_dict(s_state.get('data', {}))
         spec.defines = self.deserialize_dict(s_state.get('defines', {}))
         spec.pre_assign = self.deserialize_list(s_state.get('pre_assign', []))
@@ -309,12 +314,16 @@ class DictionarySerializer(Serializer):
     def serialize_multi_instance(self, spec):
         s_state = self.serialize_task_spec(spec)
         s_state['times'] = self.serialize_arg(spec.times)
+        s_state['window'] = spec.window
+        s_state['item_name'] = spec.item_name
         return s_state
 
     def deserialize_multi_instance(self, wf_spec, s_state):
         spec = MultiInstance(wf_spec,
                              s_state['name'],
-                             times=self.deserialize_arg(s_state['times']))
+                             times=self.deserialize_arg(s_state['times']),
+                             window=s_state.get('window'),
+                             item_name=s_state.get('item_name'))
         self.deserialize_task_spec(wf_spec, s_state, spec=spec)
         return spec
 
@@ -471,6 +480,20 @@ class DictionarySerializer(Serializer):
         # success
         s_state['success'] = workflow.success
 
+        # history
+        s_state['history'] = dict(name=workflow.history.name,
+                                  size=getattr(workflow.history, 'size', None))
+
+        # id_allocator
+        s_state['id_allocator'] = dict(name=workflow.id_allocator.name,
+                                       state=workflow.id_allocator.get_state())
+
+        # thread_id_pool
+        s_state['thread_id_pool'] = workflow.thread_id_pool.last_id
+
+        # compact_threshold
+        s_state['compact_threshold'] = workflow.compact_threshold
+
         # task_tree
         s_state['task_tree'] = self.serialize_task(workflow.task_tree)
 
@@ -478,7 +501,21 @@ class DictionarySerializer(Serializer):
 
     def deserialize_workflow(self, s_state, **kwargs):
         wf_spec = self.deserialize_workflow_spec(s_state['wf_spec'], **kwargs)
-        workflow = Workflow(wf_spec)
+
+        # history
+        history = s_state.get('history')
+        if history is not None:
+            history = get_history(history['name'], history['size'])
+        # id_allocator
+        id_allocator = s_state.get('id_allocator')
+        if id_allocator is not None:
+            id_allocator = get_id_allocator(id_allocator['name'],
+                                            id_allocator['state'])
+        workflow = Workflow(wf_spec, history=history,
+                            id_allocator=id_allocator,
+                            thread_id_pool=ThreadIdPool(
+                                s_state.get('thread_id_pool', 0)),
+                            compact_threshold=s_state.get('compact_threshold'))
 
         # data
         workflow.data = self.deserialize_dict(s_state['data'])
@@ -498,14 +535,35 @@ class DictionarySerializer(Serializer):
             workflow, s_state['task_tree'])
 
         # Re-connect parents
+        workflow._reindex_tasks()
         for task in workflow.get_tasks():
             task.parent = workflow.get_task(task.parent)
 
         # last_task
-        workflow.last_task = workflow.get_task(s_state['last_task'])
+        workflow.last_task = workflow.get_task(
+            workflow.id_allocator.decode(s_state['last_task']))
+
+        # Creating the tasks above used up ids; restore the allocator.
+        if id_allocator is not None:
+            id_allocator.set_state(s_state['id_allocator']['state'])
 
         return workflow
 
+    def serialize_workflow_archive(self, archive, **kwargs):
+        assert isinstance(archive, WorkflowArchive)
+        s_state = dict()
+        s_state['spec_name'] = archive.spec_name
+        s_state['success'] = archive.success
+        s_state['path'] = [list(task) for task in archive.path]
+        s_state['data'] = self.serialize_dict(archive.data)
+        return s_state
+
+    def deserialize_workflow_archive(self, s_state, **kwargs):
+        return WorkflowArchive(s_state['spec_name'],
+                               s_state['success'],
+                               s_state['path'],
+                               self.deserialize_dict(s_state['data']))
+
     def serialize_task(self, task, skip_children=False):
         assert isinstance(task, Task)
 
@@ -530,6 +588,9 @@ class DictionarySerializer(Serializer):
             s_state['children'] = [
                 self.serialize_task(child) for child in task.children]
 
+        # thread_id
+        s_state['thread_id'] = task.thread_id
+
         # state
         s_state['state'] = task.state
         s_state['triggered'] = task.triggered
@@ -540,11 +601,24 @@ class DictionarySerializer(Serializer):
         # last_state_change
         s_state['last_state_change'] = task.last_state_change
 
+        # state_history, log
+        # The slots are read directly, so that no history is allocated for
+        # tasks that do not have one yet.
+        if task._state_history:
+            s_state['state_history'] = list(task._state_history)
+        if task._log:
+            s_state['log'] = list(task._log)
+
         # data
-        s_state['data'] = self.serialize_dict(task.data)
+        s_state['data'] = self.serialize_dict(task._peek_data())
 
         # internal_data
-        s_state['internal_data'] = task.internal_data
+        s_state['internal_data'] = task._internal_data or {}
+
+        # compacted
+        if task._compacted:
+            s_state['compacted'] = [self.serialize_compacted_task(summary)
+                                    for summary in task._compacted]
 
         return s_state
 
@@ -555,17 +629,22 @@ class DictionarySerializer(Serializer):
         task = Task(workflow, task_spec)
 
         # id
-        task.id = s_state['id']
+        id_allocator = workflow.id_allocator
+        task.id = id_allocator.decode(s_state['id'])
 
         # parent
         # as the task_tree might not be complete yet
         # keep the ids so they can be processed at the end
-        task.parent = s_state['parent']
+        task.parent = id_allocator.decode(s_state['parent'])
 
         # children
         task.children = [self.deserialize_task(workflow, c)
                          for c in s_state['children']]
 
+        # thread_id
+        if 'thread_id' in s_state:
+            task._thread_id = s_state['thread_id']
+
         # state
         task._state = s_state['state']
         task.triggered = s_state['triggered']
@@ -573,10 +652,49 @@ class DictionarySerializer(Serializer):
         # last_state_change
         task.last_state_change = s_state['last_state_change']
 
+        # state_history, log
+        if s_state.get('state_history'):
+            task.state_history = s_state['state_history']
+        if s_state.get('log'):
+            task.log = s_state['log']
+
         # data
-        task.data = self.deserialize_dict(s_state['data'])
+        data = self.deserialize_dict(s_state['data'])
+        if data:
+            task.data = data
 
         # internal_data
-        task.internal_data = s_state['internal_data']
+        if s_state['internal_data']:
+            task.internal_data = s_state['internal_data']
+
+        # compacted
+        if 'compacted' in s_state:
+            task._compacted = [self.deserialize_compacted_task(s_summary)
+                               for s_summary in s_state['compacted']]
+            for summary in task._compacted:
+                summary.id = id_allocator.decode(summary.id)
 
         return task
+
+    def serialize_compacted_task(self, summary):
+        s_state = dict(id=summary.id,
+                       task_spec=summary.task_spec_name,
+                       state=summary.state,
+                       last_state_change=summary.last_state_change,
+                       finished=summary.finished,
+                       size=summary.size)
+        if summary.data is not None:
+            s_state['data'] = self.serialize_dict(summary.data)
+        return s_state
+
+    def deserialize_compacted_task(self, s_state):
+        data = s_state.get('data')
+        if data is not None:
+            data = self.deserialize_dict(data)
+        return CompactedTask(s_state['id'],
+                             s_state['task_spec'],
+                             s_state['state'],
+                             s_state['last_state_change'],
+                             s_state['finished'],
+                             s_state['size'],
+                             data)
@@ -75,3 +75,13 @@ class JSONSerializer(DictionarySerializer):
         thedict = loads(s_state)
         return super(JSONSerializer, self).deserialize_workflow(
             thedict, **kwargs)
+
+    def serialize_workflow_archive(self, archive, **kwargs):
+        thedict = super(JSONSerializer, self).serialize_workflow_archive(
+            archive, **kwargs)
+        return dumps(thedict)
+
+    def deserialize_workflow_archive(self, s_state, **kwargs):
+        thedict = loads(s_state)
+        return super(JSONSerializer, self).deserialize_workflow_archive(
+            thedict, **kwargs)
@@ -178,6 +178,9 @@ class XmlSerializer(Serializer):
         success = start_node.getAttribute('success').lower()
         times = start_node.getAttribute('times').lower()
         times_field = start_node.getAttribute('times-field').lower()
+        window = start_node.getAttribute('window').lower()
+        item_name = start_node.getAttribute('item-name')
+        parallel_safe = start_node.getAttribute('parallel-safe').lower()
         threshold = start_node.getAttribute('threshold').lower()
         threshold_field = start_node.getAttribute('threshold-field').lower()
         file = start_node.getAttribute('file').lower()
@@ -199,10 +202,16 @@ class XmlSerializer(Serializer):
             kwargs['cancel'] = True
         if success != '' and success != '0':
             kwargs['success'] = True
+        if parallel_safe != '' and parallel_safe != '0':
+            kwargs['parallel_safe'] = True
         if times != '':
             kwargs['times'] = int(times)
         if times_field != '':
             kwargs['times'] = operators.Attrib(times_field)
+        if window != '':
+            kwargs['window'] = int(window)
+        if item_name != '':
+            kwargs['item_name'] = item_name
         if threshold != '':
             kwargs['threshold'] = int(threshold)
         if threshold_field != '':
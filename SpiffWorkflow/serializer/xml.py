@@ -20,7 +20,10 @@ import warnings
 from lxml import etree
 from lxml.etree import SubElement
 from .. import Workflow, specs, operators
-from ..task import Task
+from ..archive import WorkflowArchive
+from ..task import Task, CompactedTask
+from ..history import get_history
+from ..ids import get_id_allocator, ThreadIdPool
 from ..operators import (Attrib, Assign, PathAttrib, Equal, NotEqual,
                          GreaterThan, LessThan, Match)
 from ..specs import (Cancel, AcquireMutex, CancelTask, Celery, Choose,
@@ -294,6 +297,8 @@ class XmlSerializer(Serializer):
             SubElement(elem, 'manual')
         if spec.internal:
             SubElement(elem, 'internal')
+        if spec.parallel_safe:
+            SubElement(elem, 'parallel-safe')
         SubElement(elem, 'lookahead').text = str(spec.lookahead)
         inputs = [t.name for t in spec.inputs]
         outputs = [t.name for t in spec.outputs]
@@ -319,6 +324,7 @@ class XmlSerializer(Serializer):
         spec.description = elem.findtext('description', spec.description)
         spec.manual = elem.findtext('manual', spec.manual)
         spec.internal = elem.find('internal') is not None
+        spec.parallel_safe = elem.find('parallel-safe') is not None
         spec.lookahead = int(elem.findtext('lookahead', spec.lookahead))
 
         data_elem = elem.find('data')
@@ -520,12 +526,21 @@ class XmlSerializer(Serializer):
     def serialize_multi_instance(self, spec):
         elem = etree.Element('multi-instance')
         self.serialize_value(SubElement(elem, 'times'), spec.times)
+        if spec.window is not None:
+            SubElement(elem, 'window').text = str(spec.window)
+        if spec.item_name is not None:
+            SubElement(elem, 'item-name').text = spec.item_name
         return self.serialize_task_spec(spec, elem)
 
     def deserialize_multi_instance(self, wf_spec, elem, cls=MultiInstance,
                                    **kwargs):
         times = self.deserialize_value(elem.find('times'))
+        window = elem.findtext('window')
+        if window is not None:
+            window = int(window)
         return self.deserialize_task_spec(wf_spec, elem, cls, times=times,
+                                          window=window,
+                                          item_name=elem.findtext('item-name'),
                                           **kwargs)
 
     def serialize_release_mutex(self, spec):
@@ -687,14 +702,34 @@ class XmlSerializer(Serializer):
         data_elem = SubElement(elem, 'data')
         self.serialize_value_map(data_elem, workflow.data)
 
+        id_allocator = workflow.id_allocator
         if workflow.last_task is not None:
-            SubElement(elem, 'last-task').text = str(workflow.last_task.id)
+            SubElement(elem, 'last-task').text = id_allocator.encode(
+                workflow.last_task.id)
 
         # outer_workflow
         # SubElement(elem, 'outer-workflow').text = workflow.outer_workflow.id
 
         if workflow.success:
             SubElement(elem, 'success')
+        history_elem = SubElement(elem, 'history')
+        history_elem.text = workflow.history.name
+        size = getattr(workflow.history, 'size', None)
+        if size is not None:
+            history_elem.set('size', str(size))
+        id_allocator_elem = SubElement(elem, 'id-allocator')
+        id_allocator_elem.text = id_allocator.name
+        id_allocator_state = id_allocator.get_state()
+        if id_allocator_state is not None:
+            instance, last_id = id_allocator_state
+            if instance is not None:
+                id_allocator_elem.set('instance', instance)
+            id_allocator_elem.set('last-id', str(last_id))
+        SubElement(elem, 'thread-id-pool').text = str(
+            workflow.thread_id_pool.last_id)
+        if workflow.compact_threshold is not None:
+            SubElement(elem, 'compact-threshold').text = str(
+                workflow.compact_threshold)
         task_tree_elem = SubElement(elem, 'task-tree')
         task_tree_elem.append(self.serialize_task(workflow.task_tree))
 
@@ -703,7 +738,29 @@ class XmlSerializer(Serializer):
     def deserialize_workflow(self, elem, **kwargs):
         wf_spec_elem = elem.find('spec')
         wf_spec = self.deserialize_workflow_spec(wf_spec_elem, **kwargs)
-        workflow = Workflow(wf_spec)
+        history = None
+        history_elem = elem.find('history')
+        if history_elem is not None:
+            size = history_elem.get('size')
+            history = get_history(history_elem.text,
+                                  int(size) if size is not None else None)
+        compact_threshold = elem.findtext('compact-threshold')
+        if compact_threshold is not None:
+            compact_threshold = int(compact_threshold)
+        id_allocator = None
+        id_allocator_elem = elem.find('id-allocator')
+        if id_allocator_elem is not None:
+            last_id = id_allocator_elem.get('last-id')
+            state = None
+            if last_id is not None:
+                state = [id_allocator_elem.get('instance'), int(last_id)]
+            id_allocator = get_id_allocator(id_allocator_elem.text, state)
+        thread_id_pool = ThreadIdPool(int(elem.findtext('thread-id-pool',
+                                                        '0')))
+        workflow = Workflow(wf_spec, history=history,
+                            id_allocator=id_allocator,
+                            thread_id_pool=thread_id_pool,
+                            compact_threshold=compact_threshold)
 
         workflow.data = self.deserialize_value_map(elem.find('data'))
         workflow.success = elem.find('success') is not None
@@ -716,16 +773,52 @@ class XmlSerializer(Serializer):
         workflow.task_tree = self.deserialize_task(workflow, task_tree_elem[0])
 
         # Re-connect parents
+        workflow._reindex_tasks()
         for task in workflow.get_tasks():
             task.parent = workflow.get_task(task.parent)
 
         # last_task
         last_task = elem.findtext('last-task')
         if last_task is not None:
-            workflow.last_task = workflow.get_task(last_task)
+            workflow.last_task = workflow.get_task(
+                workflow.id_allocator.decode(last_task))
+
+        # Creating the tasks above used up ids; restore the allocator.
+        if id_allocator is not None:
+            id_allocator.set_state(state)
 
         return workflow
 
+    def serialize_workflow_archive(self, archive, **kwargs):
+        assert isinstance(archive, WorkflowArchive)
+        elem = etree.Element('workflow-archive')
+        SubElement(elem, 'spec').text = archive.spec_name
+        if archive.success:
+            SubElement(elem, 'success')
+        path_elem = SubElement(elem, 'path')
+        for task in archive.path:
+            task_elem = SubElement(path_elem, 'task')
+            SubElement(task_elem, 'spec').text = task.task_spec_name
+            SubElement(task_elem, 'state').text = \
+                Task.state_names[task.state]
+            SubElement(task_elem, 'last-state-change').text = str(
+                task.last_state_change)
+        self.serialize_value_map(SubElement(elem, 'data'), archive.data)
+        return elem
+
+    def deserialize_workflow_archive(self, elem, **kwargs):
+        state_ids = dict((name, state)
+                         for state, name in Task.state_names.items())
+        path = []
+        for task_elem in elem.find('path'):
+            path.append((task_elem.findtext('spec'),
+                         state_ids[task_elem.findtext('state')],
+                         float(task_elem.findtext('last-state-change'))))
+        return WorkflowArchive(elem.findtext('spec'),
+                               elem.find('success') is not None,
+                               path,
+                               self.deserialize_value_map(elem.find('data')))
+
     def serialize_task(self, task, skip_children=False):
         assert isinstance(task, Task)
 
@@ -737,10 +830,12 @@ class XmlSerializer(Serializer):
         # We are not serializing task.workflow; the deserializer accepts
         # an already-deserialized Workflow instead.
         elem = etree.Element('task')
+        id_allocator = task.workflow.id_allocator
         if task.id is not None:
-            SubElement(elem, 'id').text = str(task.id)
+            SubElement(elem, 'id').text = id_allocator.encode(task.id)
         if task.parent is not None:
-            SubElement(elem, 'parent').text = str(task.parent.id)
+            SubElement(elem, 'parent').text = id_allocator.encode(
+                task.parent.id)
 
         if not skip_children:
             children_elem = SubElement(elem, 'children')
@@ -748,15 +843,34 @@ class XmlSerializer(Serializer):
                 child_elem = self.serialize_task(child)
                 children_elem.append(child_elem)
 
+        SubElement(elem, 'thread-id').text = str(task.thread_id)
         SubElement(elem, 'state').text = task.get_state_name()
         if task.triggered:
             SubElement(elem, 'triggered')
         SubElement(elem, 'spec').text = task.task_spec.name
         SubElement(elem, 'last-state-change').text = str(
             task.last_state_change)
-        self.serialize_value_map(SubElement(elem, 'data'), task.data)
+        # The slots are read directly, so that no history is allocated for
+        # tasks that do not have one yet.
+        if task._state_history:
+            state_history_elem = SubElement(elem, 'state-history')
+            for state in task._state_history:
+                SubElement(state_history_elem, 'state').text = \
+                    Task.state_names[state]
+        if task._log:
+            log_elem = SubElement(elem, 'log')
+            for message in task._log:
+                SubElement(log_elem, 'message').text = message
+        self.serialize_value_map(SubElement(elem, 'data'), task._peek_data())
         internal_data_elem = SubElement(elem, 'internal-data')
-        self.serialize_value_map(internal_data_elem, task.internal_data)
+        self.serialize_value_map(internal_data_elem,
+                                 task._internal_data or {})
+        if task._compacted:
+            compacted_elem = SubElement(elem, 'compacted')
+            for summary in task._compacted:
+                summary_elem = self.serialize_compacted_task(summary)
+                summary_elem.find('id').text = id_allocator.encode(summary.id)
+                compacted_elem.append(summary_elem)
 
         return elem
 
@@ -766,14 +880,19 @@ class XmlSerializer(Serializer):
         task_spec_name = elem.findtext('spec')
         task_spec = workflow.get_task_spec_from_name(task_spec_name)
         task = Task(workflow, task_spec)
-        task.id = elem.findtext('id')
+        id_allocator = workflow.id_allocator
+        task.id = id_allocator.decode(elem.findtext('id'))
         # The parent is later resolved by the workflow deserializer
-        task.parent = elem.findtext('parent')
+        task.parent = id_allocator.decode(elem.findtext('parent'))
 
         for child_elem in elem.find('children'):
             child_task = self.deserialize_task(workflow, child_elem)
             task.children.append(child_task)
 
+        thread_id = elem.findtext('thread-id')
+        if thread_id is not None:
+            task._thread_id = int(thread_id)
+
         state_name = elem.findtext('state')
         found = False
         for key, value in list(Task.state_names.items()):
@@ -784,8 +903,55 @@ class XmlSerializer(Serializer):
         assert found
         task.triggered = elem.find('triggered') is not None
         task.last_state_change = float(elem.findtext('last-state-change'))
-        task.data = self.deserialize_value_map(elem.find('data'))
+        state_history_elem = elem.find('state-history')
+        if state_history_elem is not None and len(state_history_elem):
+            state_ids = dict((name, state)
+                             for state, name in Task.state_names.items())
+            task.state_history = [state_ids[state_elem.text]
+                                  for state_elem in state_history_elem]
+        log_elem = elem.find('log')
+        if log_elem is not None and len(log_elem):
+            task.log = [message_elem.text for message_elem in log_elem]
+        data = self.deserialize_value_map(elem.find('data'))
+        if data:
+            task.data = data
         internal_data_elem = elem.find('internal-data')
-        task.internal_data = self.deserialize_value_map(internal_data_elem)
+        internal_data = self.deserialize_value_map(internal_data_elem)
+        if internal_data:
+            task.internal_data = internal_data
+        compacted_elem = elem.find('compacted')
+        if compacted_elem is not None:
+            task._compacted = [self.deserialize_compacted_task(summary_elem)
+                               for summary_elem in compacted_elem]
+            for summary in task._compacted:
+                summary.id = id_allocator.decode(summary.id)
 
         return task
+
+    def serialize_compacted_task(self, summary):
+        elem = etree.Element('compacted-task')
+        SubElement(elem, 'id').text = str(summary.id)
+        SubElement(elem, 'spec').text = summary.task_spec_name
+        SubElement(elem, 'state').text = Task.state_names[summary.state]
+        SubElement(elem, 'last-state-change').text = str(
+            summary.last_state_change)
+        SubElement(elem, 'finished').text = str(summary.finished)
+        SubElement(elem, 'size').text = str(summary.size)
+        if summary.data is not None:
+            self.serialize_value_map(SubElement(elem, 'data'), summary.data)
+        return elem
+
+    def deserialize_compacted_task(self, elem):
+        state_ids = dict((name, state)
+                         for state, name in Task.state_names.items())
+        data_elem = elem.find('data')
+        data = None
+        if data_elem is not None:
+            data = self.deserialize_value_map(data_elem)
+        return CompactedTask(elem.findtext('id'),
+                             elem.findtext('spec'),
+                             state_ids[elem.findtext('state')],
+                             float(elem.findtext('last-state-change')),
+                             float(elem.findtext('finished')),
+                             int(elem.findtext('size')),
+                             data)
@@ -17,6 +17,7 @@ from __future__ import division, absolute_import
 # Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,MA  02110-1301  USA
 from ..task import Task
 from .base import TaskSpec
+from .ReleaseMutex import ReleaseMutex
 
 
 class AcquireMutex(TaskSpec):
@@ -47,6 +48,12 @@ class AcquireMutex(TaskSpec):
         TaskSpec.__init__(self, wf_spec, name, **kwargs)
         self.mutex = mutex
 
+    def _get_wakeup_keys(self, my_task):
+        # The mutex is only ever released by a ReleaseMutex task.
+        return [spec for spec in my_task.workflow.spec.task_specs.values()
+                if isinstance(spec, ReleaseMutex) and
+                spec.mutex == self.mutex]
+
     def _update_hook(self, my_task):
         mutex = my_task.workflow._get_mutex(self.mutex)
         if mutex.testandset():
@@ -246,6 +246,10 @@ class Celery(TaskSpec):
                                            my_task.get_name()))
             return False
 
+    def _get_wakeup_keys(self, my_task):
+        # The result of the call is polled; see Workflow.complete_next().
+        return []
+
     def _update_hook(self, my_task):
         if not self._start(my_task):
             if not my_task._has_state(Task.WAITING):
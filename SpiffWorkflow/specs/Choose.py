@@ -16,6 +16,7 @@ from __future__ import division, absolute_import
 # License along with this library; if not, write to the Free Software
 # Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA
 # 02110-1301  USA
+from ..task import Task
 from .base import TaskSpec
 from .Trigger import Trigger
 
@@ -55,15 +56,19 @@ class Choose(Trigger):
         self.context = context
         self.choice = choice is not None and choice or []
 
+    def _get_inspected_specs(self):
+        return [self._wf_spec.get_task_spec_from_name(self.context)]
+
     def _on_complete_hook(self, my_task):
         context = my_task.workflow.get_task_spec_from_name(self.context)
         triggered = []
-        for task in my_task.workflow.task_tree:
-            if task.thread_id != my_task.thread_id:
-                continue
-            if task.task_spec == context:
-                task.trigger(self.choice)
-                triggered.append(task)
+        def is_context(task):
+            return (task.thread_id == my_task.thread_id and
+                    task.task_spec == context)
+        for task in Task.Iterator(my_task.workflow.task_tree,
+                                  predicate=is_context):
+            task.trigger(self.choice)
+            triggered.append(task)
         for task in triggered:
             context._predict(task)
         TaskSpec._on_complete_hook(self, my_task)
@@ -70,6 +70,10 @@ class Execute(TaskSpec):
                 return True
         return False
 
+    def _get_wakeup_keys(self, my_task):
+        # The process is polled; see Workflow.complete_next().
+        return []
+
     def _update_hook(self, my_task):
         if not self._start(my_task):
             my_task.state = Task.WAITING
@@ -51,6 +51,12 @@ class Gate(TaskSpec):
         TaskSpec.__init__(self, wf_spec, name, **kwargs)
         self.context = context
 
+    def _get_wakeup_keys(self, my_task):
+        return [my_task.workflow.get_task_spec_from_name(self.context)]
+
+    def _get_inspected_specs(self):
+        return [self._wf_spec.get_task_spec_from_name(self.context)]
+
     def _update_hook(self, my_task):
         context_task = my_task.workflow.get_task_spec_from_name(self.context)
         root_task = my_task.workflow.task_tree
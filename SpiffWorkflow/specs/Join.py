@@ -131,15 +131,11 @@ class Join(TaskSpec):
         if threshold is None:
             threshold = len(self.inputs)
 
-        # Look at the tree to find all places where this task is used.
+        # Look up all places where this task is used.
         tasks = []
         for input in self.inputs:
-            for task in my_task.workflow.task_tree:
-                if task.thread_id != my_task.thread_id:
-                    continue
-                if task.task_spec != input:
-                    continue
-                tasks.append(task)
+            tasks.extend(my_task.workflow._get_tasks_from_spec(
+                input, my_task.thread_id))
 
         # Look up which tasks have already completed.
         waiting_tasks = []
@@ -160,16 +156,17 @@ class Join(TaskSpec):
         if split_task is None:
             msg = 'Join with %s, which was not reached' % self.split_task
             raise WorkflowException(self, msg)
-        tasks = split_task.task_spec._get_activated_tasks(split_task, my_task)
+        split_spec = split_task.task_spec
+        tasks = split_spec._get_activated_tasks(split_task, my_task)
 
         # The default threshold is the number of branches that were started.
         threshold = valueof(my_task, self.threshold)
         if threshold is None:
-            threshold = len(tasks)
+            threshold = split_spec._get_branch_count(split_task, tasks)
 
         # Look up which tasks have already completed.
         waiting_tasks = []
-        completed = 0
+        completed = split_spec._get_merged_count(split_task)
         for task in tasks:
             # Refresh path prediction.
             task.task_spec._predict(task)
@@ -201,10 +198,45 @@ class Join(TaskSpec):
             return self._check_threshold_unstructured(my_task, force)
         return self._check_threshold_structured(my_task, force)
 
+    def _get_wakeup_keys(self, my_task):
+        # A structured join depends on every task in the incoming branches.
+        if self.split_task is not None:
+            return None
+        return self.inputs
+
+    def _get_inspected_specs(self):
+        # All instances of the join are looked up when it fires, and an
+        # unstructured join counts the completed inputs. A structured join
+        # looks up the split among its ancestors, and looks at every branch
+        # that was started by it.
+        if self.split_task is None:
+            return [self] + self.inputs
+        split_task = self._wf_spec.get_task_spec_from_name(self.split_task)
+        return [self, split_task] + split_task.outputs
+
+    def _branch_was_merged(self, my_task):
+        # Whether the split already accounted for the branch of this task,
+        # see TaskSpec._branches_changed().
+        if self.split_task is None:
+            return False
+        task = my_task.parent
+        while task is not None and task.task_spec.name != self.split_task:
+            if task._get_internal_data('merged'):
+                return True
+            task = task.parent
+        return False
+
     def _update_hook(self, my_task):
         # Check whether enough incoming branches have completed.
         may_fire, waiting_tasks = self._start(my_task)
         if not may_fire:
+            # There is no need to look at a branch that the split has
+            # accounted for again, so it is completed like the instances
+            # that do not continue when the join fires.
+            if self._branch_was_merged(my_task):
+                my_task.state = Task.COMPLETED
+                my_task._drop_children()
+                return
             my_task._set_state(Task.WAITING)
             return
 
@@ -240,6 +272,7 @@ class Join(TaskSpec):
             split_task = my_task.workflow.get_task_spec_from_name(
                 self.split_task)
             split_task = my_task._find_ancestor(split_task)
+            split_task.task_spec._branches_joined(split_task)
         else:
             split_task = my_task.workflow.task_tree
 
@@ -286,9 +319,8 @@ class Join(TaskSpec):
         May be called to fire the Join before the incoming branches are
         completed.
         """
-        for task in my_task.workflow.task_tree._find_any(self):
-            if task.thread_id != my_task.thread_id:
-                continue
+        for task in my_task.workflow._get_tasks_from_spec(
+                self, my_task.thread_id):
             self._do_join(task)
 
     def serialize(self, serializer):
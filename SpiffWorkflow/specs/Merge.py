@@ -18,6 +18,7 @@ from __future__ import division, absolute_import
 # 02110-1301  USA
 import logging
 
+from ..task import Task
 from .Join import Join
 from ..util import merge_dictionary
 
@@ -30,18 +31,24 @@ class Merge(Join):
 
     Note: data fields that have conflicting names will be overwritten"""
 
+    def _get_inspected_specs(self):
+        # The data of all inputs is merged.
+        specs = super(Merge, self)._get_inspected_specs()
+        return specs + [spec for spec in self.inputs if spec not in specs]
+
     def _do_join(self, my_task):
         # Merge all inputs (in order)
         for input_spec in self.inputs:
-            tasks = [task for task in my_task.workflow.task_tree
-                     if task.task_spec is input_spec]
+            tasks = Task.Iterator(
+                my_task.workflow.task_tree,
+                predicate=lambda task: task.task_spec is input_spec)
             for task in tasks:
                 LOG.debug("Merging %s (%s) into %s" % (task.get_name(),
                                                        task.get_state_name(
                 ), self.name),
-                    extra=dict(data=task.data))
-                _log_overwrites(my_task.data, task.data)
-                merge_dictionary(my_task.data, task.data)
+                    extra=dict(data=task._peek_data()))
+                _log_overwrites(my_task.data, task._peek_data())
+                merge_dictionary(my_task.data, task._peek_data())
         return super(Merge, self)._do_join(my_task)
 
     @classmethod
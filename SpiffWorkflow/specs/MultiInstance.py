@@ -1,6 +1,5 @@
 # -*- coding: utf-8 -*-
 from __future__ import division, absolute_import
-from builtins import range
 # Copyright (C) 2007 Samuel Abels
 #
 # This library is free software; you can redistribute it and/or
@@ -17,9 +16,28 @@ from builtins import range
 # License along with this library; if not, write to the Free Software
 # Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA
 # 02110-1301  USA
+from itertools import islice
 from ..task import Task
 from .base import TaskSpec
-from ..operators import valueof
+from .Join import Join
+from ..operators import Term, valueof
+
+
+class _ItemStream(object):
+
+    """
+    The items of a MultiInstance task that were not yet pulled. A pickle
+    does not keep the iterator; the items are then taken again from their
+    source, see MultiInstance._pull_items().
+    """
+
+    def __init__(self, times=None, iterator=None, position=-1):
+        self.times = times
+        self.iterator = iterator
+        self.position = position
+
+    def __reduce__(self):
+        return _ItemStream, ()
 
 
 class MultiInstance(TaskSpec):
@@ -31,10 +49,21 @@ class MultiInstance(TaskSpec):
     If more than one input is connected, the task performs an implicit
     multi merge.
 
+    If a window is given, the instances are created lazily: no more than
+    that many instances are in flight at a time, and a new instance is
+    started whenever the branch of an instance completed, or reached a
+    Join. The items are taken per workflow, from the task data or from a
+    callable, and an iterator is only consumed as the instances are
+    started. The number of instances that were started is kept with the
+    task, so a restored workflow resumes at the same item. Once a
+    structured :class:`Join` that uses this task as its context fired, no
+    more instances are started.
+
     This task has one or more inputs and may have any number of outputs.
     """
 
-    def __init__(self, wf_spec, name, times, **kwargs):
+    def __init__(self, wf_spec, name, times, window=None, item_name=None,
+                 **kwargs):
         """
         Constructor.
 
@@ -42,23 +71,44 @@ class MultiInstance(TaskSpec):
         :param wf_spec: A reference to the workflow specification.
         :type  name: str
         :param name: The name of the task spec.
-        :type  times: int or :class:`SpiffWorkflow.operators.Term`
-        :param times: The number of tasks to create.
+        :type  times: int, iterable, callable or
+                      :class:`SpiffWorkflow.operators.Term`
+        :param times: The number of tasks to create, or an iterable that
+                      yields one item per instance. A callable is passed
+                      the task and returns either; this way, each workflow
+                      gets its own iterator.
+        :type  window: int
+        :param window: If given, the maximum number of instances that are
+                       in flight at a time.
+        :type  item_name: str
+        :param item_name: If given, and times is an iterable, every instance
+                          receives its item in the data field of this name.
         :type  kwargs: dict
         :param kwargs: See :class:`SpiffWorkflow.specs.TaskSpec`.
         """
         if times is None:
             raise ValueError('times argument is required')
+        if window is not None and window < 1:
+            raise ValueError('window must be at least 1')
+        if hasattr(times, '__iter__') and iter(times) is times:
+            raise ValueError('times must not be an iterator, as all'
+                             ' workflows would consume it; pass a callable'
+                             ' that returns one instead')
         TaskSpec.__init__(self, wf_spec, name, **kwargs)
         self.times = times
+        self.window = window
+        self.item_name = item_name
+
+    def __setstate__(self, state):
+        self.window = None
+        self.item_name = None
+        TaskSpec.__setstate__(self, state)
 
     def _find_my_task(self, task):
-        for thetask in task.workflow.task_tree:
-            if thetask.thread_id != task.thread_id:
-                continue
-            if thetask.task_spec == self:
-                return thetask
-        return None
+        tasks = task.workflow._get_tasks_from_spec(self, task.thread_id)
+        if not tasks:
+            return None
+        return tasks[0]
 
     def _on_trigger(self, task_spec):
         """
@@ -76,34 +126,258 @@ class MultiInstance(TaskSpec):
             new_task.triggered = True
             output._predict(new_task)
 
-    def _get_predicted_outputs(self, my_task):
-        split_n = int(valueof(my_task, self.times, 1))
+    def _get_times(self, my_task):
+        stream = getattr(my_task, 'item_stream', None)
+        if stream is not None and stream.times is not None:
+            return stream.times
+        if self._is_callable():
+            times = self.times(my_task)
+        else:
+            times = valueof(my_task, self.times, 1)
+        # Strings and other values that are not iterable are a count.
+        if isinstance(times, (str, bytes)) or not hasattr(times, '__iter__'):
+            return int(times)
+        return times
+
+    def _is_callable(self):
+        return callable(self.times) and not isinstance(self.times, Term)
+
+    def _is_sequence(self, times):
+        return hasattr(times, '__len__') and \
+            hasattr(times, '__getitem__') and not hasattr(times, 'keys')
+
+    def _get_items(self, my_task):
+        """
+        Returns all items, or None if times is a count. An iterable that is
+        not a sequence is consumed, and its items are kept with the task.
+        """
+        items = my_task._get_internal_data('items')
+        if items is not None:
+            return items
+        times = self._get_times(my_task)
+        if isinstance(times, int):
+            return None
+        if self._is_sequence(times):
+            return times
+        items = list(times)
+        my_task._set_internal_data(items=items)
+        return items
+
+    def _pull_items(self, my_task, first, count):
+        """
+        Returns the items of up to the given number of instances, the first
+        of which is the instance with the given number, or None if times is
+        a count. Fewer items are returned once the items run out.
+        """
+        times = self._get_times(my_task)
+        if isinstance(times, int):
+            return None
+        if self._is_sequence(times):
+            last = min(len(times), first + count)
+            return [times[n] for n in range(first, last)]
+
+        # The task keeps the iterator. If it does not have it at the given
+        # position, e.g. because the workflow was restored, the items are
+        # taken again from their source; an iterator from the task data is
+        # consumed where it stands.
+        stream = getattr(my_task, 'item_stream', None)
+        if stream is None or stream.position != first:
+            iterator = iter(times)
+            if iterator is not times or self._is_callable():
+                iterator = islice(iterator, first, None)
+            stream = _ItemStream(times, iterator, first)
+            my_task.item_stream = stream
+        items = list(islice(stream.iterator, count))
+        stream.position += len(items)
+        return items
+
+    def _get_split_count(self, my_task):
+        """
+        Returns the number of instances, or None if the window is used with
+        an iterator that did not yet run out.
+        """
+        times = self._get_times(my_task)
+        if isinstance(times, int):
+            return times
+        if self.window is None:
+            return len(self._get_items(my_task))
+        if hasattr(times, '__len__'):
+            return len(times)
+        splits = my_task._get_internal_data('splits')
+        if splits is None:
+            return None
+        return int(splits)
+
+    def _get_initial_count(self, split_n):
+        # The number of instances that are created up front.
+        if self.window is None:
+            return split_n
+        if split_n is None:
+            return self.window
+        return min(self.window, split_n)
 
-        # Predict the outputs.
-        outputs = []
-        for i in range(split_n):
-            outputs += self.outputs
-        return outputs
+    def _set_items(self, children, items):
+        """
+        Passes the given items to the given new instances.
+        """
+        if self.item_name is None or items is None:
+            return
+        n_outputs = len(self.outputs)
+        for n, child in enumerate(children):
+            child.set_data(**{self.item_name: items[n // n_outputs]})
 
     def _predict_hook(self, my_task):
-        split_n = int(valueof(my_task, self.times, 1))
-        my_task._set_internal_data(splits=split_n)
-
-        # Create the outgoing tasks.
-        outputs = []
-        for i in range(split_n):
-            outputs += self.outputs
-        if my_task._is_definite():
+        split_n = self._get_split_count(my_task)
+
+        # Create the outgoing tasks. While the number of items is not
+        # known, the instances may not be created after all.
+        outputs = self.outputs * self._get_initial_count(split_n)
+        if my_task._is_definite() and split_n is not None:
             my_task._sync_children(outputs, Task.FUTURE)
         else:
             my_task._sync_children(outputs, Task.LIKELY)
 
     def _on_complete_hook(self, my_task):
-        outputs = self._get_predicted_outputs(my_task)
-        my_task._sync_children(outputs, Task.FUTURE)
+        count = self._get_initial_count(self._get_split_count(my_task))
+        if self.window is None:
+            items = self._get_items(my_task)
+        else:
+            items = self._pull_items(my_task, 0, count)
+            if items is not None and len(items) < count:
+                count = len(items)
+                my_task._set_internal_data(splits=count)
+            my_task._set_internal_data(started=count, merged=0, first_open=0)
+        my_task._sync_children(self.outputs * count, Task.FUTURE)
+        children = [child for child in my_task.children
+                    if not child.triggered]
+        self._set_items(children, items)
+        if self._watches_branches(my_task):
+            my_task.workflow._watch_branches(my_task)
         for child in my_task.children:
             child.task_spec._update(child)
 
+    def _get_activated_tasks(self, my_task, destination):
+        if self.window is None:
+            return my_task.children
+        # Only the branches that were not yet merged.
+        first_open = int(my_task._get_internal_data('first_open', 0))
+        return [child for child in my_task.children[first_open:]
+                if not child._get_internal_data('merged')]
+
+    def _get_branch_count(self, my_task, tasks):
+        if self.window is None:
+            return len(tasks)
+        splits = self._get_split_count(my_task)
+        started = int(my_task._get_internal_data('started', 0))
+        # While the items have not run out, one more may follow.
+        remaining = 1 if splits is None else splits - started
+        return len(my_task.children) + remaining * len(self.outputs)
+
+    def _get_merged_count(self, my_task):
+        if self.window is None:
+            return 0
+        return int(my_task._get_internal_data('merged', 0))
+
+    def _watches_branches(self, my_task):
+        if self.window is None or my_task._get_internal_data('joined'):
+            return False
+        splits = self._get_split_count(my_task)
+        started = int(my_task._get_internal_data('started', 0))
+        merged = int(my_task._get_internal_data('merged', 0))
+        return splits is None or started < splits or \
+            merged < len(my_task.children)
+
+    def _branches_changed(self, my_task, tasks):
+        children = my_task.children
+        first_open = int(my_task._get_internal_data('first_open', 0))
+        branches = [child for child in children[first_open:]
+                    if not child._get_internal_data('merged')]
+
+        # Find the branches that the changed tasks belong to.
+        changed = set()
+        for task in tasks:
+            for branch in branches:
+                if task is branch or task._is_descendant_of(branch):
+                    changed.add(branch)
+                    break
+        finished = [branch for branch in branches
+                    if branch in changed and self._branch_is_finished(branch)]
+        if finished:
+            self._merge_branches(my_task, finished)
+
+        # Refill the window.
+        merged = int(my_task._get_internal_data('merged', 0))
+        n_outputs = len(self.outputs)
+        in_flight = (len(children) - merged + n_outputs - 1) // n_outputs
+        self._start_instances(my_task, self.window - in_flight)
+        if not self._watches_branches(my_task):
+            my_task.workflow._unwatch_branches(my_task)
+
+    def _branch_is_finished(self, branch):
+        # Whether no task of the branch remains to be done. A branch that
+        # reached a join is finished, whatever follows the join.
+        join = None
+        for task in Task.Iterator(branch,
+                                  Task.FUTURE | Task.WAITING | Task.READY):
+            if join is not None and task._is_descendant_of(join):
+                continue
+            if task._state != Task.FUTURE and \
+                    isinstance(task.task_spec, Join):
+                join = task
+                continue
+            return False
+        return True
+
+    def _merge_branches(self, my_task, tasks):
+        """
+        Accounts for the given finished branches, such that a structured
+        join never visits them again; see Join._branch_was_merged().
+        """
+        for task in tasks:
+            task._set_internal_data(merged=1)
+        merged = int(my_task._get_internal_data('merged', 0)) + len(tasks)
+
+        # Skip the leading branches that are merged.
+        children = my_task.children
+        first_open = int(my_task._get_internal_data('first_open', 0))
+        while first_open < len(children) and \
+                children[first_open]._get_internal_data('merged'):
+            first_open += 1
+        my_task._set_internal_data(merged=merged, first_open=first_open)
+
+    def _branches_joined(self, my_task):
+        if self.window is None:
+            return
+        my_task._set_internal_data(joined=1)
+        my_task.workflow._unwatch_branches(my_task)
+
+    def _start_instances(self, my_task, count):
+        """
+        Starts up to the given number of instances that are not yet
+        started, and returns their tasks.
+        """
+        if count <= 0 or my_task._get_internal_data('joined'):
+            return []
+        started = int(my_task._get_internal_data('started', 0))
+        splits = self._get_split_count(my_task)
+        if splits is not None:
+            count = min(count, splits - started)
+        if count <= 0:
+            return []
+        items = self._pull_items(my_task, started, count)
+        if items is not None and len(items) < count:
+            # The items ran out.
+            count = len(items)
+            my_task._set_internal_data(splits=started + count)
+            if count == 0:
+                return []
+        children = my_task._add_children(self.outputs * count, Task.FUTURE)
+        self._set_items(children, items)
+        my_task._set_internal_data(started=started + count)
+        for child in children:
+            child.task_spec._update(child)
+        return children
+
     def serialize(self, serializer):
         return serializer.serialize_multi_instance(self)
 
@@ -106,9 +106,7 @@ class SubWorkflow(TaskSpec):
         for child in my_task.children:
             child.task_spec._update(child)
             child._inherit_data()
-        for child in subworkflow.task_tree.children:
-            my_task.children.insert(0, child)
-            child.parent = my_task
+        my_task._graft(subworkflow, subworkflow.task_tree.children)
 
         my_task._set_internal_data(subworkflow=subworkflow)
 
@@ -99,6 +99,13 @@ class ThreadSplit(TaskSpec):
         """
         return my_task.children
 
+    def _get_inspected_specs(self):
+        # The thread starter is looked up among the ancestors of a branch
+        # when it is joined.
+        if self.thread_starter is not None:
+            return [self.thread_starter]
+        return self.outputs[:1]
+
     def _on_trigger(self, my_task):
         """
         May be called after execute() was already completed to create an
@@ -57,6 +57,11 @@ class Trigger(TaskSpec):
         self.times = times
         self.queued = 0
 
+    def _get_inspected_specs(self):
+        # Triggered specs look up their (possibly finished) tasks.
+        return [self._wf_spec.get_task_spec_from_name(name)
+                for name in self.context]
+
     def _on_trigger(self, my_task):
         """
         Enqueue a trigger, such that this tasks triggers multiple times later
@@ -65,13 +70,13 @@ class Trigger(TaskSpec):
         self.queued += 1
         # All tasks that have already completed need to be put back to
         # READY.
-        for thetask in my_task.workflow.task_tree:
-            if thetask.thread_id != my_task.thread_id:
-                continue
-            if (thetask.task_spec == self and
-                    thetask._has_state(Task.COMPLETED)):
-                thetask._set_state(Task.FUTURE, True)
-                thetask._ready()
+        def is_mine(thetask):
+            return (thetask.thread_id == my_task.thread_id and
+                    thetask.task_spec == self)
+        for thetask in Task.Iterator(my_task.workflow.task_tree,
+                                     Task.COMPLETED, predicate=is_mine):
+            thetask._set_state(Task.FUTURE, True)
+            thetask._ready()
 
     def _on_complete_hook(self, my_task):
         """
@@ -95,6 +95,10 @@ class TaskSpec(object):
         :param pre_assign: a list of name/value pairs
         :type  post_assign: list((str, object))
         :param post_assign: a list of name/value pairs
+        :type  parallel_safe: bool
+        :param parallel_safe: Whether the work of the task (see
+                     _get_work()) may run on the executor of the workflow,
+                     concurrently with that of other tasks.
         """
         assert wf_spec is not None
         assert name is not None
@@ -111,6 +115,7 @@ class TaskSpec(object):
         self.pre_assign = kwargs.get('pre_assign',  [])
         self.post_assign = kwargs.get('post_assign', [])
         self.locks = kwargs.get('lock',        [])
+        self.parallel_safe = kwargs.get('parallel_safe', False)
         self.lookahead = 2  # Maximum number of MAYBE predictions.
 
         # Events.
@@ -125,6 +130,11 @@ class TaskSpec(object):
         self.data.update(self.defines)
         assert self.id is not None
 
+    def __setstate__(self, state):
+        # Pickles of older versions lack the attributes added since.
+        self.parallel_safe = False
+        self.__dict__.update(state)
+
     def _connect_notify(self, taskspec):
         """
         Called by the previous task to let us know that it exists.
@@ -161,6 +171,69 @@ class TaskSpec(object):
         """
         return my_task.children
 
+    def _get_branch_count(self, my_task, tasks):
+        """
+        Returns the number of branches that a structured join waits for,
+        by default the number of tasks that were activated.
+
+        :type  my_task: Task
+        :param my_task: The associated task in the task tree.
+        :type  tasks: list(Task)
+        :param tasks: The tasks returned by _get_activated_tasks().
+        :rtype:  integer
+        :returns: The number of branches.
+        """
+        return len(tasks)
+
+    def _get_merged_count(self, my_task):
+        """
+        Returns the number of branches that were merged by a structured
+        join, and that are therefore no longer activated tasks.
+
+        :type  my_task: Task
+        :param my_task: The associated task in the task tree.
+        :rtype:  integer
+        :returns: The number of merged branches.
+        """
+        return 0
+
+    def _watches_branches(self, my_task):
+        """
+        Returns True if the completed task watches its branches, see
+        Workflow._watch_branches(). Used to restore the watch after
+        deserializing.
+
+        :type  my_task: Task
+        :param my_task: The associated task in the task tree.
+        :rtype:  bool
+        :returns: Whether _branches_changed() needs to be called.
+        """
+        return False
+
+    def _branches_changed(self, my_task, tasks):
+        """
+        Called after a task completed if the workflow was asked to watch the
+        branches of the given task. A split that starts its branches lazily
+        may start new ones here.
+
+        :type  my_task: Task
+        :param my_task: The associated task in the task tree.
+        :type  tasks: list(Task)
+        :param tasks: The tasks of the workflow that became WAITING or
+                      finished since the last call.
+        """
+        pass
+
+    def _branches_joined(self, my_task):
+        """
+        Called by a structured join that uses the given task as its context
+        when it fires.
+
+        :type  my_task: Task
+        :param my_task: The associated task in the task tree.
+        """
+        pass
+
     def _get_activated_threads(self, my_task):
         """
         Returns the list of threads that were activated in the previous
@@ -300,6 +373,41 @@ class TaskSpec(object):
         self.entered_event.emit(my_task.workflow, my_task)
         my_task._ready()
 
+    def _get_wakeup_keys(self, my_task):
+        """
+        Returns what a WAITING task of this spec waits on, such that the
+        workflow only re-evaluates the task (by calling _update()) when
+        one of those things happened.
+
+        The returned keys are task specs: the task is re-evaluated
+        whenever a task of one of the specs completes. An empty list means
+        that the task waits for something outside of the workflow (a
+        message, or an external process), and is only re-evaluated when
+        explicitly asked to, for example by
+        :meth:`SpiffWorkflow.Workflow.complete_next`.
+
+        The default, None, means that the task is re-evaluated whenever
+        any task in the workflow completes.
+
+        :type  my_task: Task
+        :param my_task: The associated task in the task tree.
+        :rtype:  list(TaskSpec)|None
+        :returns: The specs of the tasks that the task waits on.
+        """
+        return None
+
+    def _get_inspected_specs(self):
+        """
+        Returns the task specs whose tasks this spec may still look at, or
+        modify, after they finished, e.g. by looking up an ancestor. Such
+        tasks are never removed by :meth:`SpiffWorkflow.Workflow.compact`,
+        though finished subtrees underneath them may be.
+
+        :rtype:  list(TaskSpec)
+        :returns: The inspected task specs.
+        """
+        return []
+
     def _on_ready(self, my_task):
         """
         Return True on success, False otherwise.
@@ -420,6 +528,60 @@ class TaskSpec(object):
         for child in my_task.children:
             child.task_spec._update(child)
 
+    def _get_work(self, my_task):
+        """
+        Returns the work that completing the given task involves, such as
+        running a script or calling a service, or None if there is none.
+        Specs that have work run it from _on_complete_hook() using
+        _run_work().
+
+        If the spec is parallel_safe and the workflow has an executor, the
+        work is started on the executor as soon as the task is READY, and
+        may run on another thread or process. It must therefore not touch
+        the task tree, and, for a process pool, must be picklable.
+
+        :type  my_task: Task
+        :param my_task: The associated task in the task tree.
+        :rtype:  callable
+        :returns: A callable without arguments whose result is passed to
+                  _set_work_result().
+        """
+        return None
+
+    def _set_work_result(self, my_task, result):
+        """
+        Applies the result of the work of the given task on the engine
+        thread. By default, the result is None, or a dict of data fields
+        that are set on the task.
+
+        :type  my_task: Task
+        :param my_task: The associated task in the task tree.
+        :type  result: object
+        :param result: What the work returned.
+        """
+        if result:
+            my_task.set_data(**result)
+
+    def _run_work(self, my_task):
+        """
+        Runs the work of the given task (see _get_work()) and applies its
+        result. If the work was already started on the executor of the
+        workflow, waits for it instead; an error raised by the work is
+        raised here, on the engine thread.
+
+        :type  my_task: Task
+        :param my_task: The associated task in the task tree.
+        """
+        future = my_task.workflow._work.pop(my_task, None)
+        if future is not None:
+            result = future.result()
+        else:
+            work = self._get_work(my_task)
+            if work is None:
+                return
+            result = work()
+        self._set_work_result(my_task, result)
+
     @abstractmethod
     def serialize(self, serializer, **kwargs):
         """
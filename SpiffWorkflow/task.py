@@ -22,11 +22,112 @@ from builtins import object
 # 02110-1301  USA
 import logging
 import time
-from uuid import uuid4
 from .exceptions import WorkflowException
 
 LOG = logging.getLogger(__name__)
 
+# The initial range of the labels of a root task is 2**_LABEL_BITS. See
+# Task._child_added_notify().
+_LABEL_BITS = 32
+
+# The maximum density of a relabeled range of 2**n labels is
+# 1 / _LABEL_DENSITY**n, where 1 < _LABEL_DENSITY < 2. Lower values relabel
+# more often, higher values need longer labels. See Task._insert_labels().
+_LABEL_DENSITY = 1.5
+
+# The room that is left on either side of a new child, and in between the
+# labels of a subtree that was relabeled by Task._make_room().
+_LABEL_STEP = 1 << 8
+
+# Maps the attribute names used by pickles of older versions to the slots
+# that now hold the values.
+_LEGACY_NAMES = {'thread_id': '_thread_id',
+                 'children': '_children',
+                 'state_history': '_state_history',
+                 'log': '_log',
+                 'data': '_data',
+                 'internal_data': '_internal_data'}
+
+
+def _get_label(label):
+    task, right = label
+    return task._right if right else task._left
+
+
+def _walk_labels(label, forward):
+    """
+    Yields the labels that follow (or precede) the given one, in the order
+    of a tree walk in which each task appears once for its left and once
+    for its right label.
+
+    :type  label: (Task, bool)
+    :param label: The task and side (True for right) of the label.
+    :type  forward: bool
+    :param forward: Whether to walk forward.
+    """
+    task, right = label
+    while True:
+        if right == forward:
+            # Leave the task towards its sibling or parent.
+            parent = task.parent
+            if parent is None:
+                return
+            siblings = parent._children
+            pos = _find_child(siblings, task)
+            pos += 1 if forward else -1
+            if 0 <= pos < len(siblings):
+                task, right = siblings[pos], not forward
+            else:
+                task, right = parent, forward
+        elif task._children:
+            # Enter the task towards its first (or last) child.
+            task = task._children[0 if forward else -1]
+        else:
+            right = forward
+        yield task, right
+
+
+def _find_child(children, child):
+    # The children are sorted by their labels.
+    lo, hi = 0, len(children)
+    left = child._left
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if children[mid]._left < left:
+            lo = mid + 1
+        else:
+            hi = mid
+    return lo
+
+
+def _extend_labels(labels, walk, in_range):
+    """
+    Appends labels from the given walk to the given list while they are
+    in range, and returns how many labels of the list are in range. Only
+    the last label in the list may be out of range.
+    """
+    while in_range(_get_label(labels[-1])):
+        label = next(walk, None)
+        if label is None:
+            return len(labels)
+        labels.append(label)
+    return len(labels) - 1
+
+
+def _pack_labels(labels, value, step):
+    """
+    Assigns new values to the given labels, starting with the given value
+    and incrementing by the given step, and returns the value after the
+    last one.
+    """
+    for task, right in labels:
+        if right:
+            task._right = value
+        else:
+            task._left = value
+        value += step
+    return value
+
 
 class Task(object):
 
@@ -78,6 +179,11 @@ class Task(object):
     those tasks may be removed from the tree at runtime later. They are
     created to allow for visualizing the workflow at a time where
     the required decisions have not yet been made.
+
+    Tasks are kept compact, because a workflow may consist of many of them
+    and most are only predictions that never run: the attributes live in
+    slots, and the children, the data and the history are only allocated
+    when they are first used.
     """
     # Note: The states in this list are ordered in the sequence in which
     # they may appear. Do not change.
@@ -108,70 +214,127 @@ class Task(object):
         """
         This is a tree iterator that supports filtering such that a client
         may walk through all tasks that have a specific state.
+        Subtrees that contain no task with a matching state are skipped,
+        see Task._subtree_mask.
+
+        The walk is lazy: the tree is only walked as far as the client
+        consumes the iterator.
         """
 
-        def __init__(self, current, filter=None):
+        def __init__(self, current, filter=None, predicate=None,
+                     post_order=False):
             """
             Constructor.
+
+            :type  current: Task
+            :param current: The root of the subtree that is walked.
+            :type  filter: integer
+            :param filter: The bitmask of states of the wanted tasks.
+            :type  predicate: callable
+            :param predicate: An optional function that receives a task
+                              and returns True if it is wanted.
+            :type  post_order: bool
+            :param post_order: When True, a task is returned after all of
+                               its descendants instead of before.
             """
             self.filter = filter
-            self.path = [current]
+            self.predicate = predicate
+            self.post_order = post_order
+            self._walker = self._walk(current)
 
         def __iter__(self):
             return self
 
-        def _next(self):
-            # Make sure that the end is not yet reached.
-            if len(self.path) == 0:
-                raise StopIteration()
-
-            # If the current task has children, the first child is the next
-            # item. If the current task is LIKELY, and predicted tasks are not
-            # specificly searched, we can ignore the children, because
-            # predicted tasks should only have predicted children.
-            current = self.path[-1]
-            ignore_task = False
-            if self.filter is not None:
-                search_predicted = self.filter & Task.LIKELY != 0
-                is_predicted = current.state & Task.LIKELY != 0
-                ignore_task = is_predicted and not search_predicted
-            if current.children and not ignore_task:
-                self.path.append(current.children[0])
-                if (self.filter is not None and
-                        current.state & self.filter == 0):
-                    return None
-                return current
-
-            # Ending up here, this task has no children. Crop the path until we
-            # reach a task that has unvisited children, or until we hit the
-            # end.
-            while True:
-                old_child = self.path.pop(-1)
-                if len(self.path) == 0:
-                    break
-
-                # If this task has a sibling, choose it.
-                parent = self.path[-1]
-                pos = parent.children.index(old_child)
-                if len(parent.children) > pos + 1:
-                    self.path.append(parent.children[pos + 1])
-                    break
-            if self.filter is not None and current.state & self.filter == 0:
-                return None
-            return current
+        def _is_pruned(self, task):
+            return (self.filter is not None and
+                    task._subtree_mask & self.filter == 0)
+
+        def _is_wanted(self, task):
+            if self.filter is not None and task.state & self.filter == 0:
+                return False
+            return self.predicate is None or self.predicate(task)
+
+        def _skips_children(self, task):
+            # If the task is LIKELY, and predicted tasks are not specificly
+            # searched, we can ignore the children, because predicted
+            # tasks should only have predicted children.
+            if self.filter is None or self.filter & Task.LIKELY != 0:
+                return False
+            return task.state & Task.LIKELY != 0
+
+        def _walk(self, current):
+            if self._is_pruned(current):
+                return
+
+            # The path from the given task to the current one. Each entry
+            # holds a task and the position of the next child to look at,
+            # so that no child list ever needs to be searched.
+            if not self.post_order and self._is_wanted(current):
+                yield current
+            path = [[current, 0]]
+            while path:
+                entry = path[-1]
+                task, pos = entry
+                children = task._children or ()
+                child = None
+                if pos == 0 and self._skips_children(task):
+                    pos = len(children)
+                while pos < len(children):
+                    child = children[pos]
+                    pos += 1
+                    if not self._is_pruned(child):
+                        break
+                    child = None
+                entry[1] = pos
+
+                if child is not None:
+                    if not self.post_order and self._is_wanted(child):
+                        yield child
+                    path.append([child, 0])
+                    continue
+
+                # All children were visited; the summary of the subtree
+                # that is left behind is brought up to date on the way.
+                path.pop()
+                task._update_subtree_mask()
+                if self.post_order and self._is_wanted(task):
+                    yield task
 
         def __next__(self):
-            # By using this loop we avoid an (expensive) recursive call.
-            while True:
-                next = self._next()
-                if next is not None:
-                    return next
+            return next(self._walker)
 
         # Python 3 iterator protocol
         next = __next__
 
-    # Pool for assigning a unique thread id to every new Task.
-    thread_id_pool = 0
+    # The __dict__ slot is only filled by the few specs that attach extra
+    # attributes to their tasks.
+    __slots__ = ('workflow',
+                 'parent',
+                 '_children',
+                 '_state',
+                 'triggered',
+                 '_state_history',
+                 '_log',
+                 'task_spec',
+                 'id',
+                 '_thread_id',
+                 'last_state_change',
+                 '_data',
+                 '_data_shared',
+                 '_internal_data',
+                 '_subtree_mask',
+                 '_left',
+                 '_right',
+                 '_root',
+                 '_depth',
+                 '_compacted',
+                 '__dict__')
+
+    # The slots that hold lazily allocated containers; None stands for an
+    # empty container (or, for the history, for the initial state only).
+    # The history is managed by SpiffWorkflow.history.
+    _lazy_slots = ('_children', '_state_history', '_log', '_data',
+                   '_internal_data', '_compacted')
 
     def __init__(self, workflow, task_spec, parent=None, state=MAYBE):
         """
@@ -181,17 +344,35 @@ class Task(object):
         assert task_spec is not None
         self.workflow = workflow
         self.parent = parent
-        self.children = []
+        self._children = None
         self._state = state
         self.triggered = False
-        self.state_history = [state]
-        self.log = []
+        self._state_history = None
+        self._log = None
         self.task_spec = task_spec
-        self.id = uuid4()
-        self.thread_id = self.__class__.thread_id_pool
+        self.id = workflow.id_allocator.new_id()
+        if parent is None:
+            self._thread_id = workflow.thread_id_pool.last_id
+        else:
+            self._thread_id = parent._thread_id
         self.last_state_change = time.time()
-        self.data = {}
-        self.internal_data = {}
+        self._data = None
+        self._data_shared = False
+        self._internal_data = None
+        self._compacted = None
+        # A bitmask of the states that may be found in the subtree; see
+        # _add_to_subtree_mask().
+        self._subtree_mask = state
+        # Nested interval labels; see _child_added_notify().
+        self._left = 0
+        self._right = 1 << _LABEL_BITS
+        if parent is None:
+            self._root = self
+            self._depth = 0
+        else:
+            self._root = parent._root
+            self._depth = parent._depth + 1
+        self.workflow._task_added_notify(self)
         if parent is not None:
             self.parent._child_added_notify(self)
 
@@ -216,66 +397,467 @@ class Task(object):
                                     'state went from %s to %s!' % (
                                         self.get_state_name(),
                                         self.state_names[value]))
-        if __debug__:
-            old = self.get_state_name()
+        old_state = self._state
         self._state = value
-        if __debug__:
-            self.log.append("Moving '%s' from %s to %s" % (
+        self.workflow._task_state_changed_notify(self, old_state)
+        self._add_to_subtree_mask(value)
+        self.workflow.history._record(self, old_state, value)
+        if LOG.isEnabledFor(logging.DEBUG):
+            LOG.debug("Moving '%s' (spec=%s) from %s to %s" % (
                 self.get_name(),
-                old, self.get_state_name()))
-        self.state_history.append(value)
-        LOG.debug("Moving '%s' (spec=%s) from %s to %s" % (
-            self.get_name(),
-            self.task_spec.name, old, self.get_state_name()))
+                self.task_spec.name, self.state_names[old_state],
+                self.get_state_name()))
 
     def _delstate(self):
         del self._state
 
     state = property(_getstate, _setstate, _delstate, "State property.")
 
+    def _get_thread_id(self):
+        return self._thread_id
+
+    def _set_thread_id(self, value):
+        if self._thread_id == value:
+            return
+        old_thread_id = self._thread_id
+        self._thread_id = value
+        self.workflow._task_thread_changed_notify(self, old_thread_id)
+
+    thread_id = property(_get_thread_id, _set_thread_id, None,
+                         "Thread id property.")
+
+    def _get_children(self):
+        if self._children is None:
+            self._children = []
+        return self._children
+
+    def _set_children(self, value):
+        self._children = value
+
+    children = property(_get_children, _set_children, None,
+                        "The list of child tasks.")
+
+    def _get_state_history(self):
+        return self.workflow.history.get_states(self)
+
+    def _set_state_history(self, value):
+        self.workflow.history.set_states(self, value)
+
+    state_history = property(_get_state_history, _set_state_history, None,
+                             "The states that the task went through, as far"
+                             " as the history policy of the workflow keeps"
+                             " them.")
+
+    def _get_log(self):
+        return self.workflow.history.get_log(self)
+
+    def _set_log(self, value):
+        self.workflow.history.set_log(self, value)
+
+    log = property(_get_log, _set_log, None,
+                   "The debug log of the task, as far as the history policy"
+                   " of the workflow keeps it.")
+
+    def _get_data(self):
+        # The caller may modify the dictionary, so a shared one is copied
+        # first; see _inherit_data().
+        if self._data is None:
+            self._data = {}
+        elif self._data_shared:
+            self._data = dict(self._data)
+            self._data_shared = False
+        return self._data
+
+    def _set_data(self, value):
+        self._data = value
+        self._data_shared = False
+
+    data = property(_get_data, _set_data, None, "The data of the task.")
+
+    def _peek_data(self):
+        """
+        Returns the data of the task without copying it if it is shared
+        with other tasks. The caller must not modify it.
+
+        :rtype:  dict
+        :returns: The data.
+        """
+        if self._data is None:
+            return {}
+        return self._data
+
+    def _get_internal_data_dict(self):
+        if self._internal_data is None:
+            self._internal_data = {}
+        return self._internal_data
+
+    def _set_internal_data_dict(self, value):
+        self._internal_data = value
+
+    internal_data = property(_get_internal_data_dict,
+                             _set_internal_data_dict, None,
+                             "The data that is private to the task spec.")
+
+    def _get_compacted(self):
+        return list(self._compacted or ())
+
+    compacted = property(_get_compacted, None, None,
+                         "The summaries of the finished children that were"
+                         " removed by Workflow.compact().")
+
     def __iter__(self):
         return Task.Iterator(self)
 
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        for name in Task.__slots__:
+            if name != '__dict__' and hasattr(self, name):
+                state[name] = getattr(self, name)
+        return state
+
     def __setstate__(self, dict):
-        self.__dict__.update(dict)
-        # If unpickled in the same Python process in which a workflow
-        # (Task) is built through the API, we need to make sure
-        # that there will not be any ID collisions.
-        if dict['thread_id'] >= self.__class__.thread_id_pool:
-            self.__class__.thread_id_pool = dict['thread_id']
+        for name in self._lazy_slots:
+            setattr(self, name, None)
+        self._data_shared = False
+        # Pickles of versions before tasks had slots lack the labels, the
+        # masks, the roots and the depths; the workflow rebuilds them, see
+        # Workflow.__setstate__().
+        self._subtree_mask = self._left = self._right = self._depth = 0
+        self._root = None
+        for name, value in list(dict.items()):
+            setattr(self, _LEGACY_NAMES.get(name, name), value)
 
     def _get_root(self):
         """
         Returns the top level parent.
         """
-        if self.parent is None:
-            return self
-        return self.parent._get_root()
+        return self._root
 
     def _get_depth(self):
-        depth = 0
-        task = self.parent
-        while task is not None:
-            depth += 1
+        return self._depth
+
+    def _add_to_subtree_mask(self, state):
+        """
+        Adds the given state to the subtree masks of this task and its
+        ancestors.
+
+        The subtree mask of a task contains the state of every task in its
+        subtree, so that a walk over the tree may skip subtrees that do not
+        contain any wanted task. It may also contain states that are no
+        longer present: bits are only added eagerly, but removed lazily by
+        _update_subtree_mask(), which Task.Iterator calls on every task
+        that it leaves behind.
+
+        :type  state: integer
+        :param state: The bitmask of states to add.
+        """
+        task = self
+        while task is not None and task._subtree_mask & state != state:
+            task._subtree_mask |= state
             task = task.parent
-        return depth
+
+    def _update_subtree_mask(self):
+        """
+        Recomputes the subtree mask of this task from the masks of its
+        children, dropping the states that are no longer present.
+        """
+        mask = self._state
+        for child in self._children or ():
+            mask |= child._subtree_mask
+        self._subtree_mask = mask
 
     def _child_added_notify(self, child):
         """
         Called by another Task to let us know that a child was added.
+
+        Every task carries a pair of labels, such that the labels of all
+        descendants are nested in between the labels of the task, and
+        sorting by the left label yields the order of a tree walk. Put
+        differently, the labels of all tasks form one ordered list, in
+        which the labels of the new child are inserted right before the
+        right label of this task. If there is no room, the labels in the
+        smallest surrounding range that is sparse enough are spread out;
+        see _insert_labels().
         """
         assert child is not None
-        self.children.append(child)
+        self._add_to_subtree_mask(child._subtree_mask)
+        children = self.children
+        right = self._right
+        if children:
+            last = children[-1]
+            if right - last._right < 3 * _LABEL_STEP:
+                # Take back the room at the end of the previous child that
+                # its descendants do not use.
+                if last._children:
+                    inner = last._children[-1]._right
+                else:
+                    inner = last._left
+                step = min(_LABEL_STEP, (right - inner) // 4)
+                if step > 0 and inner + step < last._right:
+                    last._right = inner + step
+            before = last, True
+            left = last._right
+        else:
+            before = self, False
+            left = self._left
+
+        # The child gets all the room but a fixed step on either side, so
+        # that chains and rows of children use up the room linearly.
+        step = min(_LABEL_STEP, (right - left) // 3)
+        if step < 1:
+            self._insert_labels(before, child)
+        else:
+            child._left = left + step
+            child._right = right - step
+        children.append(child)
+
+    def _insert_labels(self, before, child):
+        """
+        Labels the given new child, which is inserted after the given label
+        and before the right label of this task, by relabeling the labels
+        around it.
+
+        The labels of the tree are an order-maintenance list: only the
+        range of 2**n labels around the insertion point is relabeled, for
+        the smallest n at which the range holds no more than
+        (2 / _LABEL_DENSITY)**n labels. Half of its room is spread over
+        the labels, and half is left to the new child. Each relabeled range
+        thus absorbs many insertions before it fills up again, so that
+        chains and rows of children take amortized O(1) relabels, and
+        insertions in any order amortized O(log n). If the range of the
+        root is too dense, it is doubled.
+
+        :type  before: (Task, bool)
+        :param before: The task and side (True for right) of the preceding
+                       label.
+        :type  child: Task
+        :param child: The new child, which is not yet in the children.
+        """
+        root = self._root
+        base = root._left
+        label = _get_label(before)
+        preceding = [before]
+        following = [(self, True)]
+        walk_back = _walk_labels(before, False)
+        walk_forward = _walk_labels(following[0], True)
+        level = 1
+        while True:
+            lo = base + ((label - base) >> level << level)
+            hi = lo + (1 << level)
+            if hi >= root._right:
+                hi = root._right
+            n_before = _extend_labels(preceding, walk_back,
+                                      lambda value: value >= lo)
+            n_after = _extend_labels(following, walk_forward,
+                                     lambda value: value < hi)
+            count = n_before + n_after + 2
+            if count <= (hi - lo) / _LABEL_DENSITY ** level:
+                break
+            if lo == base and hi == root._right:
+                root._right = base + (2 << level)
+            level += 1
+
+        # The labels on either side are packed at both ends of the range,
+        # such that the room is left where the next insertion will likely
+        # happen: in between the labels of the new child.
+        step = (hi - lo) // (2 * count)
+        child._left = _pack_labels(preceding[n_before - 1::-1], lo, step)
+        child._right = hi - (n_after + 1) * step
+        _pack_labels(following[:n_after], child._right + step, step)
+
+    def _get_size(self):
+        """
+        Returns the number of tasks in the subtree, including this one.
+        """
+        size = 0
+        stack = [self]
+        while stack:
+            task = stack.pop()
+            size += 1
+            stack.extend(task._children or ())
+        return size
+
+    def _make_room(self):
+        """
+        Relabels the descendants of the smallest enclosing subtree that has
+        plenty of room for all of them; used after whole subtrees were
+        attached at once. If even the root is too crowded, its range is
+        widened.
+        """
+        task = self
+        size = task._get_size()
+        while task.parent is not None and \
+                task._right - task._left < 2 * size * _LABEL_STEP:
+            parent = task.parent
+            for sibling in parent._children:
+                if sibling is not task:
+                    size += sibling._get_size()
+            size += 1
+            task = parent
+        width = task._right - task._left
+        if width < 2 * size * _LABEL_STEP:
+            task._right = task._left + (1 << max(
+                _LABEL_BITS, (2 * size * _LABEL_STEP).bit_length()))
+        task._relabel()
+
+    def _relabel(self):
+        """
+        Evenly distributes new labels over all descendants.
+        """
+        labels = []
+        stack = [(self, iter(self._children or ()))]
+        while stack:
+            task, children = stack[-1]
+            child = next(children, None)
+            if child is None:
+                stack.pop()
+                if stack:
+                    labels.append((task, True))
+                continue
+            labels.append((child, False))
+            stack.append((child, iter(child._children or ())))
+        if labels:
+            step = (self._right - self._left) // (len(labels) + 1)
+            _pack_labels(labels, self._left + step, step)
+
+    def _remove_child(self, child):
+        """
+        Removes the given child, and lets the workflows know that the tasks
+        in the child's subtree no longer exist.
+
+        :type  child: Task
+        :param child: The child to remove.
+        """
+        self.children.remove(child)
+        for task in Task.Iterator(child):
+            task.workflow._task_removed_notify(task)
+
+    def _remove_children(self, children):
+        """
+        Like calling :meth:`_remove_child` for each of the given children,
+        but the list of children is rebuilt only once.
+
+        :type  children: list(Task)
+        :param children: The children to remove.
+        """
+        if not children:
+            return
+        remove = set(children)
+        self._children = [child for child in self._children
+                          if child not in remove]
+        for child in children:
+            for task in Task.Iterator(child):
+                task.workflow._task_removed_notify(task)
+
+    def _graft(self, subworkflow, children):
+        """
+        Integrates the given top level tasks of a subworkflow into the tree
+        underneath this task.
+
+        :type  subworkflow: Workflow
+        :param subworkflow: The workflow that owns the given children.
+        :type  children: list(Task)
+        :param children: The tasks that are grafted.
+        """
+        for child in children:
+            self.children.insert(0, child)
+            child.parent = self
+            self._add_to_subtree_mask(child._subtree_mask)
+            for task in Task.Iterator(child):
+                task._root = task.parent._root
+                task._depth = task.parent._depth + 1
+        self._make_room()
+        self.workflow._subworkflow_grafted_notify(subworkflow, children)
+
+    def _compact_child(self, child, keep_data=False):
+        """
+        Replaces the subtree of the given finished child by a summary.
+
+        :type  child: Task
+        :param child: The child to compact.
+        :type  keep_data: bool
+        :param keep_data: Whether to keep a copy of the child's data.
+        :rtype:  integer
+        :returns: The number of tasks that were removed.
+        """
+        size = 0
+        finished = child.last_state_change
+        for task in Task.Iterator(child):
+            size += 1
+            finished = max(finished, task.last_state_change)
+        data = dict(child._peek_data()) if keep_data else None
+        summary = CompactedTask(child.id,
+                                child.task_spec.name,
+                                child._state,
+                                child.last_state_change,
+                                finished,
+                                size,
+                                data)
+        self._remove_child(child)
+        if self._compacted is None:
+            self._compacted = []
+        self._compacted.append(summary)
+        return size
+
+    def _compact_path(self, path, keep_data=False, extend=False):
+        """
+        Replaces the given chain of finished descendants by a summary, and
+        moves the only child of the last of them up to this task.
+
+        :type  path: list(Task)
+        :param path: The tasks to remove: a child of this task, its only
+                     child, and so on.
+        :type  keep_data: bool
+        :param keep_data: Whether to keep a copy of the data of the first
+                          task of the chain.
+        :type  extend: bool
+        :param extend: Whether the chain continues the one of our last
+                       summary, which is then extended instead.
+        :rtype:  integer
+        :returns: The number of tasks that were removed.
+        """
+        top = path[0]
+        child = path[-1]._children[0]
+        finished = max(task.last_state_change for task in path)
+        if extend:
+            summary = self._compacted[-1]
+            summary.finished = max(summary.finished, finished)
+            summary.size += len(path)
+        else:
+            data = dict(top._peek_data()) if keep_data else None
+            summary = CompactedTask(top.id,
+                                    top.task_spec.name,
+                                    top._state,
+                                    top.last_state_change,
+                                    finished,
+                                    len(path),
+                                    data)
+        self._children[self._children.index(top)] = child
+        child.parent = self
+        path[-1]._children = None
+        for task in path:
+            task.workflow._task_removed_notify(task)
+
+        # The labels of the moved subtree are still nested in between ours;
+        # only the depths change.
+        shift = child._depth - self._depth - 1
+        for task in Task.Iterator(child):
+            task._depth -= shift
+        self._update_subtree_mask()
+        if not extend:
+            if self._compacted is None:
+                self._compacted = []
+            self._compacted.append(summary)
+        return len(path)
 
     def _drop_children(self):
         drop = []
-        for child in self.children:
+        for child in self._children or ():
             if not child._is_finished():
                 drop.append(child)
             else:
                 child._drop_children()
-        for task in drop:
-            self.children.remove(task)
+        self._remove_children(drop)
 
     def _set_state(self, state, force=True):
         """
@@ -322,6 +904,32 @@ class Task(object):
             task._ready()
         return task
 
+    def _add_children(self, task_specs, state=MAYBE):
+        """
+        Like calling :meth:`_add_child` for each of the given TaskSpecs, but
+        the checks are made only once.
+
+        :type  task_specs: list(TaskSpec)
+        :param task_specs: The task specs of the new children.
+        :type  state: integer
+        :param state: The bitmask of states for the new children.
+        :rtype:  list(Task)
+        :returns: The new child tasks.
+        """
+        if None in task_specs:
+            raise ValueError(self, '_add_children() requires TaskSpecs')
+        if self._is_predicted() and state & self.PREDICTED_MASK == 0:
+            msg = 'Attempt to add non-predicted child to predicted task'
+            raise WorkflowException(self.task_spec, msg)
+        workflow = self.workflow
+        children = []
+        for task_spec in task_specs:
+            task = Task(workflow, task_spec, self, state=state)
+            if state == self.READY:
+                task._ready()
+            children.append(task)
+        return children
+
     def _assign_new_thread_id(self, recursive=True):
         """
         Assigns a new thread id to the task.
@@ -331,8 +939,7 @@ class Task(object):
         :rtype:  bool
         :returns: The new thread id.
         """
-        self.__class__.thread_id_pool += 1
-        self.thread_id = self.__class__.thread_id_pool
+        self.thread_id = self.workflow.thread_id_pool.new_id()
         if not recursive:
             return self.thread_id
         for child in self:
@@ -359,21 +966,35 @@ class Task(object):
         :type  state: integer
         :param state: The bitmask of states for the new children.
         """
-        LOG.debug("Updating children for %s" % self.get_name())
+        if LOG.isEnabledFor(logging.DEBUG):
+            LOG.debug("Updating children for %s" % self.get_name())
         if task_specs is None:
             raise ValueError('"task_specs" argument is None')
-        add = task_specs[:]
+
+        if not self._children:
+            if task_specs:
+                self._add_children(task_specs, state)
+            return
+
+        # Count how many children of every spec are wanted, so that large
+        # splits can be synced in linear time.
+        wanted = {}
+        for task_spec in task_specs:
+            wanted[task_spec] = wanted.get(task_spec, 0) + 1
 
         # Create a list of all children that are no longer needed.
+        kept = {}
         remove = []
-        for child in self.children:
+        for child in self._children:
             # Triggered tasks are never removed.
             if child.triggered:
                 continue
 
             # Check whether the task needs to be removed.
-            if child.task_spec in add:
-                add.remove(child.task_spec)
+            task_spec = child.task_spec
+            count = kept.get(task_spec, 0)
+            if count < wanted.get(task_spec, 0):
+                kept[task_spec] = count + 1
                 continue
 
             # Non-predicted tasks must not be removed, so they HAVE to be in
@@ -384,17 +1005,26 @@ class Task(object):
                                         repr(child))
             remove.append(child)
 
+        # The existing children take the place of the first occurrences of
+        # their spec in the given list.
+        add = []
+        for task_spec in task_specs:
+            count = kept.get(task_spec)
+            if count:
+                kept[task_spec] = count - 1
+            else:
+                add.append(task_spec)
+
         # Remove and add the children accordingly.
-        for child in remove:
-            self.children.remove(child)
-        for task_spec in add:
-            self._add_child(task_spec, state)
+        self._remove_children(remove)
+        if add:
+            self._add_children(add, state)
 
     def _set_likely_task(self, task_specs):
         if not isinstance(task_specs, list):
             task_specs = [task_specs]
         for task_spec in task_specs:
-            for child in self.children:
+            for child in self._children or ():
                 if child.task_spec != task_spec:
                     continue
                 if child._is_definite():
@@ -407,16 +1037,17 @@ class Task(object):
         Returns True if parent is in the list of ancestors, returns False
         otherwise.
 
+        The labels of all descendants of a task are nested in between the
+        labels of the task, so no walk is needed.
+
         :type  parent: Task
         :param parent: The parent that is searched in the ancestors.
         :rtype:  bool
         :returns: Whether the parent was found.
         """
-        if self.parent is None:
-            return False
-        if self.parent == parent:
-            return True
-        return self.parent._is_descendant_of(parent)
+        return (parent._left < self._left and
+                self._right <= parent._right and
+                parent._root is self._root)
 
     def _find_child_of(self, parent_task_spec):
         """
@@ -429,11 +1060,12 @@ class Task(object):
         :rtype:  Task
         :returns: The child of the given ancestor.
         """
-        if self.parent is None:
-            return self
-        if self.parent.task_spec == parent_task_spec:
-            return self
-        return self.parent._find_child_of(parent_task_spec)
+        task = self
+        while task.parent is not None:
+            if task.parent.task_spec == parent_task_spec:
+                return task
+            task = task.parent
+        return task
 
     def _find_any(self, task_spec):
         """
@@ -444,14 +1076,11 @@ class Task(object):
         :rtype:  list(Task)
         :returns: The tasks objects that are attached to the given task spec.
         """
-        tasks = []
-        if self.task_spec == task_spec:
-            tasks.append(self)
-        for child in self:
-            if child.task_spec != task_spec:
-                continue
-            tasks.append(child)
-        return tasks
+        tasks = self.workflow._get_tasks_from_spec(task_spec)
+        if self is self.workflow.task_tree:
+            return tasks
+        return [task for task in tasks
+                if task is self or task._is_descendant_of(self)]
 
     def _find_ancestor(self, task_spec):
         """
@@ -463,11 +1092,12 @@ class Task(object):
         :rtype:  Task
         :returns: The ancestor.
         """
-        if self.parent is None:
-            return self
-        if self.parent.task_spec == task_spec:
-            return self.parent
-        return self.parent._find_ancestor(task_spec)
+        task = self
+        while task.parent is not None:
+            if task.parent.task_spec == task_spec:
+                return task.parent
+            task = task.parent
+        return task
 
     def _find_ancestor_from_name(self, name):
         """
@@ -479,11 +1109,12 @@ class Task(object):
         :rtype:  Task
         :returns: The ancestor.
         """
-        if self.parent is None:
-            return None
-        if self.parent.get_name() == name:
-            return self.parent
-        return self.parent._find_ancestor_from_name(name)
+        task = self.parent
+        while task is not None:
+            if task.get_name() == name:
+                return task
+            task = task.parent
+        return None
 
     def _ready(self):
         """
@@ -537,7 +1168,9 @@ class Task(object):
         self.internal_data.update(kwargs)
 
     def _get_internal_data(self, name, default=None):
-        return self.internal_data.get(name, default)
+        if self._internal_data is None:
+            return default
+        return self._internal_data.get(name, default)
 
     def set_data(self, **kwargs):
         """
@@ -548,11 +1181,23 @@ class Task(object):
     def _inherit_data(self):
         """
         Inherits the data from the parent.
+
+        A task without data of its own shares the dictionary of the parent
+        instead of copying it. Shared dictionaries are never modified;
+        whichever task writes first works on a copy, see the data property.
         """
+        parent_data = self.parent._data
         LOG.debug("'%s' inheriting data from '%s'" % (self.get_name(),
                                                       self.parent.get_name()),
-                  extra=dict(data=self.parent.data))
-        self.set_data(**self.parent.data)
+                  extra=dict(data=parent_data))
+        if not parent_data or self._data is parent_data:
+            return
+        if not self._data:
+            self._data = parent_data
+            self._data_shared = True
+            self.parent._data_shared = True
+            return
+        self.set_data(**parent_data)
 
     def get_data(self, name, default=None):
         """
@@ -566,7 +1211,9 @@ class Task(object):
         :rtype:  obj
         :returns: The value of the data field
         """
-        return self.data.get(name, default)
+        if self._data is None:
+            return default
+        return self._data.get(name, default)
 
     def cancel(self):
         """
@@ -574,7 +1221,7 @@ class Task(object):
         any children that are LIKELY.
         """
         if self._is_finished():
-            for child in self.children:
+            for child in self._children or ():
                 child.cancel()
             return
         self._set_state(self.CANCELLED)
@@ -595,10 +1242,13 @@ class Task(object):
         """
         self.task_spec._on_trigger(self, *args)
 
-    def get_dump(self, indent=0, recursive=True):
+    def get_dump(self, indent=0, recursive=True, history=False):
         """
         Returns the subtree as a string for debugging.
 
+        :type  history: bool
+        :param history: Whether to include the history of each task, as far
+                        as the history policy of the workflow keeps it.
         :rtype:  str
         :returns: The debug information.
         """
@@ -609,10 +1259,20 @@ class Task(object):
         if self.task_spec.description:
             dbg += ' (%s)' % self.get_description()
         dbg += ' State: %s' % self.get_state_name()
-        dbg += ' Children: %s' % len(self.children)
+        children = self._children or ()
+        dbg += ' Children: %s' % len(children)
+        if self._compacted:
+            dbg += ' Compacted: %s' % len(self._compacted)
+        if history:
+            states = self.workflow.history.get_states(self)
+            if states:
+                dbg += ' History: %s' % ' -> '.join(
+                    self.state_names[state] for state in states)
+            for line in self.workflow.history.get_log(self):
+                dbg += '\n' + (' ' * (indent + 1) * 2) + line
         if recursive:
-            for child in self.children:
-                dbg += '\n' + child.get_dump(indent + 1)
+            for child in children:
+                dbg += '\n' + child.get_dump(indent + 1, history=history)
         return dbg
 
     def dump(self, indent=0):
@@ -620,3 +1280,48 @@ class Task(object):
         Prints the subtree as a string for debugging.
         """
         print(self.get_dump())
+
+
+class CompactedTask(object):
+
+    """
+    The summary of a finished subtree that was removed from the task tree
+    by :meth:`SpiffWorkflow.Workflow.compact`. It describes the task at the
+    top of the subtree.
+    """
+    __slots__ = ('id', 'task_spec_name', 'state', 'last_state_change',
+                 'finished', 'size', 'data')
+
+    def __init__(self, id, task_spec_name, state, last_state_change,
+                 finished, size, data=None):
+        """
+        Constructor.
+
+        :type  id: object
+        :param id: The id of the task.
+        :type  task_spec_name: str
+        :param task_spec_name: The name of the task spec.
+        :type  state: integer
+        :param state: The final state of the task.
+        :type  last_state_change: float
+        :param last_state_change: The time of the last state change.
+        :type  finished: float
+        :param finished: The time of the last state change in the subtree.
+        :type  size: integer
+        :param size: The number of tasks in the subtree.
+        :type  data: dict
+        :param data: A copy of the data of the task, or None.
+        """
+        self.id = id
+        self.task_spec_name = task_spec_name
+        self.state = state
+        self.last_state_change = last_state_change
+        self.finished = finished
+        self.size = size
+        self.data = data
+
+    def __repr__(self):
+        return '<CompactedTask (%s) in state %s, %s tasks>' % (
+            self.task_spec_name,
+            Task.state_names[self.state],
+            self.size)
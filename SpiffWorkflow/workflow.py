@@ -22,6 +22,10 @@ from builtins import object
 import logging
 from . import specs
 from .task import Task
+from .history import FullHistory
+from .ids import UuidAllocator, ThreadIdPool
+from .archive import ArchivedTask, WorkflowArchive
+from .scheduler import Scheduler
 from .util.compat import mutex
 from .util.event import Event
 from .exceptions import WorkflowException
@@ -29,6 +33,28 @@ from .exceptions import WorkflowException
 LOG = logging.getLogger(__name__)
 
 
+def _add_to_spec_index(index, task, thread_id):
+    threads = index.setdefault(task.task_spec, {})
+    threads.setdefault(thread_id, set()).add(task)
+
+
+def _remove_from_spec_index(index, task, thread_id):
+    """
+    Removes the task from the given index, and returns True if it was
+    found.
+    """
+    threads = index.get(task.task_spec)
+    if threads is None:
+        return False
+    tasks = threads.get(thread_id)
+    if tasks is None or task not in tasks:
+        return False
+    tasks.remove(task)
+    if not tasks:
+        del threads[thread_id]
+    return True
+
+
 class Workflow(object):
 
     """
@@ -47,14 +73,70 @@ class Workflow(object):
         :param deserializing: set to true when deserializing to avoid
           generating tasks twice (and associated problems with multiple
           hierarchies of tasks)
+        :type history: SpiffWorkflow.history.History
+        :param history: How much of their history the tasks keep. A
+          subworkflow uses the policy of its parent; otherwise, the default
+          is a FullHistory.
+        :type id_allocator: SpiffWorkflow.ids.IdAllocator
+        :param id_allocator: Issues the ids of the tasks. A subworkflow uses
+          the allocator of its parent; otherwise, the default is a
+          UuidAllocator.
+        :type thread_id_pool: SpiffWorkflow.ids.ThreadIdPool
+        :param thread_id_pool: Issues the thread ids of the tasks. A
+          subworkflow uses the pool of its parent; otherwise, a new pool
+          is created.
+        :type compact_threshold: integer
+        :param compact_threshold: If given, finished branches are compacted
+          (see :meth:`compact`) whenever the task tree holds more finished
+          tasks than this.
+        :type executor: concurrent.futures.Executor
+        :param executor: If given, the work of READY tasks whose spec is
+          parallel_safe is started on this thread or process pool right
+          away. The tasks are still completed one by one on the calling
+          thread; those with work after the other READY tasks, in the order
+          of a tree walk. A subworkflow uses the executor of its parent.
         """
         assert workflow_spec is not None
         LOG.debug("__init__ Workflow instance: %s" % self.__str__())
         self.spec = workflow_spec
         self.data = {}
         self.outer_workflow = kwargs.get('parent', self)
+        self.history = kwargs.get('history')
+        if self.history is None:
+            if self.outer_workflow is not self:
+                self.history = self.outer_workflow.history
+            else:
+                self.history = FullHistory()
+        self.id_allocator = kwargs.get('id_allocator')
+        if self.id_allocator is None:
+            if self.outer_workflow is not self:
+                self.id_allocator = self.outer_workflow.id_allocator
+            else:
+                self.id_allocator = UuidAllocator()
+        self.thread_id_pool = kwargs.get('thread_id_pool')
+        if self.thread_id_pool is None:
+            if self.outer_workflow is not self:
+                self.thread_id_pool = self.outer_workflow.thread_id_pool
+            else:
+                self.thread_id_pool = ThreadIdPool()
+        self._executor = kwargs.get('executor')
+        if self._executor is None and self.outer_workflow is not self:
+            self._executor = self.outer_workflow.executor
+        self._work = {}
+        self._new_work = []
+        self.compact_threshold = kwargs.get('compact_threshold')
+        self._compact_at = self.compact_threshold
         self.locks = {}
         self.last_task = None
+        self.task_mapping = {}
+        self._tasks_by_state = dict((state, set())
+                                    for state in Task.state_names)
+        self._tasks_by_spec = {}
+        self._unfinished_tasks_by_spec = {}
+        self._scheduler = Scheduler()
+        self._watched_splits = set()
+        self._branch_changes = []
+        self._graft_parent = None
         if deserializing:
             assert 'Root' in workflow_spec.task_specs
             root = workflow_spec.task_specs['Root']  # Probably deserialized
@@ -86,24 +168,276 @@ class Workflow(object):
         :rtype: bool
         :return: Whether the workflow is completed.
         """
-        mask = Task.NOT_FINISHED_MASK
-        iter = Task.Iterator(self.task_tree, mask)
-        try:
-            next(iter)
-        except StopIteration:
-            # No waiting tasks found.
-            return True
-        return False
+        for state, tasks in self._tasks_by_state.items():
+            if state & Task.NOT_FINISHED_MASK and tasks:
+                return False
+        return True
+
+    def _index_task(self, task):
+        self.task_mapping[task.id] = task
+        self._tasks_by_state[task._state].add(task)
+        _add_to_spec_index(self._tasks_by_spec, task, task.thread_id)
+        if not task._is_finished():
+            _add_to_spec_index(self._unfinished_tasks_by_spec,
+                               task,
+                               task.thread_id)
+        self._scheduler._add(task)
+        if task._state == Task.READY:
+            self._task_ready_notify(task)
+        elif task._state == Task.WAITING:
+            self._task_waiting_notify(task)
+
+    def _unindex_task(self, task):
+        if self.task_mapping.get(task.id) is task:
+            del self.task_mapping[task.id]
+        self._cancel_work(task)
+        self._tasks_by_state[task._state].discard(task)
+        _remove_from_spec_index(self._tasks_by_spec, task, task.thread_id)
+        _remove_from_spec_index(self._unfinished_tasks_by_spec,
+                                task,
+                                task.thread_id)
+        self._scheduler._remove(task)
+        self._watched_splits.discard(task)
+
+    def _task_added_notify(self, task):
+        """
+        Called by a Task to let us know that it was created.
+        """
+        self._index_task(task)
+        if self._graft_parent is not None:
+            self._graft_parent._task_added_notify(task)
+
+    def _task_removed_notify(self, task):
+        """
+        Called when a Task was removed from the tree.
+        """
+        self._unindex_task(task)
+        if self._graft_parent is not None:
+            self._graft_parent._task_removed_notify(task)
+
+    def _task_state_changed_notify(self, task, old_state):
+        """
+        Called by a Task to let us know that its state has changed.
+        """
+        if task in self._tasks_by_state[old_state]:
+            self._tasks_by_state[old_state].remove(task)
+            self._tasks_by_state[task._state].add(task)
+            if old_state & Task.FINISHED_MASK == 0:
+                if task._is_finished():
+                    _remove_from_spec_index(self._unfinished_tasks_by_spec,
+                                            task,
+                                            task.thread_id)
+            elif not task._is_finished():
+                _add_to_spec_index(self._unfinished_tasks_by_spec,
+                                   task,
+                                   task.thread_id)
+            self._scheduler._state_changed(task, old_state)
+            if task._state == Task.READY:
+                self._task_ready_notify(task)
+            elif task._state == Task.WAITING:
+                self._task_waiting_notify(task)
+            elif task._state == Task.CANCELLED:
+                self._cancel_work(task)
+            if self._watched_splits and \
+                    task._state & (Task.WAITING | Task.FINISHED_MASK):
+                self._branch_changes.append(task)
+        if self._graft_parent is not None:
+            self._graft_parent._task_state_changed_notify(task, old_state)
+
+    def _task_thread_changed_notify(self, task, old_thread_id):
+        """
+        Called by a Task to let us know that its thread id has changed.
+        """
+        if _remove_from_spec_index(self._tasks_by_spec, task, old_thread_id):
+            _add_to_spec_index(self._tasks_by_spec, task, task.thread_id)
+        if _remove_from_spec_index(self._unfinished_tasks_by_spec,
+                                   task,
+                                   old_thread_id):
+            _add_to_spec_index(self._unfinished_tasks_by_spec,
+                               task,
+                               task.thread_id)
+        if self._graft_parent is not None:
+            self._graft_parent._task_thread_changed_notify(task,
+                                                           old_thread_id)
+
+    def _subworkflow_grafted_notify(self, subworkflow, children):
+        """
+        Called when the given top level tasks of a subworkflow were grafted
+        into our task tree. From now on, all tasks that the subworkflow
+        creates are also registered with this workflow.
+        """
+        subworkflow._graft_parent = self
+        subworkflow._new_work = []
+        for child in children:
+            for task in Task.Iterator(child):
+                self._task_added_notify(task)
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        if '_scheduler' in state or self.outer_workflow is not self:
+            return
+
+        # A pickle of a version before the task indexes. The tasks of the
+        # subworkflows hang in our tree, and their thread ids were issued by
+        # a global pool. Pickle restores our state last, so all of them are
+        # loaded by now.
+        tasks = list(Task.Iterator(self.task_tree))
+        subworkflows = []
+        for task in tasks:
+            workflow = task.workflow
+            if workflow is not self and workflow not in subworkflows:
+                subworkflows.append(workflow)
+        self.history = FullHistory()
+        self.id_allocator = UuidAllocator()
+        self.thread_id_pool = ThreadIdPool(
+            max(task._thread_id for task in tasks))
+        for workflow in [self] + subworkflows:
+            workflow.history = self.history
+            workflow.id_allocator = self.id_allocator
+            workflow.thread_id_pool = self.thread_id_pool
+            workflow._executor = None
+            workflow.compact_threshold = None
+            workflow._compact_at = None
+            children = workflow.task_tree.children
+            if workflow is self or not children:
+                workflow._graft_parent = None
+            else:
+                workflow._graft_parent = children[0].parent.workflow
+        # Our own pass comes last, as it fixes the labels, the roots and the
+        # depths of the grafted tasks.
+        for workflow in reversed(subworkflows):
+            workflow._reindex_tasks()
+        self._reindex_tasks()
+
+    def _reindex_tasks(self):
+        """
+        Rebuilds the task mapping, the task indexes, the subtree masks and
+        the cached roots and depths from the task tree. Used by the
+        deserializers, after the tree was replaced.
+        """
+        self.task_mapping = {}
+        self._tasks_by_state = dict((state, set())
+                                    for state in Task.state_names)
+        self._tasks_by_spec = {}
+        self._unfinished_tasks_by_spec = {}
+        self._scheduler = Scheduler()
+        self._watched_splits = set()
+        self._branch_changes = []
+        self._work = {}
+        self._new_work = []
+        tasks = list(Task.Iterator(self.task_tree))
+        self.task_tree._root = self.task_tree
+        self.task_tree._depth = 0
+        for task in tasks:
+            for child in task.children:
+                child._root = task._root
+                child._depth = task._depth + 1
+        for task in reversed(tasks):
+            self._index_task(task)
+            task._update_subtree_mask()
+            if task._state == Task.COMPLETED and \
+                    task.task_spec._watches_branches(task):
+                self._watched_splits.add(task)
+        self.task_tree._make_room()
+
+    @property
+    def executor(self):
+        return self._executor
+
+    @executor.setter
+    def executor(self, executor):
+        self._executor = executor
+        self._new_work = []
+        if executor is not None:
+            ready = sorted(self._tasks_by_state[Task.READY],
+                           key=lambda task: task._left)
+            for task in ready:
+                self._collect_work(task)
+
+    def _task_ready_notify(self, task):
+        """
+        Called when a task that this workflow indexes became READY, or was
+        added in the READY state.
+        """
+        self._collect_work(task)
+
+    def _task_waiting_notify(self, task):
+        """
+        Called when a task that this workflow indexes became WAITING, or was
+        added in the WAITING state.
+        """
+        pass
+
+    def _collect_work(self, task):
+        """
+        Remembers the given READY task for _dispatch_work() if its work may
+        run on the executor.
+        """
+        if (self._executor is not None
+                and self._graft_parent is None
+                and task.task_spec.parallel_safe):
+            self._new_work.append(task)
+
+    def _cancel_work(self, task):
+        """
+        Forgets the work of the given task, and cancels it unless it
+        already runs.
+        """
+        future = self._work.pop(task, None)
+        if future is not None:
+            future.cancel()
+
+    def _dispatch_work(self):
+        """
+        Starts the work of the tasks that became READY since the last call
+        on the executor. The results are picked up when the tasks are
+        completed; see :meth:`SpiffWorkflow.specs.TaskSpec._run_work`.
+        Until then, the tasks are deferred in favor of other READY tasks,
+        so that more work may be started meanwhile.
+        """
+        new_work, self._new_work = self._new_work, []
+        for task in new_work:
+            if task._state != Task.READY or task.task_spec.manual:
+                continue
+            if task in task.workflow._work:
+                continue
+            work = task.task_spec._get_work(task)
+            if work is not None:
+                task.workflow._work[task] = self._executor.submit(work)
+                self._scheduler._defer(task)
 
     def _get_waiting_tasks(self):
-        waiting = Task.Iterator(self.task_tree, Task.WAITING)
-        return [w for w in waiting]
+        return self._scheduler.get_waiting()
+
+    def _watch_branches(self, split_task):
+        """
+        Asks for split_task.task_spec._branches_changed() to be called
+        whenever a task completed, until _unwatch_branches() is called.
+        """
+        self._watched_splits.add(split_task)
+
+    def _unwatch_branches(self, split_task):
+        self._watched_splits.discard(split_task)
+        if not self._watched_splits:
+            self._branch_changes = []
+
+    def _update_branches(self):
+        changed, self._branch_changes = self._branch_changes, []
+        if not changed:
+            return
+        for split_task in sorted(self._watched_splits,
+                                 key=lambda t: t._left):
+            split_task.task_spec._branches_changed(split_task, changed)
 
     def _task_completed_notify(self, task):
         if task.get_name() == 'End':
-            self.data.update(task.data)
-        # Update the state of every WAITING task.
-        for thetask in self._get_waiting_tasks():
+            self.data.update(task._peek_data())
+        # Let the splits that watch their branches start new ones before
+        # the joins are updated.
+        if self._watched_splits:
+            self._update_branches()
+        # Update the state of every WAITING task that waits for this one.
+        for thetask in self._scheduler.get_waiting_for(task):
             thetask.task_spec._update(thetask)
         if self.completed_event.n_subscribers() == 0:
             # Since is_completed() is expensive it makes sense to bail
@@ -140,10 +474,7 @@ class Workflow(object):
                         completed.
         """
         self.success = success
-        cancel = []
-        mask = Task.NOT_FINISHED_MASK
-        for task in Task.Iterator(self.task_tree, mask):
-            cancel.append(task)
+        cancel = self.get_tasks(Task.NOT_FINISHED_MASK)
         for task in cancel:
             task.cancel()
 
@@ -162,13 +493,12 @@ class Workflow(object):
         """
         Returns the task with the given id.
 
-        :type id:integer
-        :param id: The id of a task.
+        :type id: object
+        :param id: The id of a task, as issued by the id allocator.
         :rtype: Task
         :returns: The task with the given id.
         """
-        tasks = [task for task in self.get_tasks() if task.id == id]
-        return tasks[0] if len(tasks) == 1 else None
+        return self.task_mapping.get(id)
 
     def get_tasks_from_spec_name(self, name):
         """
@@ -179,8 +509,44 @@ class Workflow(object):
         :rtype: Task
         :return: The task that relates to the spec with the given name.
         """
-        return [task for task in self.get_tasks()
-                if task.task_spec.name == name]
+        tasks = []
+        for task_spec, threads in self._tasks_by_spec.items():
+            if task_spec.name == name:
+                for thread_tasks in threads.values():
+                    tasks.extend(thread_tasks)
+        tasks.sort(key=lambda t: t._left)
+        return tasks
+
+    def _get_tasks_from_spec(self, task_spec, thread_id=None,
+                             state=Task.ANY_MASK):
+        """
+        Returns all tasks that have the given task spec assigned, in the
+        order of a tree walk.
+
+        :type  task_spec: TaskSpec
+        :param task_spec: The wanted task spec.
+        :type  thread_id: integer
+        :param thread_id: If given, only tasks of that thread are returned.
+        :type  state: integer
+        :param state: A bitmask of states. If no finished states are
+                      included, finished tasks are not even looked at.
+        :rtype:  list(Task)
+        :returns: The tasks that are attached to the given task spec.
+        """
+        if state & Task.FINISHED_MASK == 0:
+            threads = self._unfinished_tasks_by_spec.get(task_spec, {})
+        else:
+            threads = self._tasks_by_spec.get(task_spec, {})
+        if thread_id is not None:
+            tasks = list(threads.get(thread_id, ()))
+        else:
+            tasks = []
+            for thread_tasks in threads.values():
+                tasks.extend(thread_tasks)
+        if state != Task.ANY_MASK:
+            tasks = [t for t in tasks if t._has_state(state)]
+        tasks.sort(key=lambda t: t._left)
+        return tasks
 
     def get_tasks(self, state=Task.ANY_MASK):
         """
@@ -191,7 +557,180 @@ class Workflow(object):
         :rtype:  list[Task]
         :returns: A list of tasks.
         """
-        return [t for t in Task.Iterator(self.task_tree, state)]
+        # A tree walk does not descend into LIKELY tasks unless LIKELY
+        # tasks are searched, so it skips any predicted children below
+        # them. The state index has no such notion.
+        if state == Task.ANY_MASK or (
+                state & Task.LIKELY == 0 and
+                state & (Task.FUTURE | Task.MAYBE) != 0):
+            return [t for t in Task.Iterator(self.task_tree, state)]
+        tasks = []
+        for bit, bucket in self._tasks_by_state.items():
+            if bit & state:
+                tasks.extend(bucket)
+        tasks.sort(key=lambda t: t._left)
+        return tasks
+
+    def compact(self, keep_data=False):
+        """
+        Replaces finished branches of the task tree by short summaries (see
+        :class:`SpiffWorkflow.task.CompactedTask`), such that the tree does
+        not grow without bounds in long running or looping workflows.
+
+        A subtree is compacted if all of its tasks are finished, and none
+        of them may still be looked at by another task (see
+        :meth:`SpiffWorkflow.specs.TaskSpec._get_inspected_specs`). The
+        summaries are kept by the parent of each compacted subtree.
+
+        In a loop, each iteration hangs below the previous one, so the
+        finished iterations are ancestors of the tasks that still have to
+        run. The chain of finished tasks below the root, each of which has
+        only one child, is therefore folded into one summary that is kept
+        by the root, and the rest of the tree is moved up to the root. The
+        chain ends at the first task that may still be looked at, and the
+        parent of the tasks that still have to run is kept as well.
+
+        :type  keep_data: bool
+        :param keep_data: Whether the summaries keep a copy of the data of
+                          the task at the top of each compacted subtree.
+        :rtype:  integer
+        :returns: The number of tasks that were removed.
+        """
+        inspected = {}
+
+        def is_inspected(task):
+            wf_spec = task.workflow.spec
+            specs = inspected.get(wf_spec)
+            if specs is None:
+                specs = inspected[wf_spec] = set()
+                for task_spec in wf_spec.task_specs.values():
+                    specs.update(task_spec._get_inspected_specs())
+            return task.task_spec in specs
+
+        def may_compact(task):
+            if task._subtree_mask & Task.NOT_FINISHED_MASK:
+                return False
+            return not is_inspected(task)
+
+        # Find the subtrees that may be compacted. The walk also brings the
+        # subtree masks up to date.
+        sealed = set()
+        for task in Task.Iterator(self.task_tree, post_order=True):
+            if not may_compact(task):
+                continue
+            if all(child in sealed for child in task._children or ()):
+                sealed.add(task)
+
+        # Compact the largest of these subtrees.
+        removed = 0
+        stack = [self.task_tree]
+        while stack:
+            task = stack.pop()
+            for child in list(task._children or ()):
+                if child not in sealed:
+                    stack.append(child)
+                    continue
+                last = self.last_task
+                if last is not None and (
+                        last is child or last._is_descendant_of(child)):
+                    self.last_task = task
+                removed += task._compact_child(child, keep_data)
+
+        # Fold the chain of finished ancestors. Tasks of subworkflows, and
+        # splits that still watch their branches, end it.
+        path = []
+        task = self.task_tree
+        while task._children is not None and len(task._children) == 1:
+            task = task._children[0]
+            if task.workflow is not self or not task._is_finished() \
+                    or task in self._watched_splits or is_inspected(task):
+                break
+            path.append(task)
+        if len(path) > 1:
+            path.pop()
+            if self.last_task in set(path):
+                self.last_task = path[-1]._children[0]
+            # Below the root, only a chain that was folded before starts
+            # with a task other than the start task; its summary grows.
+            extend = path[0].task_spec is not self.spec.start
+            removed += self.task_tree._compact_path(path, keep_data, extend)
+        return removed
+
+    def _count_finished_tasks(self):
+        return len(self._tasks_by_state[Task.COMPLETED]) + \
+            len(self._tasks_by_state[Task.CANCELLED])
+
+    def _compact_if_needed(self):
+        if self._compact_at is None:
+            return
+        if self._count_finished_tasks() <= self._compact_at:
+            return
+        self.compact()
+        # If not enough could be compacted, wait for the tree to grow
+        # further before trying again.
+        self._compact_at = max(self.compact_threshold,
+                               2 * self._count_finished_tasks())
+
+    def archive(self):
+        """
+        Turns the completed workflow into a compact summary of the path that
+        it took and its final data. The task tree is released, so the
+        workflow can no longer be used afterwards.
+
+        The path holds every finished task in the order of a tree walk,
+        including the summaries of compacted branches (see
+        :meth:`compact`).
+
+        :rtype:  :class:`SpiffWorkflow.archive.WorkflowArchive`
+        :returns: The archive.
+        """
+        if not self.is_completed():
+            raise WorkflowException(
+                self.spec, 'only a completed workflow can be archived')
+        path = []
+        for task in Task.Iterator(self.task_tree, Task.FINISHED_MASK):
+            path.append(ArchivedTask(task.get_name(),
+                                     task.state,
+                                     task.last_state_change))
+            for summary in task._compacted or ():
+                path.append(ArchivedTask(summary.task_spec_name,
+                                         summary.state,
+                                         summary.last_state_change))
+        archive = WorkflowArchive(self.spec.name, self.success, path,
+                                  self.data)
+        self._release()
+        return archive
+
+    def _release(self):
+        """
+        Drops the task tree, and breaks the references between the tasks,
+        their workflows and subworkflows, such that all of them may be
+        freed right away.
+        """
+        workflows = set([self])
+        for task in list(Task.Iterator(self.task_tree)):
+            workflows.add(task.workflow)
+            task.parent = None
+            task._children = None
+            task._data = None
+            task._internal_data = None
+            task._compacted = None
+        for workflow in workflows:
+            workflow.task_tree = None
+            workflow.last_task = None
+            workflow.outer_workflow = workflow
+            workflow._graft_parent = None
+            workflow.task_mapping = {}
+            workflow._tasks_by_state = dict((state, set())
+                                            for state in Task.state_names)
+            workflow._tasks_by_spec = {}
+            workflow._unfinished_tasks_by_spec = {}
+            workflow._scheduler = Scheduler()
+            workflow._watched_splits = set()
+            workflow._branch_changes = []
+            workflow._work = {}
+            workflow._new_work = []
+            workflow.completed_event = Event()
 
     def complete_task_from_id(self, task_id):
         """
@@ -202,9 +741,12 @@ class Workflow(object):
         """
         if task_id is None:
             raise WorkflowException(self.spec, 'task_id is None')
-        for task in self.task_tree:
-            if task.id == task_id:
-                return task.complete()
+        self._compact_if_needed()
+        if self._new_work:
+            self._dispatch_work()
+        task = self.task_mapping.get(task_id)
+        if task is not None:
+            return task.complete()
         msg = 'A task with the given task_id (%s) was not found' % task_id
         raise WorkflowException(self.spec, msg)
 
@@ -225,8 +767,13 @@ class Workflow(object):
         :rtype:  bool
         :returns: True if all tasks were completed, False otherwise.
         """
-        # Try to pick up where we left off.
-        blacklist = []
+        self._compact_if_needed()
+        if self._new_work:
+            self._dispatch_work()
+
+        # Try to pick up where we left off. The search is limited to the
+        # subtree of the last task, where the subtree masks lead straight
+        # to any ready task.
         if pick_up and self.last_task is not None:
             try:
                 iter = Task.Iterator(self.last_task, Task.READY)
@@ -234,26 +781,26 @@ class Workflow(object):
             except StopIteration:
                 task = None
             self.last_task = None
-            if task is not None:
+            if task is not None and task not in task.workflow._work:
                 if not (halt_on_manual and task.task_spec.manual):
                     if task.complete():
                         self.last_task = task
                         return True
-                blacklist.append(task)
 
-        # Walk through all ready tasks.
-        for task in Task.Iterator(self.task_tree, Task.READY):
-            for blacklisted_task in blacklist:
-                if task._is_descendant_of(blacklisted_task):
+        # Take the ready tasks from the queue, in tree order.
+        ready = self._scheduler.iter_ready()
+        try:
+            for task in ready:
+                if halt_on_manual and task.task_spec.manual:
                     continue
-            if not (halt_on_manual and task.task_spec.manual):
                 if task.complete():
                     self.last_task = task
                     return True
-            blacklist.append(task)
+        finally:
+            ready.close()
 
         # Walk through all waiting tasks.
-        for task in Task.Iterator(self.task_tree, Task.WAITING):
+        for task in self._scheduler.get_waiting():
             task.task_spec._update(task)
             if not task._has_state(Task.WAITING):
                 self.last_task = task
@@ -276,15 +823,18 @@ class Workflow(object):
         while self.complete_next(pick_up, halt_on_manual):
             pass
 
-    def get_dump(self):
+    def get_dump(self, history=False):
         """
         Returns a complete dump of the current internal task tree for
         debugging.
 
+        :type  history: bool
+        :param history: Whether to include the history of each task, as far
+                        as the history policy keeps it.
         :rtype:  str
         :returns: The debug information.
         """
-        return self.task_tree.get_dump()
+        return self.task_tree.get_dump(history=history)
 
     def dump(self):
         """
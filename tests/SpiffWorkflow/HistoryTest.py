@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+from __future__ import print_function, absolute_import, division
+import sys
+import unittest
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..'))
+
+from SpiffWorkflow import Workflow, NoHistory, StateHistory, RingHistory, \
+    FullHistory
+from SpiffWorkflow.history import get_history
+from SpiffWorkflow.specs import WorkflowSpec, Simple
+from SpiffWorkflow.task import Task
+from SpiffWorkflow.serializer.dict import DictionarySerializer
+from SpiffWorkflow.serializer.xml import XmlSerializer
+
+
+class HistoryTest(unittest.TestCase):
+
+    def setUp(self):
+        self.spec = WorkflowSpec()
+        task1 = Simple(self.spec, 'task1')
+        self.spec.start.connect(task1)
+        task1.connect(Simple(self.spec, 'task2'))
+
+    def _run(self, history):
+        workflow = Workflow(self.spec, history=history)
+        workflow.complete_all()
+        self.assertTrue(workflow.is_completed())
+        return workflow.get_tasks_from_spec_name('task1')[0]
+
+    def testNoHistory(self):
+        task = self._run(NoHistory())
+        self.assertEqual(task.state_history, [])
+        self.assertEqual(task.log, [])
+        self.assertEqual(task._state_history, None)
+        self.assertEqual(task._log, None)
+
+    def testStateHistory(self):
+        task = self._run(StateHistory())
+        self.assertEqual(task.state_history, [Task.FUTURE, Task.READY,
+                                              Task.COMPLETED])
+        self.assertEqual(task.log, [])
+
+    def testRingHistory(self):
+        task = self._run(RingHistory(2))
+        self.assertEqual(task.state_history, [Task.READY, Task.COMPLETED])
+        self.assertEqual(task.log,
+                         ["Moving 'task1' from FUTURE to READY",
+                          "Moving 'task1' from READY to COMPLETED"])
+
+    def testFullHistory(self):
+        task = self._run(None)
+        self.assertIsInstance(task.workflow.history, FullHistory)
+        self.assertEqual(task.state_history, [Task.FUTURE, Task.READY,
+                                              Task.COMPLETED])
+        if __debug__:
+            self.assertEqual(len(task.log), 2)
+
+    def testGetHistory(self):
+        self.assertIsInstance(get_history('none'), NoHistory)
+        self.assertIsInstance(get_history('states'), StateHistory)
+        self.assertIsInstance(get_history('full'), FullHistory)
+        history = get_history('ring', 5)
+        self.assertIsInstance(history, RingHistory)
+        self.assertEqual(history.size, 5)
+
+    def testGetDump(self):
+        task = self._run(StateHistory())
+        dump = task.get_dump(recursive=False, history=True)
+        self.assertTrue(dump.endswith(
+            'History: FUTURE -> READY -> COMPLETED'), dump)
+        self.assertFalse('History' in task.get_dump(recursive=False))
+
+    def testSerialize(self):
+        for history in (NoHistory(), StateHistory(), RingHistory(2),
+                        FullHistory()):
+            for serializer in (DictionarySerializer(), XmlSerializer()):
+                task = self._run(history)
+                workflow = Workflow.deserialize(
+                    serializer, task.workflow.serialize(serializer))
+                self.assertEqual(workflow.history.__class__,
+                                 history.__class__)
+                restored = workflow.get_tasks_from_spec_name('task1')[0]
+                self.assertEqual(restored.state_history, task.state_history)
+                self.assertEqual(restored.log, task.log)
+                self.assertEqual(workflow.get_dump(history=True),
+                                 task.workflow.get_dump(history=True))
+
+    def testSerializeLazy(self):
+        # Tasks that never changed their state have no history allocated,
+        # neither before nor after serializing.
+        for serializer in (DictionarySerializer(), XmlSerializer()):
+            workflow = Workflow(self.spec, history=FullHistory())
+            task = workflow.get_tasks_from_spec_name('task2')[0]
+            self.assertEqual(task._state_history, None)
+            state = workflow.serialize(serializer)
+            self.assertEqual(task._state_history, None)
+            self.assertEqual(task._log, None)
+
+            workflow = Workflow.deserialize(serializer, state)
+            restored = workflow.get_tasks_from_spec_name('task2')[0]
+            self.assertEqual(restored._state_history, None)
+            self.assertEqual(restored._log, None)
+            self.assertEqual(restored.state_history, [restored.state])
+            start = workflow.get_tasks_from_spec_name('Start')[0]
+            self.assertTrue(start._state_history)
+
+
+def suite():
+    return unittest.TestLoader().loadTestsFromTestCase(HistoryTest)
+if __name__ == '__main__':
+    unittest.TextTestRunner(verbosity=2).run(suite())
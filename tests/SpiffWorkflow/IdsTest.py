@@ -0,0 +1,169 @@
+# -*- coding: utf-8 -*-
+from __future__ import print_function, absolute_import, division
+import sys
+import unittest
+import os
+import json
+import threading
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..'))
+
+from SpiffWorkflow import Workflow, UuidAllocator, SequentialAllocator
+from SpiffWorkflow.ids import get_id_allocator, ThreadIdPool
+from SpiffWorkflow.specs import WorkflowSpec, Simple, ThreadSplit
+from SpiffWorkflow.task import Task
+from SpiffWorkflow.serializer.dict import DictionarySerializer
+from SpiffWorkflow.serializer.json import JSONSerializer
+from SpiffWorkflow.serializer.xml import XmlSerializer
+from SpiffWorkflow.bpmn.workflow import BpmnWorkflow
+from SpiffWorkflow.bpmn.serializer.CompactWorkflowSerializer import \
+    CompactWorkflowSerializer
+from tests.SpiffWorkflow.bpmn.BpmnWorkflowTestCase import BpmnWorkflowTestCase
+
+
+class IdsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.spec = WorkflowSpec()
+        task1 = Simple(self.spec, 'task1')
+        self.spec.start.connect(task1)
+        task1.connect(Simple(self.spec, 'task2'))
+
+    def testUuidAllocator(self):
+        workflow = Workflow(self.spec)
+        self.assertIsInstance(workflow.id_allocator, UuidAllocator)
+        task = workflow.get_tasks_from_spec_name('task1')[0]
+        self.assertTrue(workflow.get_task(task.id) is task)
+        allocator = workflow.id_allocator
+        self.assertEqual(allocator.decode(allocator.encode(task.id)), task.id)
+
+    def testSequentialAllocator(self):
+        workflow = Workflow(self.spec, id_allocator=SequentialAllocator())
+        ids = sorted(task.id for task in workflow.get_tasks())
+        self.assertEqual(ids, list(range(1, len(ids) + 1)))
+        task = workflow.get_tasks_from_spec_name('task1')[0]
+        self.assertTrue(workflow.get_task(task.id) is task)
+        workflow.complete_task_from_id(workflow.task_tree.children[0].id)
+        self.assertEqual(workflow.id_allocator.decode('7'), 7)
+
+    def testInstanceIds(self):
+        allocator = SequentialAllocator('order:42')
+        workflow = Workflow(self.spec, id_allocator=allocator)
+        self.assertEqual(workflow.task_tree.id, ('order:42', 1))
+        self.assertEqual(allocator.encode(('order:42', 1)), 'order:42:1')
+        self.assertEqual(allocator.decode('order:42:1'), ('order:42', 1))
+        self.assertEqual(allocator.decode(['order:42', 1]), ('order:42', 1))
+
+    def testGetIdAllocator(self):
+        self.assertIsInstance(get_id_allocator('uuid'), UuidAllocator)
+        allocator = get_id_allocator('sequential', ['a', 5])
+        self.assertIsInstance(allocator, SequentialAllocator)
+        self.assertEqual(allocator.new_id(), ('a', 6))
+
+    def testSerialize(self):
+        serializers = (DictionarySerializer(), JSONSerializer(),
+                       XmlSerializer())
+        for allocator in (UuidAllocator, SequentialAllocator,
+                          lambda: SequentialAllocator('instance')):
+            for serializer in serializers:
+                workflow = Workflow(self.spec, id_allocator=allocator())
+                workflow.complete_next()
+                workflow.compact()
+                restored = Workflow.deserialize(
+                    serializer, workflow.serialize(serializer))
+                self.assertEqual(restored.id_allocator.__class__,
+                                 workflow.id_allocator.__class__)
+                self.assertEqual(restored.id_allocator.get_state(),
+                                 workflow.id_allocator.get_state())
+                for task in workflow.get_tasks():
+                    self.assertEqual(restored.get_task(task.id).task_spec.name,
+                                     task.task_spec.name)
+                self.assertEqual(restored.last_task.id,
+                                 workflow.last_task.id)
+                self.assertEqual([s.id for s in restored.task_tree.compacted],
+                                 [s.id for s in workflow.task_tree.compacted])
+
+                # New tasks do not reuse ids.
+                new_task = Task(restored, restored.spec.start)
+                self.assertFalse(new_task.id in workflow.task_mapping)
+
+    def testJSONEncoding(self):
+        serializer = JSONSerializer()
+        workflow = Workflow(self.spec, id_allocator=SequentialAllocator())
+        s_state = json.loads(workflow.serialize(serializer))
+        self.assertEqual(s_state['task_tree']['id'], 1)
+
+
+class ThreadIdPoolTest(unittest.TestCase):
+
+    def setUp(self):
+        self.spec = WorkflowSpec()
+        split = ThreadSplit(self.spec, 'split', times=3)
+        self.spec.start.connect(split)
+        split.connect(Simple(self.spec, 'task'))
+
+    def _get_thread_ids(self, workflow):
+        return sorted(task.thread_id for task in
+                      workflow.get_tasks_from_spec_name('task'))
+
+    def testReproducible(self):
+        # Every workflow has a pool of its own.
+        for n in range(2):
+            workflow = Workflow(self.spec)
+            workflow.complete_all()
+            self.assertEqual(self._get_thread_ids(workflow), [1, 2, 3])
+            self.assertEqual(workflow.thread_id_pool.last_id, 3)
+
+    def testSerialize(self):
+        for serializer in (DictionarySerializer(), JSONSerializer(),
+                           XmlSerializer()):
+            workflow = Workflow(self.spec)
+            workflow.complete_all()
+            restored = Workflow.deserialize(
+                serializer, workflow.serialize(serializer))
+            self.assertEqual(restored.thread_id_pool.last_id, 3)
+            self.assertEqual(self._get_thread_ids(restored),
+                             self._get_thread_ids(workflow))
+            self.assertEqual(restored.thread_id_pool.new_id(), 4)
+
+    def testConcurrentIds(self):
+        pool = ThreadIdPool()
+        ids = []
+
+        def issue():
+            ids.extend([pool.new_id() for n in range(1000)])
+        threads = [threading.Thread(target=issue) for n in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(sorted(ids), list(range(1, 4001)))
+
+
+class CompactIdsTest(BpmnWorkflowTestCase):
+
+    def testCompactRestore(self):
+        self.spec = self.load_workflow_spec('Test-Workflows/*.bpmn20.xml',
+                                            'Nested Subprocesses')
+        self.workflow = BpmnWorkflow(self.spec,
+                                     id_allocator=SequentialAllocator())
+        self.do_next_named_step('Action1')
+        self.workflow.do_engine_steps()
+        state = self._get_workflow_state()
+
+        restored = CompactWorkflowSerializer().deserialize_workflow(
+            state, workflow_spec=self.spec,
+            id_allocator=SequentialAllocator())
+        self.assertIsInstance(restored.id_allocator, SequentialAllocator)
+        for task in restored.get_tasks(Task.READY):
+            self.assertIsInstance(task.id, int)
+            self.assertTrue(task.workflow.get_task(task.id) is task)
+        self.assertEqual(self._get_workflow_state(), state)
+
+
+def suite():
+    return unittest.TestSuite([
+        unittest.TestLoader().loadTestsFromTestCase(IdsTest),
+        unittest.TestLoader().loadTestsFromTestCase(ThreadIdPoolTest),
+        unittest.TestLoader().loadTestsFromTestCase(CompactIdsTest)])
+if __name__ == '__main__':
+    unittest.TextTestRunner(verbosity=2).run(suite())
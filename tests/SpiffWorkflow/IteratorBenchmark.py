@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+"""
+Compares the speed of Task.Iterator with the iterator that it replaced,
+which searched the children of the parent on every step back up the tree.
+
+Usage: python IteratorBenchmark.py [width ...]
+"""
+from __future__ import print_function, absolute_import, division
+from builtins import object
+import sys
+import os.path
+import timeit
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..'))
+
+from SpiffWorkflow import Task, FullHistory, UuidAllocator
+from SpiffWorkflow.ids import ThreadIdPool
+from SpiffWorkflow.specs import WorkflowSpec, Simple
+
+
+class MockWorkflow(object):
+
+    history = FullHistory()
+    id_allocator = UuidAllocator()
+    thread_id_pool = ThreadIdPool()
+
+    def _task_added_notify(self, task):
+        pass
+
+    def _task_removed_notify(self, task):
+        pass
+
+    def _task_state_changed_notify(self, task, old_state):
+        pass
+
+    def _task_thread_changed_notify(self, task, old_thread_id):
+        pass
+
+
+class LegacyIterator(object):
+
+    """
+    The former implementation of Task.Iterator.
+    """
+
+    def __init__(self, current, filter=None):
+        self.filter = filter
+        self.path = [current]
+
+    def __iter__(self):
+        return self
+
+    def _next(self):
+        if len(self.path) == 0:
+            raise StopIteration()
+        current = self.path[-1]
+        ignore_task = False
+        if self.filter is not None:
+            search_predicted = self.filter & Task.LIKELY != 0
+            is_predicted = current.state & Task.LIKELY != 0
+            ignore_task = is_predicted and not search_predicted
+        if current.children and not ignore_task:
+            self.path.append(current.children[0])
+            if (self.filter is not None and
+                    current.state & self.filter == 0):
+                return None
+            return current
+        while True:
+            old_child = self.path.pop(-1)
+            if len(self.path) == 0:
+                break
+            parent = self.path[-1]
+            pos = parent.children.index(old_child)
+            if len(parent.children) > pos + 1:
+                self.path.append(parent.children[pos + 1])
+                break
+        if self.filter is not None and current.state & self.filter == 0:
+            return None
+        return current
+
+    def __next__(self):
+        while True:
+            next = self._next()
+            if next is not None:
+                return next
+
+    next = __next__
+
+
+def build_wide_tree(width):
+    """
+    Builds a tree that resembles a MultiInstance split: a root with the
+    given number of children, each of which has a single child.
+    """
+    spec = WorkflowSpec()
+    workflow = MockWorkflow()
+    task_spec = Simple(spec, 'Simple')
+    root = Task(workflow, task_spec, state=Task.COMPLETED)
+    for n in range(width):
+        child = Task(workflow, task_spec, root, Task.COMPLETED)
+        Task(workflow, task_spec, child, Task.READY)
+    return root
+
+
+def run(width, repeat=3):
+    root = build_wide_tree(width)
+    iterators = (('legacy', LegacyIterator), ('current', Task.Iterator))
+    for name, iterator in iterators:
+        for mask in (None, Task.READY):
+            seconds = min(timeit.repeat(lambda: list(iterator(root, mask)),
+                                        number=1,
+                                        repeat=repeat))
+            print('%-7s width=%-6d filter=%-5s %8.4fs' % (
+                name, width, mask, seconds))
+
+
+if __name__ == '__main__':
+    widths = [int(arg) for arg in sys.argv[1:]] or [1000, 5000, 20000]
+    for width in widths:
+        run(width)
@@ -0,0 +1,161 @@
+# -*- coding: utf-8 -*-
+from __future__ import print_function, absolute_import, division
+import sys
+import unittest
+import os
+import time
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..'))
+
+from SpiffWorkflow import Workflow
+from SpiffWorkflow.specs import WorkflowSpec, Simple, MultiInstance, \
+    ThreadSplit, Join
+from SpiffWorkflow.serializer.dict import DictionarySerializer
+from SpiffWorkflow.serializer.xml import XmlSerializer
+
+
+def _double(item, delay):
+    time.sleep(delay)
+    if item < 0:
+        raise ValueError('negative item')
+    return {'result': item * 2}
+
+
+class DoubleItem(Simple):
+
+    """
+    Doubles the 'item' data field of the task, 1 by default, taking the
+    given time.
+    """
+
+    def __init__(self, wf_spec, name, delay=0, **kwargs):
+        Simple.__init__(self, wf_spec, name, **kwargs)
+        self.delay = delay
+
+    def _get_work(self, my_task):
+        return partial(_double, my_task.get_data('item', 1),
+                       self.delay)
+
+    def _on_complete_hook(self, my_task):
+        self._run_work(my_task)
+        Simple._on_complete_hook(self, my_task)
+
+
+class ParallelTest(unittest.TestCase):
+
+    def _create_spec(self, create_split, delay=0, parallel_safe=True):
+        self.spec = WorkflowSpec()
+        split = create_split(self.spec)
+        self.spec.start.connect(split)
+        task = DoubleItem(self.spec, 'task', delay,
+                          parallel_safe=parallel_safe)
+        split.connect(task)
+        join = Join(self.spec, 'join', split_task='split')
+        task.connect(join)
+        join.connect(Simple(self.spec, 'last'))
+
+        self.completed = []
+        task.completed_event.connect(
+            lambda workflow, my_task: self.completed.append(my_task))
+
+    def _create_multi_instance(self, items, **kwargs):
+        self._create_spec(lambda spec: MultiInstance(spec, 'split', items,
+                                                     item_name='item'),
+                          **kwargs)
+
+    def _run(self, executor=None):
+        del self.completed[:]
+        workflow = Workflow(self.spec, executor=executor)
+        workflow.complete_all()
+        self.assertTrue(workflow.is_completed())
+        return [task.get_data('result') for task in self.completed]
+
+    def testThreadPool(self):
+        items = list(range(8))
+        self._create_multi_instance(items, delay=0.2)
+        start = time.time()
+        with ThreadPoolExecutor(len(items)) as executor:
+            results = self._run(executor)
+        self.assertTrue(time.time() - start < 1.0)
+
+        # The results are merged in the order of a serial run.
+        self.assertEqual(results, [item * 2 for item in items])
+        self._create_multi_instance(items)
+        self.assertEqual(self._run(), results)
+
+    def testProcessPool(self):
+        self._create_multi_instance([1, 2, 3])
+        with ProcessPoolExecutor(2) as executor:
+            self.assertEqual(self._run(executor), [2, 4, 6])
+
+    def testThreadSplit(self):
+        self._create_spec(lambda spec: ThreadSplit(spec, 'split', times=4),
+                          delay=0.2)
+        start = time.time()
+        with ThreadPoolExecutor(4) as executor:
+            self.assertEqual(self._run(executor), [2, 2, 2, 2])
+        self.assertTrue(time.time() - start < 0.6)
+
+    def testSetExecutor(self):
+        # Tasks that are READY when the executor is set are picked up.
+        self._create_multi_instance([1, 2])
+        workflow = Workflow(self.spec)
+        workflow.complete_next()
+        workflow.complete_next()
+        self.assertEqual(workflow._work, {})
+        with ThreadPoolExecutor(2) as executor:
+            workflow.executor = executor
+            workflow._dispatch_work()
+            self.assertEqual(len(workflow._work), 2)
+            workflow.complete_all()
+        self.assertEqual(workflow._work, {})
+        self.assertEqual([t.get_data('result') for t in self.completed],
+                         [2, 4])
+
+    def testNotParallelSafe(self):
+        self._create_multi_instance([1, 2], parallel_safe=False)
+        with ThreadPoolExecutor(2) as executor:
+            workflow = Workflow(self.spec, executor=executor)
+            workflow.complete_next()
+            workflow._dispatch_work()
+            self.assertEqual(workflow._work, {})
+            workflow.complete_all()
+        self.assertEqual([t.get_data('result') for t in self.completed],
+                         [2, 4])
+
+    def testCancel(self):
+        # The work of cancelled tasks that did not start yet is cancelled.
+        self._create_multi_instance([1, 2, 3], delay=0.2)
+        with ThreadPoolExecutor(1) as executor:
+            workflow = Workflow(self.spec, executor=executor)
+            while not workflow._work:
+                workflow.complete_next()
+                workflow._dispatch_work()
+            futures = list(workflow._work.values())
+            self.assertEqual(len(futures), 3)
+            workflow.cancel()
+            self.assertEqual(workflow._work, {})
+            self.assertTrue(futures[-1].cancelled())
+
+    def testError(self):
+        # Errors are raised on the engine thread.
+        self._create_multi_instance([1, -1])
+        with ThreadPoolExecutor(2) as executor:
+            self.assertRaises(ValueError, self._run, executor)
+
+    def testSerializeSpec(self):
+        spec = WorkflowSpec()
+        spec.start.connect(Simple(spec, 'task', parallel_safe=True))
+        for serializer in (DictionarySerializer(), XmlSerializer()):
+            restored = WorkflowSpec.deserialize(serializer,
+                                                spec.serialize(serializer))
+            task_spec = restored.get_task_spec_from_name('task')
+            self.assertTrue(task_spec.parallel_safe)
+            self.assertFalse(restored.start.parallel_safe)
+
+
+def suite():
+    return unittest.TestLoader().loadTestsFromTestCase(ParallelTest)
+if __name__ == '__main__':
+    unittest.TextTestRunner(verbosity=2).run(suite())
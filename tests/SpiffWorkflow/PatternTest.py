@@ -28,7 +28,6 @@ class PatternTest(unittest.TestCase):
 
     def setUp(self):
         Task.id_pool = 0
-        Task.thread_id_pool = 0
         self.xml_path = ['data/spiff/control-flow',
                          'data/spiff/data',
                          'data/spiff/resource',
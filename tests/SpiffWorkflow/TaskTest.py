@@ -6,23 +6,40 @@ from builtins import object
 import sys
 import unittest
 import re
+import pickle
 import os.path
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..'))
 
-from SpiffWorkflow import Task
+from SpiffWorkflow import Task, FullHistory, UuidAllocator
+from SpiffWorkflow import task as task_module
+from SpiffWorkflow.ids import ThreadIdPool
 from SpiffWorkflow.specs import WorkflowSpec, Simple
 from SpiffWorkflow.exceptions import WorkflowException
 
 
 class MockWorkflow(object):
-    pass
+
+    history = FullHistory()
+    id_allocator = UuidAllocator()
+    thread_id_pool = ThreadIdPool()
+
+    def _task_added_notify(self, task):
+        pass
+
+    def _task_removed_notify(self, task):
+        pass
+
+    def _task_state_changed_notify(self, task, old_state):
+        pass
+
+    def _task_thread_changed_notify(self, task, old_thread_id):
+        pass
 
 
 class TaskTest(unittest.TestCase):
 
     def setUp(self):
         Task.id_pool = 0
-        Task.thread_id_pool = 0
 
     def testTree(self):
         # Build a tree.
@@ -80,6 +97,273 @@ class TaskTest(unittest.TestCase):
                         'Expected:\n' + repr(expected2.pattern) + '\n' +
                         'but got:\n' + repr(result))
 
+    def testSubtreeMask(self):
+        spec = WorkflowSpec()
+        workflow = MockWorkflow()
+        root = Task(workflow, Simple(spec, 'Simple 1'), state=Task.COMPLETED)
+        c1 = Task(workflow, Simple(spec, 'Simple 2'), root, Task.COMPLETED)
+        c11 = Task(workflow, Simple(spec, 'Simple 3'), c1, Task.READY)
+        c2 = Task(workflow, Simple(spec, 'Simple 4'), root, Task.FUTURE)
+        self.assertEqual(root._subtree_mask,
+                         Task.COMPLETED | Task.READY | Task.FUTURE)
+        self.assertEqual(c1._subtree_mask, Task.COMPLETED | Task.READY)
+
+        # Finishing a task leaves the old state in the masks, until a walk
+        # passes by.
+        c11.state = Task.COMPLETED
+        self.assertEqual(c1._subtree_mask, Task.COMPLETED | Task.READY)
+        self.assertEqual(list(Task.Iterator(root, Task.READY)), [])
+        self.assertEqual(c1._subtree_mask, Task.COMPLETED)
+        self.assertEqual(root._subtree_mask, Task.COMPLETED | Task.FUTURE)
+
+        # The finished subtree is now skipped entirely.
+        visited = []
+        c1.children = TrackingList(c1.children, visited)
+        self.assertEqual(list(Task.Iterator(root, Task.FUTURE)), [c2])
+        self.assertEqual(visited, [])
+
+    def testIteratorOrder(self):
+        spec = WorkflowSpec()
+        workflow = MockWorkflow()
+        root = Task(workflow, Simple(spec, 'Simple 1'))
+        c1 = Task(workflow, Simple(spec, 'Simple 2'), root)
+        c11 = Task(workflow, Simple(spec, 'Simple 3'), c1)
+        c12 = Task(workflow, Simple(spec, 'Simple 4'), c1)
+        c2 = Task(workflow, Simple(spec, 'Simple 5'), root)
+        c21 = Task(workflow, Simple(spec, 'Simple 6'), c2)
+
+        self.assertEqual(list(Task.Iterator(root)),
+                         [root, c1, c11, c12, c2, c21])
+        self.assertEqual(list(Task.Iterator(root, post_order=True)),
+                         [c11, c12, c1, c21, c2, root])
+
+        # Only the wanted tasks are returned, but the predicate does not
+        # stop the walk from descending.
+        def is_leaf(task):
+            return not task.children
+        self.assertEqual(list(Task.Iterator(root, predicate=is_leaf)),
+                         [c11, c12, c21])
+
+        # Predicted tasks below LIKELY tasks are not searched, unless
+        # LIKELY tasks are.
+        c2.state = Task.LIKELY
+        self.assertEqual(list(Task.Iterator(root, Task.MAYBE)),
+                         [root, c1, c11, c12])
+        self.assertEqual(list(Task.Iterator(root, Task.MAYBE | Task.LIKELY)),
+                         [root, c1, c11, c12, c2, c21])
+
+    def testAncestors(self):
+        spec = WorkflowSpec()
+        workflow = MockWorkflow()
+        root = Task(workflow, Simple(spec, 'Simple 1'))
+        c1 = Task(workflow, Simple(spec, 'Simple 2'), root)
+        c11 = Task(workflow, Simple(spec, 'Simple 3'), c1)
+        c2 = Task(workflow, Simple(spec, 'Simple 4'), root)
+        # Enough children to require relabeling.
+        task_spec = Simple(spec, 'Simple 5')
+        for n in range(100):
+            c21 = Task(workflow, task_spec, c2)
+
+        self.assertTrue(c11._is_descendant_of(c1))
+        self.assertTrue(c11._is_descendant_of(root))
+        self.assertTrue(c21._is_descendant_of(c2))
+        self.assertFalse(c11._is_descendant_of(c11))
+        self.assertFalse(c11._is_descendant_of(c2))
+        self.assertFalse(c21._is_descendant_of(c1))
+        self.assertFalse(root._is_descendant_of(c1))
+
+        # Trees that are not connected are never related.
+        other = Task(workflow, Simple(spec, 'Simple 6'))
+        self.assertFalse(c11._is_descendant_of(other))
+        self.assertFalse(other._is_descendant_of(root))
+
+        self.assertEqual(c11._get_depth(), 2)
+        self.assertTrue(c21._get_root() is root)
+        self.assertTrue(c11._find_ancestor(c1.task_spec) is c1)
+        self.assertTrue(c11._find_ancestor(other.task_spec) is root)
+        self.assertTrue(c11._find_ancestor_from_name('Simple 1') is root)
+        self.assertEqual(c11._find_ancestor_from_name('Simple 6'), None)
+        self.assertTrue(c11._find_child_of(root.task_spec) is c1)
+
+    def assertLabelsOrdered(self, root):
+        # The labels of a walk that visits each task before and after its
+        # children are strictly increasing.
+        labels = [root._left]
+        stack = [(root, iter(root.children))]
+        while stack:
+            task, children = stack[-1]
+            child = next(children, None)
+            if child is None:
+                labels.append(task._right)
+                stack.pop()
+                continue
+            labels.append(child._left)
+            stack.append((child, iter(child.children)))
+        self.assertEqual(sorted(set(labels)), labels)
+
+    def testLabels(self):
+        # Start with a small range of labels, so that it fills up.
+        spec = WorkflowSpec()
+        workflow = MockWorkflow()
+        task_spec = Simple(spec, 'Simple 1')
+        relabeled = []
+        pack_labels = task_module._pack_labels
+        label_bits = task_module._LABEL_BITS
+
+        def count_labels(labels, value, step):
+            relabeled.extend(labels)
+            return pack_labels(labels, value, step)
+        task_module._pack_labels = count_labels
+        task_module._LABEL_BITS = 12
+        try:
+            # A long chain only relabels a bounded number of labels.
+            root = task = Task(workflow, task_spec)
+            for n in range(5000):
+                task = Task(workflow, task_spec, task)
+            self.assertLabelsOrdered(root)
+            self.assertTrue(task._is_descendant_of(root))
+            self.assertTrue(len(relabeled) < 5000)
+
+            # So does a long row of children.
+            del relabeled[:]
+            root = Task(workflow, task_spec)
+            for n in range(5000):
+                Task(workflow, task_spec, root)
+            self.assertLabelsOrdered(root)
+            self.assertTrue(len(relabeled) < 10 * 5000)
+        finally:
+            task_module._pack_labels = pack_labels
+            task_module._LABEL_BITS = label_bits
+
+    def testLazyContainers(self):
+        spec = WorkflowSpec()
+        workflow = MockWorkflow()
+        root = Task(workflow, Simple(spec, 'Simple 1'))
+        child = Task(workflow, Simple(spec, 'Simple 2'), root)
+        self.assertFalse(hasattr(root, '__dict__') and root.__dict__)
+        self.assertEqual(child._children, None)
+        self.assertEqual(child._data, None)
+
+        # Reading does not allocate anything.
+        self.assertEqual(child.get_data('foo', 'default'), 'default')
+        self.assertEqual(child._get_internal_data('foo'), None)
+        self.assertEqual(list(Task.Iterator(root)), [root, child])
+        self.assertEqual(child._data, None)
+        self.assertEqual(child._children, None)
+
+        self.assertEqual(child.state_history, [Task.MAYBE])
+        child.state = Task.FUTURE
+        self.assertEqual(child.state_history, [Task.MAYBE, Task.FUTURE])
+        child.set_data(foo='bar')
+        self.assertEqual(child.get_data('foo'), 'bar')
+        self.assertEqual(child.data, {'foo': 'bar'})
+
+    def testInheritData(self):
+        spec = WorkflowSpec()
+        workflow = MockWorkflow()
+        root = Task(workflow, Simple(spec, 'Simple 1'))
+        c1 = Task(workflow, Simple(spec, 'Simple 2'), root)
+        c2 = Task(workflow, Simple(spec, 'Simple 3'), root)
+        root.set_data(foo=1, bar=2)
+
+        # Children without data of their own share the data of the parent.
+        c1._inherit_data()
+        c2._inherit_data()
+        self.assertTrue(c1._peek_data() is root._peek_data())
+        self.assertTrue(c2._peek_data() is root._peek_data())
+        self.assertEqual(c1.get_data('foo'), 1)
+
+        # Writing copies the data first.
+        c1.set_data(foo=3)
+        self.assertEqual(c1.data, {'foo': 3, 'bar': 2})
+        self.assertEqual(root.data, {'foo': 1, 'bar': 2})
+        self.assertEqual(c2.data, {'foo': 1, 'bar': 2})
+        root.data['bar'] = 4
+        self.assertEqual(c2.get_data('bar'), 2)
+
+        # Inheriting again merges the data of the parent.
+        c1.set_data(baz=5)
+        c1._inherit_data()
+        self.assertEqual(c1.data, {'foo': 1, 'bar': 4, 'baz': 5})
+
+    def testSyncChildren(self):
+        spec = WorkflowSpec()
+        workflow = MockWorkflow()
+        a, b, c = [Simple(spec, name) for name in 'abc']
+        root = Task(workflow, Simple(spec, 'Root'), state=Task.FUTURE)
+
+        def get_names():
+            return [child.get_name() for child in root.children]
+
+        root._sync_children([a, b, a], Task.LIKELY)
+        self.assertEqual(get_names(), ['a', 'b', 'a'])
+        first = root.children[0]
+
+        # Existing children take the place of the first occurrences of
+        # their spec; surplus children are removed.
+        root._sync_children([c, a, b, c], Task.LIKELY)
+        self.assertEqual(get_names(), ['a', 'b', 'c', 'c'])
+        self.assertTrue(root.children[0] is first)
+
+        # Triggered tasks are never removed.
+        root.children[2].triggered = True
+        root._sync_children([b], Task.LIKELY)
+        self.assertEqual(get_names(), ['b', 'c'])
+
+        # Non-predicted children must not be removed.
+        root.children[0]._set_state(Task.READY)
+        self.assertRaises(WorkflowException, root._sync_children, [a])
+
+        # New children belong to the thread of the parent.
+        root.thread_id = 5
+        root._sync_children([b, a, a], Task.LIKELY)
+        self.assertEqual(get_names(), ['b', 'c', 'a', 'a'])
+        self.assertEqual([child.thread_id for child in root.children[2:]],
+                         [5, 5])
+
+    def testPickle(self):
+        spec = WorkflowSpec()
+        workflow = MockWorkflow()
+        root = Task(workflow, Simple(spec, 'Simple 1'))
+        child = Task(workflow, Simple(spec, 'Simple 2'), root)
+        child.set_data(foo='bar')
+        child.extra = 'extra'
+
+        root = pickle.loads(pickle.dumps(root, -1))
+        child = root.children[0]
+        self.assertTrue(child.parent is root)
+        self.assertEqual(child.get_data('foo'), 'bar')
+        self.assertEqual(child.extra, 'extra')
+        self.assertEqual(root._data, None)
+        self.assertEqual(list(Task.Iterator(root)), [root, child])
+
+        # Pickles of older versions use the names from before the slots.
+        task = Task.__new__(Task)
+        state = root.__getstate__()
+        state['thread_id'] = state.pop('_thread_id')
+        state['children'] = state.pop('_children')
+        state['data'] = {'foo': 'baz'}
+        for name in ('_left', '_right', '_subtree_mask', '_root', '_depth'):
+            del state[name]
+        task.__setstate__(state)
+        self.assertEqual(task.thread_id, root.thread_id)
+        self.assertEqual(task.children, [child])
+        self.assertEqual(task.get_data('foo'), 'baz')
+
+class TrackingList(list):
+
+    def __init__(self, items, visited):
+        list.__init__(self, items)
+        self.visited = visited
+
+    def __getitem__(self, index):
+        self.visited.append(index)
+        return list.__getitem__(self, index)
+
+    def __iter__(self):
+        self.visited.append(None)
+        return list.__iter__(self)
+
 
 def suite():
     return unittest.TestLoader().loadTestsFromTestCase(TaskTest)
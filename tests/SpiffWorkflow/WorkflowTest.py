@@ -4,6 +4,7 @@ import sys
 import unittest
 import re
 import os
+import pickle
 data_dir = os.path.join(os.path.dirname(__file__), 'data')
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..'))
 
@@ -11,7 +12,11 @@ from SpiffWorkflow import Workflow
 from SpiffWorkflow.specs import *
 from SpiffWorkflow.operators import *
 from SpiffWorkflow.task import Task
+from SpiffWorkflow.exceptions import WorkflowException
 from SpiffWorkflow.serializer.prettyxml import XmlSerializer
+from SpiffWorkflow.serializer.dict import DictionarySerializer
+from SpiffWorkflow.serializer.xml import XmlSerializer as \
+    XmlWorkflowSerializer
 
 
 class WorkflowTest(unittest.TestCase):
@@ -70,6 +75,272 @@ class WorkflowTest(unittest.TestCase):
         self.assertEqual(tasks[0].task_spec.name, 'synch_1')
         # haven't reached the end of the workflow, but stopping at "synch_1"
 
+    def testGetTask(self):
+        xml_file = os.path.join(data_dir, 'spiff', 'workflow1.xml')
+        with open(xml_file) as fp:
+            xml = fp.read()
+        wf_spec = WorkflowSpec.deserialize(XmlSerializer(), xml)
+        workflow = Workflow(wf_spec)
+        workflow.complete_all()
+
+        # Every task in the tree is registered, and nothing else.
+        tasks = workflow.get_tasks()
+        self.assertEqual(len(tasks), len(workflow.task_mapping))
+        for task in tasks:
+            self.assertTrue(workflow.get_task(task.id) is task)
+        self.assertEqual(workflow.get_task('no such id'), None)
+
+    def testGetTasksByState(self):
+        xml_file = os.path.join(data_dir, 'spiff', 'workflow1.xml')
+        with open(xml_file) as fp:
+            xml = fp.read()
+        wf_spec = WorkflowSpec.deserialize(XmlSerializer(), xml)
+        workflow = Workflow(wf_spec)
+
+        # The state index must return the same tasks, in the same order,
+        # as a walk over the tree.
+        masks = (Task.READY, Task.WAITING, Task.COMPLETED,
+                 Task.READY | Task.WAITING, Task.NOT_FINISHED_MASK,
+                 Task.FINISHED_MASK, Task.PREDICTED_MASK)
+        while not workflow.is_completed():
+            for mask in masks:
+                expected = list(Task.Iterator(workflow.task_tree, mask))
+                self.assertEqual(workflow.get_tasks(mask), expected)
+            workflow.complete_next()
+        self.assertEqual(workflow.get_tasks(Task.NOT_FINISHED_MASK), [])
+
+    def testGetTasksFromSpec(self):
+        xml_file = os.path.join(data_dir, 'spiff', 'control-flow',
+                                'thread_split.xml')
+        with open(xml_file) as fp:
+            xml = fp.read()
+        wf_spec = WorkflowSpec.deserialize(XmlSerializer(), xml)
+        workflow = Workflow(wf_spec)
+
+        # The spec index must agree with a walk over the tree, also after
+        # tasks were moved into new threads.
+        while not workflow.is_completed():
+            tasks = workflow.get_tasks()
+            for task in tasks:
+                expected = [t for t in tasks
+                            if t.task_spec == task.task_spec and
+                            t.thread_id == task.thread_id]
+                self.assertEqual(workflow._get_tasks_from_spec(
+                    task.task_spec, task.thread_id), expected)
+                expected = [t for t in expected if not t._is_finished()]
+                self.assertEqual(workflow._get_tasks_from_spec(
+                    task.task_spec, task.thread_id, Task.NOT_FINISHED_MASK),
+                    expected)
+                expected = [t for t in tasks
+                            if t.task_spec.name == task.task_spec.name]
+                self.assertEqual(workflow.get_tasks_from_spec_name(
+                    task.task_spec.name), expected)
+            workflow.complete_next()
+        self.assertTrue(len(set(t.thread_id for t in tasks)) > 1)
+
+    def testScheduler(self):
+        xml_file = os.path.join(data_dir, 'spiff', 'workflow1.xml')
+        with open(xml_file) as fp:
+            xml = fp.read()
+        wf_spec = WorkflowSpec.deserialize(XmlSerializer(), xml)
+        workflow = Workflow(wf_spec)
+
+        # The queue yields the ready tasks in tree order, and keeps those
+        # that were not completed.
+        while not workflow.is_completed():
+            expected = workflow.get_tasks(Task.READY)
+            self.assertEqual(list(workflow._scheduler.iter_ready()),
+                             expected)
+            self.assertEqual(list(workflow._scheduler.iter_ready()),
+                             expected)
+            self.assertEqual(workflow._scheduler.get_waiting(),
+                             workflow.get_tasks(Task.WAITING))
+            workflow.complete_next()
+
+    def testWakeup(self):
+        wf_spec = WorkflowSpec()
+        task_a = Simple(wf_spec, 'task_a')
+        task_b = Simple(wf_spec, 'task_b')
+        task_c = Simple(wf_spec, 'task_c')
+        join = Join(wf_spec, 'join')
+        gate = Gate(wf_spec, 'gate', 'task_c')
+        wf_spec.start.connect(task_a)
+        wf_spec.start.connect(task_b)
+        wf_spec.start.connect(task_c)
+        task_a.connect(join)
+        task_b.connect(join)
+        task_a.connect(gate)
+        workflow = Workflow(wf_spec)
+        workflow.complete_next()
+        workflow.complete_task_from_id(
+            workflow.get_tasks_from_spec_name('task_a')[0].id)
+
+        # The join waits for its inputs, the gate for its context.
+        join_task = workflow.get_tasks_from_spec_name('join')[0]
+        gate_task = workflow.get_tasks_from_spec_name('gate')[0]
+        self.assertEqual(join_task.state, Task.WAITING)
+        self.assertEqual(gate_task.state, Task.WAITING)
+        b = workflow.get_tasks_from_spec_name('task_b')[0]
+        c = workflow.get_tasks_from_spec_name('task_c')[0]
+        self.assertEqual(workflow._scheduler.get_waiting_for(b), [join_task])
+        self.assertEqual(workflow._scheduler.get_waiting_for(c), [gate_task])
+
+        workflow.complete_task_from_id(c.id)
+        self.assertEqual(gate_task.state, Task.READY)
+        self.assertEqual(join_task.state, Task.WAITING)
+        workflow.complete_task_from_id(b.id)
+        ready = [t.get_name() for t in workflow.get_tasks(Task.READY)]
+        self.assertEqual(ready, ['gate', 'join'])
+
+    def _get_compact_spec(self):
+        wf_spec = WorkflowSpec()
+        task_a = Simple(wf_spec, 'task_a')
+        task_b = Simple(wf_spec, 'task_b')
+        task_c = Simple(wf_spec, 'task_c')
+        wf_spec.start.connect(task_a)
+        wf_spec.start.connect(task_b)
+        wf_spec.start.connect(task_c)
+        task_a.connect(Simple(wf_spec, 'task_a2'))
+        task_b.connect(Gate(wf_spec, 'gate', 'task_c'))
+        return wf_spec
+
+    def testCompact(self):
+        workflow = Workflow(self._get_compact_spec())
+        workflow.complete_next()
+        for name in ('task_a', 'task_a2', 'task_c'):
+            task = workflow.get_tasks_from_spec_name(name)[0]
+            task.set_data(name=name)
+            workflow.complete_task_from_id(task.id)
+        task_a = workflow.get_tasks_from_spec_name('task_a')[0]
+        workflow.last_task = workflow.get_tasks_from_spec_name('task_a2')[0]
+
+        # The finished branch of task_a is compacted. task_c is finished as
+        # well, but the gate still needs it.
+        self.assertEqual(workflow.compact(keep_data=True), 2)
+        start = workflow.get_tasks_from_spec_name('Start')[0]
+        self.assertEqual([t.get_name() for t in start.children],
+                         ['task_b', 'task_c'])
+        self.assertEqual(len(start.compacted), 1)
+        summary = start.compacted[0]
+        self.assertEqual(summary.id, task_a.id)
+        self.assertEqual(summary.task_spec_name, 'task_a')
+        self.assertEqual(summary.state, Task.COMPLETED)
+        self.assertEqual(summary.size, 2)
+        self.assertEqual(summary.data, {'name': 'task_a'})
+        self.assertEqual(workflow.get_task(task_a.id), None)
+        self.assertTrue(workflow.last_task is start)
+        self.assertEqual(workflow.compact(), 0)
+
+        # The summaries survive serialization.
+        for serializer in (DictionarySerializer(), XmlWorkflowSerializer()):
+            restored = Workflow.deserialize(
+                serializer, workflow.serialize(serializer))
+            start = restored.get_tasks_from_spec_name('Start')[0]
+            self.assertEqual(len(start.compacted), 1)
+            self.assertEqual(start.compacted[0].task_spec_name, 'task_a')
+            self.assertEqual(start.compacted[0].size, 2)
+            self.assertEqual(start.compacted[0].data, {'name': 'task_a'})
+
+        workflow.complete_all()
+        self.assertTrue(workflow.is_completed())
+
+    def testCompactThreshold(self):
+        workflow = Workflow(self._get_compact_spec(), compact_threshold=3)
+        workflow.complete_all()
+        self.assertTrue(workflow.is_completed())
+        start = workflow.get_tasks_from_spec_name('Start')[0]
+        self.assertEqual([t.task_spec_name for t in start.compacted],
+                         ['task_a', 'task_b'])
+        self.assertEqual([t.get_name() for t in start.children], ['task_c'])
+
+    def testCompactLoop(self):
+        # Each iteration of a loop hangs below the previous one.
+        wf_spec = WorkflowSpec()
+        task_a = Simple(wf_spec, 'task_a')
+        choice = ExclusiveChoice(wf_spec, 'choice')
+        wf_spec.start.connect(task_a)
+        task_a.connect(choice)
+        choice.connect_if(NotEqual(Attrib('stop'), True), task_a)
+        choice.connect(Simple(wf_spec, 'end'))
+
+        workflow = Workflow(wf_spec, compact_threshold=20)
+        for n in range(300):
+            workflow.complete_next()
+        tasks = list(Task.Iterator(workflow.task_tree))
+        self.assertTrue(len(tasks) < 50)
+        summaries = workflow.task_tree.compacted
+        self.assertEqual([t.task_spec_name for t in summaries], ['Start'])
+        self.assertTrue(summaries[0].size > 250)
+        for task in tasks[1:]:
+            self.assertEqual(task._depth, task.parent._depth + 1)
+            self.assertTrue(task._is_descendant_of(task.parent))
+
+        # Compacting right away, the READY task and its parent are kept.
+        workflow.compact()
+        ready = workflow.get_tasks(Task.READY)
+        self.assertEqual(len(ready), 1)
+        self.assertTrue(ready[0].parent.parent is workflow.task_tree)
+        self.assertEqual(ready[0]._depth, 2)
+
+        serializer = DictionarySerializer()
+        workflow = Workflow.deserialize(serializer,
+                                        workflow.serialize(serializer))
+        ready = workflow.get_tasks(Task.READY)
+        ready[0].set_data(stop=True)
+        workflow.complete_all()
+        self.assertTrue(workflow.is_completed())
+        self.assertEqual(len(workflow.get_tasks_from_spec_name('end')), 1)
+
+    def testArchive(self):
+        workflow = Workflow(self._get_compact_spec())
+        workflow.data['result'] = 42
+        self.assertRaises(WorkflowException, workflow.archive)
+        workflow.complete_all()
+        workflow.compact()
+        task_c = workflow.get_tasks_from_spec_name('task_c')[0]
+
+        archive = workflow.archive()
+        self.assertEqual(archive.spec_name, workflow.spec.name)
+        self.assertTrue(archive.success)
+        self.assertEqual(archive.get_data('result'), 42)
+        self.assertEqual([t.task_spec_name for t in archive.path],
+                         ['Root', 'Start', 'task_a', 'task_b', 'task_c'])
+        self.assertEqual(archive.path[-1].state, Task.COMPLETED)
+        self.assertEqual(archive.path[-1].last_state_change,
+                         task_c.last_state_change)
+
+        # The archive can not be modified, and the tree was released.
+        archive.data['result'] = 0
+        self.assertEqual(archive.get_data('result'), 42)
+        self.assertRaises(AttributeError, setattr, archive, 'path', ())
+        self.assertEqual(workflow.task_tree, None)
+        self.assertEqual(workflow.task_mapping, {})
+        self.assertEqual(task_c.parent, None)
+
+    def testLegacyPickle(self):
+        # Pickled before tasks had slots, labels and indexes: a MultiInstance
+        # of three, a Join and an ExclusiveChoice, after three steps.
+        filename = os.path.join(data_dir, 'legacy_workflow.pickle')
+        with open(filename, 'rb') as fp:
+            workflow = pickle.load(fp)
+        ready = workflow.get_tasks(Task.READY)
+        self.assertEqual([t.get_name() for t in ready], ['task', 'task'])
+        self.assertEqual(workflow.get_tasks_from_spec_name('join')[0].state,
+                         Task.WAITING)
+        for task in Task.Iterator(workflow.task_tree):
+            self.assertTrue(workflow.get_task(task.id) is task)
+            if task.parent is not None:
+                self.assertEqual(task._depth, task.parent._depth + 1)
+                self.assertTrue(task._is_descendant_of(task.parent))
+        thread_ids = set(t.thread_id for t in workflow.get_tasks())
+        self.assertTrue(workflow.thread_id_pool.new_id() not in
+                        thread_ids)
+
+        workflow.complete_all()
+        self.assertTrue(workflow.is_completed())
+        yes = workflow.get_tasks_from_spec_name('yes')
+        self.assertEqual([t.state for t in yes], [Task.COMPLETED])
+
 
 def suite():
     return unittest.TestLoader().loadTestsFromTestCase(WorkflowTest)
@@ -0,0 +1,198 @@
+# -*- coding: utf-8 -*-
+from __future__ import print_function, absolute_import, division
+
+import unittest
+from SpiffWorkflow.task import Task
+from SpiffWorkflow.bpmn.workflow import BpmnWorkflow
+from SpiffWorkflow.bpmn.messages import MessageRouter
+from SpiffWorkflow.bpmn.specs.BpmnProcessSpec import BpmnProcessSpec
+from SpiffWorkflow.bpmn.specs.IntermediateCatchEvent import \
+    IntermediateCatchEvent
+from SpiffWorkflow.bpmn.specs.event_definitions import \
+    MessageEventDefinition
+from SpiffWorkflow.bpmn.serializer.CompactWorkflowSerializer import \
+    CompactWorkflowSerializer
+from tests.SpiffWorkflow.bpmn.BpmnWorkflowTestCase import BpmnWorkflowTestCase
+
+
+class MessageRouterTest(BpmnWorkflowTestCase):
+
+    def setUp(self):
+        self.spec = self.load_workflow_spec('Test-Workflows/*.bpmn20.xml',
+                                            'Test Workflows')
+
+    def _start(self, choice, order=None):
+        self.workflow = BpmnWorkflow(self.spec)
+        set_attribs = {} if order is None else {'order': order}
+        self.do_next_exclusive_step('Select Test', choice=choice,
+                                    set_attribs=set_attribs)
+        self.workflow.do_engine_steps()
+        return self.workflow
+
+    def testRegister(self):
+        router = MessageRouter()
+        self.assertEqual(router.register('a', self._start('Messages')), 1)
+        self.assertEqual(len(router), 1)
+        self.assertEqual(router.get_subscribers('Test Message'), ['a'])
+        self.assertEqual(router.get_subscribers('Wrong Message'), [])
+
+        # Instances without catchers are dropped.
+        self.workflow.accept_message('Test Message')
+        self.assertEqual(router.register('a', self.workflow), 0)
+        self.assertEqual(len(router), 0)
+
+    def testUnregister(self):
+        router = MessageRouter()
+        router.register('a', self._start('Messages'))
+        router.unregister('a')
+        router.unregister('b')
+        self.assertEqual(len(router), 0)
+        self.assertEqual(router.get_subscribers('Test Message'), [])
+
+    def testGetSubscribers(self):
+        router = MessageRouter('order')
+        router.register('a', self._start('Messages', order=1))
+        router.register('b', self._start('Messages', order=2))
+        router.register('c', self._start('Messages'))
+        self.assertEqual(router.get_subscribers('Test Message', 1),
+                         ['a', 'c'])
+        self.assertEqual(router.get_subscribers('Test Message', 2),
+                         ['b', 'c'])
+        self.assertEqual(router.get_subscribers('Test Message'), ['c'])
+
+        # The correlation key given on registration is the fallback.
+        router.register('c', self.workflow, correlation=3)
+        self.assertEqual(router.get_subscribers('Test Message', 3), ['c'])
+
+    def testDeliver(self):
+        router = MessageRouter('order')
+        workflows = {}
+        for order in (1, 2):
+            workflows[order] = self._start('Messages', order=order)
+            router.register(order, workflows[order])
+
+        delivered = router.deliver('Test Message', 1)
+        self.assertEqual(delivered, [(1, workflows[1])])
+        self.assertEqual(len(workflows[1].get_tasks(Task.READY)), 1)
+        self.assertEqual(len(workflows[2].get_tasks(Task.WAITING)), 1)
+        self.assertEqual(router.get_subscribers('Test Message', 1), [])
+        self.assertEqual(router.get_subscribers('Test Message', 2), [2])
+
+        # Instances that no longer exist are dropped.
+        self.assertEqual(router.deliver('Test Message', 2, lambda key: None),
+                         [])
+        self.assertEqual(len(router), 0)
+
+    def _start_orders(self):
+        # Two catchers of one instance wait for the same message, with
+        # different correlation keys.
+        spec = BpmnProcessSpec('Orders')
+        for order in (1, 2):
+            catcher = IntermediateCatchEvent(
+                spec, 'Catch %d' % order,
+                MessageEventDefinition('Test Message'))
+            spec.start.connect(catcher)
+            catcher.connect(spec.end)
+        workflow = BpmnWorkflow(spec)
+        workflow.do_engine_steps()
+        for task in workflow.get_tasks(Task.WAITING):
+            task.set_data(order=int(task.get_name()[-1]))
+        return workflow
+
+    def testDeliverToMatchingCatchers(self):
+        workflow = self._start_orders()
+        router = MessageRouter('order')
+        self.assertEqual(router.register('a', workflow), 2)
+        self.assertEqual(router.deliver('Test Message', 2),
+                         [('a', workflow)])
+        self.assertEqual(['Catch 2'],
+                         [t.get_name()
+                          for t in workflow.get_tasks(Task.READY)])
+        self.assertEqual(['Catch 1'],
+                         [t.get_name()
+                          for t in workflow.get_tasks(Task.WAITING)])
+        self.assertEqual(router.get_subscribers('Test Message', 1), ['a'])
+        self.assertEqual(router.get_subscribers('Test Message', 2), [])
+
+        # A message without a key only reaches catchers without one.
+        self.assertEqual(router.deliver('Test Message'), [])
+        workflow.accept_message('Test Message', None,
+                                lambda task: task.get_data('order'))
+        self.assertEqual(router.register('a', workflow), 1)
+        router.deliver('Test Message', 1)
+        workflow.do_engine_steps()
+        self.assertTrue(workflow.is_completed())
+        self.assertEqual(len(router), 0)
+
+    def testBoundaryEvent(self):
+        router = MessageRouter()
+        workflow = self._start('Message Interrupts')
+        router.register('a', workflow)
+        self.assertEqual(router.get_subscribers('Test Message'), ['a'])
+
+        router.deliver('Test Message')
+        workflow.do_engine_steps()
+        self.assertEqual(0, len(workflow.get_tasks(Task.WAITING)))
+        self.assertEqual(['Acknowledge Interrupt Message'],
+                         [t.task_spec.description
+                          for t in workflow.get_tasks(Task.READY)])
+        self.assertEqual(len(router), 0)
+
+    def testReadOnlyRestore(self):
+        serializer = CompactWorkflowSerializer()
+        state = serializer.serialize_workflow(self._start('Messages'))
+
+        # Read only workflows are indexed, but delivered to by loading them.
+        router = MessageRouter('order')
+        read_only = serializer.deserialize_workflow(
+            state, workflow_spec=self.spec, read_only=True)
+        router.register('a', read_only, correlation=7)
+        self.assertEqual(router.get_subscribers('Test Message', 7), ['a'])
+        self.assertRaises(ValueError, router.deliver, 'Test Message', 7)
+
+        delivered = router.deliver(
+            'Test Message', 7,
+            lambda key: serializer.deserialize_workflow(
+                state, workflow_spec=self.spec))
+        self.assertEqual(len(delivered), 1)
+        workflow = delivered[0][1]
+        self.assertEqual(0, len(workflow.get_tasks(Task.WAITING)))
+        self.assertEqual(1, len(workflow.get_tasks(Task.READY)))
+
+    def testLoadedWorkflowsAreNotKept(self):
+        # The instance is registered like a read only restored one.
+        router = MessageRouter('order')
+        registered = self._start_orders()
+        registered.read_only = True
+        router.register('a', registered)
+        workflow = self._start_orders()
+        delivered = router.deliver('Test Message', 2, lambda key: workflow)
+        self.assertEqual(delivered, [('a', workflow)])
+        self.assertEqual(router.get_subscribers('Test Message', 1), ['a'])
+        self.assertEqual(router._workflows, {})
+
+        # A workflow that the caller registered is kept up to date.
+        router.register('a', workflow)
+        loaded = self._start_orders()
+        router.deliver('Test Message', 1, lambda key: loaded)
+        self.assertTrue(router._workflows['a'] is loaded)
+
+    def testReadOnlyCheckedFirst(self):
+        serializer = CompactWorkflowSerializer()
+        state = serializer.serialize_workflow(self._start('Messages'))
+        router = MessageRouter()
+        workflow = self._start('Messages')
+        router.register('a', workflow)
+        router.register('b', serializer.deserialize_workflow(
+            state, workflow_spec=self.spec, read_only=True))
+
+        # No instance receives the message.
+        self.assertRaises(ValueError, router.deliver, 'Test Message')
+        self.assertEqual(1, len(workflow.get_tasks(Task.WAITING)))
+        self.assertEqual(router.get_subscribers('Test Message'), ['a', 'b'])
+
+
+def suite():
+    return unittest.TestLoader().loadTestsFromTestCase(MessageRouterTest)
+if __name__ == '__main__':
+    unittest.TextTestRunner(verbosity=2).run(suite())
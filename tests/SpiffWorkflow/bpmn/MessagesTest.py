@@ -59,6 +59,27 @@ class MessagesTest(BpmnWorkflowTestCase):
         self.assertEqual(
             0, len(self.workflow.get_tasks(Task.READY | Task.WAITING)))
 
+    def testSubscribers(self):
+        self.workflow = BpmnWorkflow(self.spec)
+        self.do_next_exclusive_step('Select Test', choice='Messages')
+        self.workflow.do_engine_steps()
+        waiting = self.workflow.get_tasks(Task.WAITING)
+        self.assertEqual({'Test Message': set(waiting)},
+                         self.workflow._message_subscribers)
+
+        # Tasks are only offered the messages they subscribed to.
+        offered = []
+        spec = waiting[0].task_spec
+        spec.accept_message = lambda task, message: offered.append(message)
+        try:
+            self.workflow.accept_message('Wrong Message')
+            self.assertEqual([], offered)
+        finally:
+            del spec.accept_message
+        self.workflow.accept_message('Test Message')
+        self.assertEqual({}, self.workflow._message_subscribers)
+        self.assertEqual(1, len(self.workflow.get_tasks(Task.READY)))
+
 
 def suite():
     return unittest.TestLoader().loadTestsFromTestCase(MessagesTest)
@@ -33,6 +33,20 @@ class NestedProcessesTest(BpmnWorkflowTestCase):
         self.assertEqual(
             0, len(self.workflow.get_tasks(Task.READY | Task.WAITING)))
 
+    def testEngineTasks(self):
+        # The READY engine tasks of the subprocesses are tracked by the
+        # top level workflow, and only user tasks are left between steps.
+        self.workflow = BpmnWorkflow(self.spec)
+        self.do_next_named_step('Action1')
+        self.assertNotEqual(self.workflow._engine_tasks, set())
+        self.workflow.do_engine_steps()
+        self.assertEqual(self.workflow._engine_tasks, set())
+        ready = self.workflow.get_tasks(Task.READY)
+        self.assertEqual(ready, self.workflow.get_ready_user_tasks())
+        self.assertEqual([t.task_spec.description for t in ready],
+                         ['Action2'])
+        self.assertFalse(self.spec._is_engine_spec(ready[0].task_spec))
+
 
 def suite():
     return unittest.TestLoader().loadTestsFromTestCase(NestedProcessesTest)
@@ -6,8 +6,11 @@ from builtins import range
 import unittest
 import logging
 import sys
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 from SpiffWorkflow.task import Task
 from SpiffWorkflow.bpmn.workflow import BpmnWorkflow
+from SpiffWorkflow.bpmn.specs.BpmnProcessSpec import BpmnProcessSpec
+from SpiffWorkflow.bpmn.specs.ScriptTask import ScriptTask
 from tests.SpiffWorkflow.bpmn.BpmnWorkflowTestCase import BpmnWorkflowTestCase
 
 __author__ = 'matth'
@@ -657,6 +660,74 @@ class ParallelManyThreadsAtSamePointTestNested(AbstractParallelTest):
         self._do_test(instructions, only_one_instance=False, save_restore=True)
 
 
+class ParallelScriptTaskTest(unittest.TestCase):
+
+    def _run(self, parallel_safe, executor=None):
+        spec = BpmnProcessSpec('Scripts')
+        script = ScriptTask(spec, 'script',
+                            "task.set_data(doubled=task.get_data('items'))\n"
+                            "items.append(3)",
+                            parallel_safe=parallel_safe)
+        spec.start.connect(script)
+        script.connect(spec.end)
+        self.assertEqual(script.parallel_safe, parallel_safe)
+
+        workflow = BpmnWorkflow(spec, executor=executor)
+        workflow.get_tasks(Task.READY)[0].set_data(items=[1, 2])
+        workflow.do_engine_steps()
+        self.assertTrue(workflow.is_completed())
+        return workflow.data
+
+    def testNotParallelSafe(self):
+        # The script runs against the task itself.
+        self.assertFalse(ScriptTask(BpmnProcessSpec(), 'a', '').parallel_safe)
+        with ThreadPoolExecutor(1) as executor:
+            data = self._run(False, executor)
+        self.assertEqual(data['items'], [1, 2, 3])
+        self.assertTrue(data['doubled'] is data['items'])
+
+    def testThreadPool(self):
+        # The script works on a copy of the data, and its data fields are
+        # set on the task by the engine.
+        with ThreadPoolExecutor(1) as executor:
+            data = self._run(True, executor)
+        self.assertEqual(data['items'], [1, 2, 3])
+        self.assertTrue(data['doubled'] is data['items'])
+
+    def testProcessPool(self):
+        with ProcessPoolExecutor(1) as executor:
+            data = self._run(True, executor)
+        self.assertEqual(data['items'], [1, 2, 3])
+        self.assertEqual(data['doubled'], [1, 2, 3])
+
+    def testChangedFields(self):
+        # Only the fields that the script set, changed or deleted are
+        # updated on the task.
+        spec = BpmnProcessSpec('Scripts')
+        script = ScriptTask(spec, 'script',
+                            "task.set_data(doubled=[n * 2 for n in items])\n"
+                            "del task.data['scratch']",
+                            parallel_safe=True)
+        spec.start.connect(script)
+        script.connect(spec.end)
+        workflow = BpmnWorkflow(spec)
+        workflow.get_tasks(Task.READY)[0].set_data(items=[1, 2], scratch=1,
+                                                   note='old')
+        workflow.get_tasks(Task.READY)[0].complete()
+        task = workflow.get_tasks(Task.READY)[0]
+        self.assertEqual(task.task_spec, script)
+
+        with ThreadPoolExecutor(1) as executor:
+            workflow.executor = executor
+            workflow._dispatch_work()
+            workflow._work[task].result()
+            task.set_data(note='new')
+            workflow.do_engine_steps()
+        self.assertTrue(workflow.is_completed())
+        self.assertEqual(workflow.data, {'items': [1, 2], 'doubled': [2, 4],
+                                         'note': 'new'})
+
+
 def suite():
     return unittest.TestLoader().loadTestsFromModule(sys.modules[__name__])
 if __name__ == '__main__':
@@ -44,6 +44,29 @@ class TimerIntermediateTest(BpmnWorkflowTestCase):
         self.assertEqual(
             0, len(self.workflow.get_tasks(Task.READY | Task.WAITING)))
 
+    def testNextTimerDeadline(self):
+        self.workflow = BpmnWorkflow(self.spec)
+        self.assertEqual(None, self.workflow.next_timer_deadline())
+
+        due_time = datetime.datetime.now() + datetime.timedelta(seconds=0.5)
+        self.workflow.get_tasks(Task.READY)[0].set_data(due_time=due_time)
+        self.workflow.do_engine_steps()
+        deadline = time.mktime(due_time.timetuple()) + \
+            due_time.microsecond / 1000000.0
+        self.assertAlmostEqual(deadline, self.workflow.next_timer_deadline())
+
+        # The deadline was evaluated once, and is not affected by the data.
+        waiting = self.workflow.get_tasks(Task.WAITING)[0]
+        waiting.set_data(due_time=None)
+        self.workflow.refresh_expired_timers()
+        self.assertEqual([waiting], self.workflow.get_tasks(Task.WAITING))
+
+        time.sleep(max(0, deadline - time.time()) + 0.05)
+        self.workflow.refresh_expired_timers()
+        self.assertEqual(0, len(self.workflow.get_tasks(Task.WAITING)))
+        self.assertEqual(1, len(self.workflow.get_tasks(Task.READY)))
+        self.assertEqual(None, self.workflow.next_timer_deadline())
+
 
 def suite():
     return unittest.TestLoader().loadTestsFromTestCase(TimerIntermediateTest)
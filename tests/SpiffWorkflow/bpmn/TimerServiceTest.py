@@ -0,0 +1,183 @@
+# -*- coding: utf-8 -*-
+from __future__ import print_function, absolute_import, division
+
+import unittest
+import datetime
+import os
+import pickle
+import shutil
+import tempfile
+import time
+from SpiffWorkflow.task import Task
+from SpiffWorkflow.bpmn.workflow import BpmnWorkflow
+from SpiffWorkflow.bpmn.timers import TimerService, TimerStore, \
+    SqliteTimerStore
+from tests.SpiffWorkflow.bpmn.BpmnWorkflowTestCase import BpmnWorkflowTestCase
+
+
+class TimerServiceTest(BpmnWorkflowTestCase):
+
+    def setUp(self):
+        self.spec = self.load_workflow_spec('Test-Workflows/*.bpmn20.xml',
+                                            'Timer Intermediate')
+        self.tmpdir = tempfile.mkdtemp()
+        self.saved = {}
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def _start(self, seconds):
+        workflow = BpmnWorkflow(self.spec)
+        due_time = datetime.datetime.now() + \
+            datetime.timedelta(seconds=seconds)
+        workflow.get_tasks(Task.READY)[0].set_data(due_time=due_time)
+        workflow.do_engine_steps()
+        return workflow
+
+    def _save(self, service, key, workflow):
+        self.saved[key] = workflow
+        return service.register(key, workflow)
+
+    def testRegister(self):
+        service = TimerService()
+        workflow = self._start(10)
+        deadline = self._save(service, 'a', workflow)
+        self.assertEqual(deadline, workflow.next_timer_deadline())
+        self.assertEqual(service.get_deadline('a'), deadline)
+        self.assertEqual(len(service), 1)
+
+        # Workflows without timers are dropped.
+        workflow.cancel()
+        self.assertEqual(service.register('a', workflow), None)
+        self.assertEqual(len(service), 0)
+
+    def testSetDeadline(self):
+        service = TimerService()
+        service.set_deadline('a', 20.0)
+        service.set_deadline('a', 10.0)
+        service.set_deadline('b', 15.0)
+        self.assertEqual(service.next_deadline(), 10.0)
+        service.set_deadline('a', 30.0)
+        self.assertEqual(service.next_deadline(), 15.0)
+        self.assertEqual(sorted(service.store.load()),
+                         [('a', 30.0), ('b', 15.0)])
+
+    def testUnregister(self):
+        service = TimerService()
+        service.set_deadline('a', 10.0)
+        service.unregister('a')
+        service.unregister('b')
+        self.assertEqual(service.get_deadline('a'), None)
+        self.assertEqual(service.next_deadline(), None)
+        self.assertEqual(service.store.load(), [])
+
+    def testGetDeadline(self):
+        service = TimerService()
+        self.assertEqual(service.get_deadline('a'), None)
+        service.set_deadline('a', 10.0)
+        self.assertEqual(service.get_deadline('a'), 10.0)
+
+    def testNextDeadline(self):
+        service = TimerService()
+        self.assertEqual(service.next_deadline(), None)
+        for n in range(100):
+            service.set_deadline('key%d' % n, 1000.0 - n)
+        self.assertEqual(service.next_deadline(), 901.0)
+
+    def testGetDue(self):
+        service = TimerService()
+        service.set_deadline('a', 10.0)
+        service.set_deadline('b', 5.0)
+        service.set_deadline('c', 30.0)
+        self.assertEqual(service.get_due(20.0), ['b', 'a'])
+        self.assertEqual(service.get_due(20.0), ['b', 'a'])
+        self.assertEqual(service.get_due(1.0), [])
+
+    def testWake(self):
+        service = TimerService()
+        self._save(service, 'soon', self._start(0.2))
+        self._save(service, 'later', self._start(60))
+        self.assertEqual(service.wake(self.saved.get), [])
+
+        time.sleep(0.3)
+        loaded = []
+
+        def load(key):
+            loaded.append(key)
+            return self.saved.get(key)
+        woken = service.wake(load)
+        self.assertEqual(loaded, ['soon'])
+        self.assertEqual([key for key, workflow in woken], ['soon'])
+        workflow = woken[0][1]
+        self.assertEqual(workflow.get_tasks(Task.WAITING), [])
+        workflow.do_engine_steps()
+        self.assertTrue(workflow.is_completed())
+        self.assertEqual(service.get_deadline('soon'), None)
+        self.assertEqual(len(service), 1)
+
+        # Instances that no longer exist are dropped.
+        del self.saved['later']
+        self.assertEqual(service.wake(load, time.time() + 120), [])
+        self.assertEqual(len(service), 0)
+
+    def testWakeAt(self):
+        # The timers fire by the given time rather than the clock.
+        service = TimerService()
+        self._save(service, 'later', self._start(60))
+        woken = service.wake(self.saved.get, time.time() + 120)
+        self.assertEqual([key for key, workflow in woken], ['later'])
+        workflow = woken[0][1]
+        self.assertEqual(workflow.get_tasks(Task.WAITING), [])
+        workflow.do_engine_steps()
+        self.assertTrue(workflow.is_completed())
+        self.assertEqual(len(service), 0)
+
+    def testWakeRestored(self):
+        # The instances are suspended in serialized form.
+        service = TimerService()
+        workflow = self._start(0.2)
+        state = pickle.dumps(workflow)
+        service.register('a', workflow)
+
+        time.sleep(0.3)
+        woken = service.wake(lambda key: pickle.loads(state))
+        self.assertEqual(len(woken), 1)
+        self.assertEqual(woken[0][1].get_tasks(Task.WAITING), [])
+
+    def testSqliteTimerStore(self):
+        filename = os.path.join(self.tmpdir, 'timers.db')
+        store = SqliteTimerStore(filename)
+        service = TimerService(store)
+        service.set_deadline('a', 10.0)
+        service.set_deadline('b', 5.0)
+        service.set_deadline('c', 20.0)
+        service.unregister('c')
+        store.close()
+
+        # A new service picks up where the old one left off.
+        store = SqliteTimerStore(filename)
+        service = TimerService(store)
+        self.assertEqual(sorted(store.load()), [('a', 10.0), ('b', 5.0)])
+        self.assertEqual(service.next_deadline(), 5.0)
+        self.assertEqual(service.get_due(15.0), ['b', 'a'])
+        store.close()
+
+        # The table name is inserted into the statements.
+        for table in ('timers; DROP TABLE x', 'a b', '1timers', ''):
+            self.assertRaises(ValueError, SqliteTimerStore, filename, table)
+        SqliteTimerStore(filename, 'Other_Timers2').close()
+
+    def testTimerStore(self):
+        store = TimerStore()
+        store.save('a', 1.0)
+        store.save('a', 2.0)
+        store.delete('b')
+        self.assertEqual(store.load(), [('a', 2.0)])
+        store.delete('a')
+        self.assertEqual(store.load(), [])
+
+
+def suite():
+    return unittest.TestLoader().loadTestsFromTestCase(TimerServiceTest)
+if __name__ == '__main__':
+    unittest.TextTestRunner(verbosity=2).run(suite())
@@ -14,7 +14,7 @@ from uuid import UUID
 from PatternTest import run_workflow, PatternTest
 from SpiffWorkflow.serializer.base import Serializer
 from SpiffWorkflow.specs import WorkflowSpec
-from SpiffWorkflow import Workflow
+from SpiffWorkflow import Workflow, WorkflowArchive
 from SpiffWorkflow.serializer.exceptions import TaskSpecNotSupportedError, \
     TaskNotSupportedError
 from data.spiff.workflow1 import TestWorkflowSpec
@@ -86,6 +86,32 @@ class SerializerTest(PatternTest):
             print(test.filename)
             self._test_workflow_spec(test)
 
+    def testWorkflowArchive(self):
+        test = self.workflows[0]
+        workflow = run_workflow(self, test.spec, test.path, test.data)
+        archive = workflow.archive()
+        if type(self.serializer) is Serializer:
+            self.assertRaises(NotImplementedError, archive.serialize,
+                              self.serializer)
+            self.assertRaises(NotImplementedError,
+                              WorkflowArchive.deserialize, self.serializer,
+                              None)
+            return
+
+        serialized = archive.serialize(self.serializer)
+        self.assertIsInstance(serialized, self.return_type)
+        restored = WorkflowArchive.deserialize(self.serializer, serialized)
+        self.assertEqual(restored.spec_name, archive.spec_name)
+        self.assertEqual(restored.success, archive.success)
+        self.assertEqual(restored.path, archive.path)
+        self.assertEqual(sorted(restored.data), sorted(archive.data))
+
+        # Not every serializer preserves the type of the data values, but
+        # a second round trip must not change anything.
+        serialized2 = restored.serialize(self.serializer)
+        self._compare_results(self._prepare_result(serialized),
+                              self._prepare_result(serialized2))
+
 
 def suite():
     return unittest.defaultTestLoader.loadTestsFromTestCase(SerializerTest)
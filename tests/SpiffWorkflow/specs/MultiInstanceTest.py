@@ -0,0 +1,235 @@
+# -*- coding: utf-8 -*-
+from __future__ import print_function, absolute_import, division
+
+import os
+import sys
+import pickle
+import unittest
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', '..'))
+
+from .TaskSpecTest import TaskSpecTest
+from SpiffWorkflow.specs import MultiInstance, WorkflowSpec, Simple, Join
+from SpiffWorkflow.serializer.dict import DictionarySerializer
+from SpiffWorkflow.serializer.xml import XmlSerializer
+from SpiffWorkflow.task import Task
+from SpiffWorkflow.operators import Attrib
+from SpiffWorkflow import Workflow
+
+
+class MultiInstanceTest(TaskSpecTest):
+    CORRELATE = MultiInstance
+
+    def create_instance(self):
+        if 'testtask' in self.wf_spec.task_specs:
+            del self.wf_spec.task_specs['testtask']
+
+        return MultiInstance(self.wf_spec,
+                             'testtask',
+                             times=2,
+                             window=3,
+                             item_name='item',
+                             description='foo')
+
+    def _create_workflow(self, times, window=None, threshold=None,
+                         item_name=None, join=True, split_task='split'):
+        wf_spec = WorkflowSpec()
+        split = MultiInstance(wf_spec, 'split', times, window=window,
+                              item_name=item_name)
+        wf_spec.start.connect(split)
+        task = Simple(wf_spec, 'task')
+        split.connect(task)
+        if join:
+            join = Join(wf_spec, 'join', split_task=split_task,
+                        threshold=threshold)
+            task.connect(join)
+            join.connect(Simple(wf_spec, 'last'))
+        return Workflow(wf_spec)
+
+    def _run(self, workflow, restore=None):
+        """
+        Completes the READY tasks one by one, and returns the largest
+        number of instances that were in flight at a time, and the
+        workflow.
+        """
+        in_flight = 0
+        steps = 0
+        while True:
+            ready = workflow.get_tasks(Task.READY)
+            if not ready:
+                return in_flight, workflow
+            instances = [t for t in ready if t.get_name() == 'task']
+            in_flight = max(in_flight, len(instances))
+            ready[0].complete()
+            steps += 1
+            if restore is not None and steps % 3 == 0:
+                workflow = restore(workflow)
+
+    def _get_completed(self, workflow, name):
+        return [task for task in workflow.get_tasks(Task.COMPLETED)
+                if task.get_name() == name]
+
+    def testConstructor(self):
+        TaskSpecTest.testConstructor(self)
+        self.assertEqual(self.spec.times, 2)
+        self.assertEqual(self.spec.window, 3)
+        self.assertEqual(self.spec.item_name, 'item')
+        self.assertRaises(ValueError, MultiInstance, self.wf_spec, 'foo', 2,
+                          window=0)
+        self.assertRaises(ValueError, MultiInstance, self.wf_spec, 'foo',
+                          iter('abc'), window=2)
+
+    def testWindow(self):
+        workflow = self._create_workflow(10, window=3)
+        split = workflow.get_tasks_from_spec_name('split')[0]
+        self.assertEqual(len(split.children), 3)
+
+        self.assertEqual(self._run(workflow)[0], 3)
+        self.assertTrue(workflow.is_completed())
+        self.assertEqual(len(self._get_completed(workflow, 'task')), 10)
+        self.assertEqual(len(self._get_completed(workflow, 'last')), 1)
+
+    def testWindowWithoutJoin(self):
+        # The instances are started as the branches complete.
+        workflow = self._create_workflow(10, window=3, join=False)
+        self.assertEqual(self._run(workflow)[0], 3)
+        self.assertTrue(workflow.is_completed())
+        self.assertEqual(len(self._get_completed(workflow, 'task')), 10)
+        self.assertEqual(workflow._watched_splits, set())
+
+    def testWindowUnstructuredJoin(self):
+        workflow = self._create_workflow(10, window=3, split_task=None)
+        self.assertEqual(self._run(workflow)[0], 3)
+        self.assertTrue(workflow.is_completed())
+        self.assertEqual(len(self._get_completed(workflow, 'task')), 10)
+
+    def testMergedBranches(self):
+        # The split accounts for merged branches, so their joins do not
+        # wait to be looked at again.
+        workflow = self._create_workflow(10, window=3)
+        while len(self._get_completed(workflow, 'task')) < 6:
+            workflow.get_tasks(Task.READY)[0].complete()
+        self.assertEqual(workflow.get_tasks(Task.WAITING), [])
+        split = workflow.get_tasks_from_spec_name('split')[0]
+        self.assertEqual(int(split._get_internal_data('merged')), 6)
+        self.assertEqual(len(split.children), 9)
+
+    def testNoWindow(self):
+        workflow = self._create_workflow(10)
+        self.assertEqual(self._run(workflow)[0], 10)
+        self.assertEqual(len(self._get_completed(workflow, 'task')), 10)
+        self.assertEqual(len(self._get_completed(workflow, 'last')), 1)
+
+    def testThreshold(self):
+        # The join fires after four instances; the rest is never started.
+        workflow = self._create_workflow(10, window=2, threshold=4)
+        self._run(workflow)
+        self.assertEqual(len(self._get_completed(workflow, 'last')), 1)
+        self.assertTrue(len(self._get_completed(workflow, 'task')) < 10)
+        self.assertEqual(workflow._watched_splits, set())
+
+    def testItems(self):
+        for window in (None, 2):
+            workflow = self._create_workflow(['a', 'b', 'c'], window=window,
+                                             item_name='customer')
+            self._run(workflow)
+            items = [task.get_data('customer')
+                     for task in self._get_completed(workflow, 'task')]
+            self.assertEqual(sorted(items), ['a', 'b', 'c'])
+
+    def testIterator(self):
+        def customers(task):
+            for customer in ('a', 'b', 'c', 'd', 'e'):
+                yield customer
+        for window in (None, 2, 5, 10):
+            for times in (customers, lambda task: iter('abcde'),
+                          set('abcde')):
+                workflow = self._create_workflow(times, window=window,
+                                                 item_name='customer')
+                in_flight = self._run(workflow)[0]
+                self.assertEqual(in_flight, min(window or 5, 5))
+                items = [task.get_data('customer')
+                         for task in self._get_completed(workflow, 'task')]
+                self.assertEqual(sorted(items), ['a', 'b', 'c', 'd', 'e'])
+                self.assertEqual(
+                    len(self._get_completed(workflow, 'last')), 1)
+
+        # An iterator without items starts no instances.
+        workflow = self._create_workflow(lambda task: iter([]), window=2)
+        self._run(workflow)
+        self.assertTrue(workflow.is_completed())
+        self.assertEqual(self._get_completed(workflow, 'task'), [])
+
+    def testIteratorFromData(self):
+        workflow = self._create_workflow(Attrib('customers'), window=2,
+                                         item_name='customer')
+        start = workflow.get_tasks_from_spec_name('Start')[0]
+        start.set_data(customers=iter('abcde'))
+        self.assertEqual(self._run(workflow)[0], 2)
+        items = [task.get_data('customer')
+                 for task in self._get_completed(workflow, 'task')]
+        self.assertEqual(sorted(items), ['a', 'b', 'c', 'd', 'e'])
+
+    def testIteratorPerWorkflow(self):
+        # Workflows of the same spec each get all the items.
+        first = self._create_workflow(lambda task: iter('abcd'), window=2,
+                                      item_name='customer')
+        second = Workflow(first.spec)
+        for workflow in (first, second):
+            self._run(workflow)
+            items = [task.get_data('customer')
+                     for task in self._get_completed(workflow, 'task')]
+            self.assertEqual(sorted(items), ['a', 'b', 'c', 'd'])
+
+    def testIteratorIsLazy(self):
+        pulled = []
+
+        def customers(task):
+            for customer in range(6):
+                pulled.append(customer)
+                yield customer
+        workflow = self._create_workflow(customers, window=2)
+        split = workflow.get_tasks_from_spec_name('split')[0]
+        while not split._has_state(Task.COMPLETED):
+            self.assertEqual(pulled, [])
+            workflow.get_tasks(Task.READY)[0].complete()
+        self.assertEqual(pulled, [0, 1])
+        split.children[0].complete()
+        self.assertEqual(pulled, [0, 1, 2])
+
+    def testSerializeWorkflow(self):
+        for serializer in (DictionarySerializer(), XmlSerializer()):
+            def restore(workflow):
+                return Workflow.deserialize(serializer,
+                                            workflow.serialize(serializer))
+            workflow = self._create_workflow(7, window=2)
+            in_flight, workflow = self._run(workflow, restore)
+            self.assertEqual(in_flight, 2)
+            self.assertTrue(workflow.is_completed())
+            self.assertEqual(len(self._get_completed(workflow, 'task')), 7)
+            self.assertEqual(len(self._get_completed(workflow, 'last')), 1)
+
+    def testRestoreIterator(self):
+        # A restored workflow resumes the items where they were left.
+        serializer = DictionarySerializer()
+        for restore in (lambda w: pickle.loads(pickle.dumps(w, -1)),
+                        lambda w: Workflow.deserialize(
+                            serializer, w.serialize(serializer))):
+            workflow = self._create_workflow(_get_customers, window=2,
+                                             item_name='customer')
+            in_flight, workflow = self._run(workflow, restore)
+            self.assertEqual(in_flight, 2)
+            self.assertTrue(workflow.is_completed())
+            items = [task.get_data('customer')
+                     for task in self._get_completed(workflow, 'task')]
+            self.assertEqual(sorted(items), list('abcdefg'))
+
+
+def _get_customers(task):
+    # A function at module level, so the spec can be pickled.
+    return iter('abcdefg')
+
+
+def suite():
+    return unittest.TestLoader().loadTestsFromTestCase(MultiInstanceTest)
+if __name__ == '__main__':
+    unittest.TextTestRunner(verbosity=2).run(suite())